@@ -1,11 +1,15 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import json
+import time
 from dotenv import load_dotenv
 import sys
 from pathlib import Path
-from growth.utils.rag import search_mcp
+from growth.utils.rag import search_mcp, search_mcp_batch, stream_search_mcp
 from growth.utils.query_index import create_and_upsert_index
+from growth.utils.singleflight import SingleFlight, search_key
+from config import CORS_ORIGINS, MAX_BATCH_QUERIES, SEARCH_BACKEND, clamp_top_k
 # Add the growth directory to Python path
 current_dir = Path(__file__).parent
 sys.path.append(str(current_dir))
@@ -13,7 +17,10 @@ sys.path.append(str(current_dir / 'growth' / 'utils'))
 
 try:
     # from growth.utils.query_only import search_mcp
-    from growth.utils.upsert_mcp_data import process_csv_to_documents, create_and_populate_index
+    from growth.utils.upsert_mcp_data import update_index
+    from suggest import MAX_SUGGESTIONS, get_suggest_index
+    from response_cache import SEARCH_MAX_AGE, get_response_cache, index_version, render, response_key
+    from metrics import REQUEST_SECONDS, render as render_metrics
 except ImportError as e:
     print(f"Error importing required modules: {e}")
     sys.exit(1)
@@ -25,35 +32,67 @@ app = Flask(__name__)
 # Configure CORS to allow requests from your Next.js frontend
 CORS(app, resources={
     r"/api/*": {
-        "origins": [
-            "http://localhost:3000",
-            "http://127.0.0.1:3000",
-            "https://themcpdirectory.com",
-            "https://www.themcpdirectory.com",
-            "https://theworldofmcp.com",
-            "https://www.theworldofmcp.com",
-        ],
+        "origins": CORS_ORIGINS,
         "methods": ["GET", "POST", "OPTIONS"],
         "allow_headers": ["Content-Type"],
         "supports_credentials": True
     }
 })
 
+# Concurrent identical searches share one retrieval and LLM call
+search_flight = SingleFlight()
+# Finished searches, keyed by normalized query, top_k and index version
+response_cache = get_response_cache()
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # Streamed responses are timed to their first byte
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+    return response
+
 def ensure_index_exists():
-    """Ensure the search index exists and create it if it doesn't"""
+    """Ensure the search index exists and matches the CSV, only re-embedding changed rows"""
+    csv_file = current_dir / 'growth' / 'source' / 'MCP_description.csv'
+    if not csv_file.exists():
+        raise FileNotFoundError(f"CSV file not found at {csv_file}")
+
     index_path = current_dir / 'storage' / 'mcp_index'
-    if not index_path.exists():
-        print("Creating search index...")
-        csv_file = current_dir / 'growth' / 'source' / 'MCP_description.csv'
-        if not csv_file.exists():
-            raise FileNotFoundError(f"CSV file not found at {csv_file}")
-        
-        documents = process_csv_to_documents(str(csv_file))
-        if documents:
-            create_and_populate_index(documents, "mcp_index")
-            print("Search index created successfully!")
-        else:
-            raise Exception("Failed to process documents from CSV")
+    print("Creating search index..." if not index_path.exists() else "Updating search index...")
+    index = update_index(str(csv_file), "mcp_index")
+    if index is None:
+        raise Exception("Failed to process documents from CSV")
+    print("Search index is up to date!")
+
+
+def cached_search(query, top_k):
+    """
+    Run a search through the response cache
+
+    Returns:
+        tuple: (cache entry, True if it was served from the cache)
+    """
+    version = index_version(SEARCH_BACKEND)
+    key = response_key(query, top_k, version)
+    entry = response_cache.get(key, version)
+    if entry is not None:
+        return entry, True
+
+    # Perform the search using the search_mcp function from rag.py
+    results = search_flight.do(
+        search_key(query, top_k),
+        search_mcp, query, top_k=top_k, backend=SEARCH_BACKEND
+    )
+    if 'error' in results:
+        # Failed searches are not cached
+        raise RuntimeError(results['error'])
+    return response_cache.put(key, version, results['results']), False
 
 
 @app.route('/api/search', methods=['POST'])
@@ -61,29 +100,138 @@ def search():
     try:
         data = request.json
         query = data.get('query')
-        top_k = data.get('top_k', 2)
+        top_k = clamp_top_k(data.get('top_k'))
 
         if not query:
             return jsonify({'error': 'Query is required'}), 400
+        if top_k is None:
+            return jsonify({'error': 'top_k must be an integer'}), 400
 
         # Ensure index exists before searching
         # ensure_index_exists()
 
-        # Perform the search using the search_mcp function from rag.py
-        results = search_mcp(query, top_k=top_k)
+        entry, hit = cached_search(query, top_k)
+        body, _ = render(entry, query)
+        return Response(body, mimetype='application/json', headers={'X-Cache': 'HIT' if hit else 'MISS'})
 
-        # Format results for JSON response
-        formatted_results = results['results']
+    except Exception as e:
+        print(f"Search error: {str(e)}")  # Add logging
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+def search_get():
+    """
+    Cacheable variant of the search: GET /api/search?q=...&top_k=...
 
-        return jsonify({
-            'query': query,
-            'results': formatted_results  # Ensure all fields are included
-        })
+    Responses carry an ETag and Cache-Control, so browsers and CDNs can serve
+    repeated searches themselves and revalidate with If-None-Match.
+    """
+    query = request.args.get('q', '')
+    top_k = clamp_top_k(request.args.get('top_k', 2, type=int))
 
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+
+    try:
+        entry, hit = cached_search(query, top_k)
     except Exception as e:
-        print(f"Search error: {str(e)}")  # Add logging
+        print(f"Search error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+    body, etag = render(entry, query)
+    headers = {
+        'Cache-Control': f'public, max-age={SEARCH_MAX_AGE}',
+        'X-Cache': 'HIT' if hit else 'MISS'
+    }
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Search for several queries in one request: {"queries": [...], "top_k": n}
+
+    Queries already in the response cache are answered from it; the rest share
+    one retrieval pass and the same structuring calls (rag.search_mcp_batch).
+    """
+    data = request.json or {}
+    queries = data.get('queries')
+    top_k = clamp_top_k(data.get('top_k'))
+
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query for query in queries):
+        return jsonify({'error': 'queries must be a non-empty list of strings'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}), 400
+    if top_k is None:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+
+    version = index_version(SEARCH_BACKEND)
+    keys = [response_key(query, top_k, version) for query in queries]
+    entries = {key: response_cache.get(key, version) for key in set(keys)}
+    # One query per missing key, so spellings that normalise alike are searched once
+    missing = {key: query for key, query in zip(keys, queries) if entries[key] is None}
+
+    if missing:
+        results = search_mcp_batch(list(missing.values()), top_k=top_k, backend=SEARCH_BACKEND)
+        if 'error' in results:
+            return jsonify({'error': results['error']}), 500
+        for key, result in zip(missing, results['results']):
+            entries[key] = response_cache.put(key, version, result['results'])
+
+    body = '{"results": [' + ", ".join(render(entries[key], query)[0] for key, query in zip(keys, queries)) + ']}'
+    return Response(body, mimetype='application/json', headers={'X-Cache-Hits': str(len(set(keys)) - len(missing))})
+
+@app.route('/api/search/stream', methods=['POST'])
+def search_stream():
+    """
+    Stream search results as NDJSON: the retrieval hits first, then each
+    structured result as soon as it is ready, then a final 'done' event
+    """
+    data = request.json or {}
+    query = data.get('query')
+    top_k = clamp_top_k(data.get('top_k'))
+
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    if top_k is None:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+
+    def generate():
+        for event in stream_search_mcp(query, top_k=top_k, backend=SEARCH_BACKEND):
+            yield json.dumps(event) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+        }
+    )
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """
+    Typeahead completions over server names, tags and keywords; never touches the RAG path
+    """
+    prefix = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 8, type=int), 1), MAX_SUGGESTIONS)
+    return jsonify({
+        'query': prefix,
+        'suggestions': get_suggest_index().suggest(prefix, limit)
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    Stage timers, LLM tokens, cache hit rates and request latencies in Prometheus text format
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/recent-searches', methods=['GET'])
 def get_recent_searches():
     # For now, return an empty list since we haven't set up MongoDB yet
@@ -102,7 +250,7 @@ if __name__ == '__main__':
     try:
         # Ensure index exists on startup
         ensure_index_exists()
-        print("Starting Flask server...")
+        print(f"Starting Flask server with the {SEARCH_BACKEND} search backend...")
         print("CORS configured for http://localhost:3000 and http://127.0.0.1:3000")
         app.run(debug=True, host='0.0.0.0', port=5000)
     except Exception as e:
@@ -0,0 +1,236 @@
+"""
+ASGI variant of the search API in app.py, served by an async worker:
+
+    hypercorn asgi:app --bind 0.0.0.0:5000
+
+Every route awaits retrieval, embedding and LLM calls instead of blocking a
+worker, so one process can hold hundreds of searches in flight. When a client
+disconnects, Quart cancels the request task, which cancels its pending calls.
+"""
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+
+# Add the growth directory to Python path
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+sys.path.append(str(current_dir / 'growth' / 'utils'))
+
+from config import CORS_ORIGINS, MAX_BATCH_QUERIES, SEARCH_BACKEND, clamp_top_k
+from async_rag import asearch_mcp, asearch_mcp_batch, astream_search_mcp, warm_up
+from singleflight import AsyncSingleFlight, search_key
+from suggest import MAX_SUGGESTIONS, get_suggest_index
+from response_cache import SEARCH_MAX_AGE, get_response_cache, index_version, render, response_key
+from metrics import REQUEST_SECONDS, render as render_metrics
+
+app = Quart(__name__)
+app = cors(
+    app,
+    allow_origin=CORS_ORIGINS,
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type"],
+    allow_credentials=True
+)
+
+# Concurrent identical searches share one retrieval and LLM call
+search_flight = AsyncSingleFlight()
+# Finished searches, keyed by normalized query, top_k and index version
+response_cache = get_response_cache()
+
+
+@app.before_serving
+async def load_indexes():
+    # Build or open the indexes before the first request rather than on the event loop during it
+    await warm_up(SEARCH_BACKEND)
+
+
+@app.before_request
+async def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request_time(response):
+    # Streamed responses are timed to their first byte
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+    return response
+
+
+async def run_cache(function, *args):
+    """
+    Call a response cache function, in a worker thread when it queries the SQLite tier
+
+    The in-memory tier is a dict access and runs inline; SQLite reads, commits
+    and the DELETE on a version change would block the event loop.
+    """
+    if response_cache.persistent:
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
+
+
+async def cached_search(query, top_k):
+    """
+    Run a search through the response cache
+
+    Returns:
+        tuple: (cache entry, True if it was served from the cache)
+    """
+    # At most one round of stat calls per INDEX_VERSION_CHECK_SECONDS
+    version = index_version(SEARCH_BACKEND)
+    key = response_key(query, top_k, version)
+    entry = await run_cache(response_cache.get, key, version)
+    if entry is not None:
+        return entry, True
+
+    results = await search_flight.do(
+        search_key(query, top_k),
+        asearch_mcp, query, top_k=top_k, backend=SEARCH_BACKEND
+    )
+    if 'error' in results:
+        # Failed searches are not cached
+        raise RuntimeError(results['error'])
+    return await run_cache(response_cache.put, key, version, results['results']), False
+
+
+@app.route('/api/search', methods=['POST'])
+async def search():
+    data = await request.get_json() or {}
+    query = data.get('query')
+    top_k = clamp_top_k(data.get('top_k'))
+
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    if top_k is None:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+
+    try:
+        entry, hit = await cached_search(query, top_k)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 500
+
+    body, _ = render(entry, query)
+    return Response(body, mimetype='application/json', headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+
+@app.route('/api/search', methods=['GET'])
+async def search_get():
+    # Cacheable variant of the POST route; see app.search_get
+    query = request.args.get('q', '')
+    top_k = clamp_top_k(request.args.get('top_k', 2, type=int))
+
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+
+    try:
+        entry, hit = await cached_search(query, top_k)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 500
+
+    body, etag = render(entry, query)
+    headers = {
+        'Cache-Control': f'public, max-age={SEARCH_MAX_AGE}',
+        'X-Cache': 'HIT' if hit else 'MISS'
+    }
+    if request.if_none_match.contains_weak(etag):
+        response = Response("", status=304, headers=headers)
+    else:
+        response = Response(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/api/search/batch', methods=['POST'])
+async def search_batch():
+    """
+    Search for several queries in one request: {"queries": [...], "top_k": n}
+
+    Queries already in the response cache are answered from it; the rest share
+    one retrieval pass and the same structuring calls (async_rag.asearch_mcp_batch).
+    """
+    data = await request.get_json() or {}
+    queries = data.get('queries')
+    top_k = clamp_top_k(data.get('top_k'))
+
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query for query in queries):
+        return jsonify({'error': 'queries must be a non-empty list of strings'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}), 400
+    if top_k is None:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+
+    version = index_version(SEARCH_BACKEND)
+    keys = [response_key(query, top_k, version) for query in queries]
+    entries = await run_cache(lambda: {key: response_cache.get(key, version) for key in set(keys)})
+    # One query per missing key, so spellings that normalise alike are searched once
+    missing = {key: query for key, query in zip(keys, queries) if entries[key] is None}
+
+    if missing:
+        results = await asearch_mcp_batch(list(missing.values()), top_k=top_k, backend=SEARCH_BACKEND)
+        if 'error' in results:
+            return jsonify({'error': results['error']}), 500
+        entries.update(await run_cache(lambda: {
+            key: response_cache.put(key, version, result['results'])
+            for key, result in zip(missing, results['results'])
+        }))
+
+    body = '{"results": [' + ", ".join(render(entries[key], query)[0] for key, query in zip(keys, queries)) + ']}'
+    return Response(body, mimetype='application/json', headers={'X-Cache-Hits': str(len(set(keys)) - len(missing))})
+
+
+@app.route('/api/search/stream', methods=['POST'])
+async def search_stream():
+    data = await request.get_json() or {}
+    query = data.get('query')
+    top_k = clamp_top_k(data.get('top_k'))
+
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    if top_k is None:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+
+    async def generate():
+        async for event in astream_search_mcp(query, top_k=top_k, backend=SEARCH_BACKEND):
+            yield (json.dumps(event) + "\n").encode("utf-8")
+
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/suggest', methods=['GET'])
+async def suggest():
+    # In-memory prefix lookup; cheap enough to run inline on the event loop
+    prefix = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 8, type=int), 1), MAX_SUGGESTIONS)
+    return jsonify({
+        'query': prefix,
+        'suggestions': get_suggest_index().suggest(prefix, limit)
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+async def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/recent-searches', methods=['GET'])
+async def get_recent_searches():
+    return jsonify([])
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    return jsonify({'status': 'healthy'}), 200
@@ -0,0 +1,42 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Retrieval backend for the search routes: "cloud" (LlamaCloud) or "local" (in-process NumPy index)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "cloud")
+
+# Frontends allowed to call the API, shared by the Flask (app.py) and ASGI (asgi.py) servers
+CORS_ORIGINS = [
+    "http://localhost:3000",
+    "http://127.0.0.1:3000",
+    "https://themcpdirectory.com",
+    "https://www.themcpdirectory.com",
+    "https://theworldofmcp.com",
+    "https://www.theworldofmcp.com",
+]
+
+# Largest number of queries accepted by /api/search/batch
+MAX_BATCH_QUERIES = int(os.getenv("MCP_MAX_BATCH_QUERIES", "100"))
+
+# Largest top_k accepted by the search routes
+MAX_TOP_K = 20
+
+
+def clamp_top_k(value, default=2):
+    """
+    top_k from a request body or query string, clamped to 1..MAX_TOP_K
+
+    Returns:
+        int: The clamped value, or None if it is not an integer
+    """
+    if value is None:
+        value = default
+    if isinstance(value, bool):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return min(max(value, 1), MAX_TOP_K)
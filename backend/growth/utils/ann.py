@@ -0,0 +1,243 @@
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from binary_index import generation_file
+
+# Lists probed per query; more lists means higher recall and slower searches
+ANN_NPROBE = int(os.getenv("MCP_ANN_NPROBE", "8"))
+# Below this many vectors an exact scan is already fast, so no ANN index is built
+ANN_MIN_ROWS = int(os.getenv("MCP_ANN_MIN_ROWS", "20000"))
+ANN_FILE = "ivf.npz"
+
+# Rows scored per matrix product while assigning vectors, to bound temporary memory
+_ASSIGN_CHUNK = 65536
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(embeddings, centroids):
+    """
+    Index of the most similar centroid for every row
+    """
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), _ASSIGN_CHUNK):
+        block = embeddings[start:start + _ASSIGN_CHUNK]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(embeddings, n_lists, n_iter=20, sample_size=None, seed=0):
+    """
+    k-means on the unit sphere (cosine similarity), trained on a sample of rows
+
+    Returns:
+        np.ndarray: float32 centroids of shape (n_lists, dimensions), L2-normalised
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(embeddings), sample_size or n_lists * 256)
+    sample = embeddings[rng.choice(len(embeddings), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            # Reseed empty lists with random sample rows so no centroid is wasted
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index: vectors are clustered around k-means centroids and
+    a query only scores the vectors in its nprobe nearest clusters.
+
+    The index holds centroids and, per list, the row numbers of its members in
+    CSR form (ids[offsets[l]:offsets[l + 1]]). The vectors themselves stay in
+    the caller's matrix, which is passed to search(), so the index adds only a
+    few bytes per row.
+    """
+
+    def __init__(self, centroids, offsets, ids):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, embeddings, n_lists=None, n_iter=20, seed=0):
+        """
+        Cluster L2-normalised embeddings into inverted lists
+
+        Args:
+            embeddings (np.ndarray): float32 matrix with unit-norm rows
+            n_lists (int): Number of clusters (default: about 4 * sqrt(rows))
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        n_lists = n_lists or max(1, int(4 * np.sqrt(len(embeddings))))
+        n_lists = min(n_lists, len(embeddings))
+        centroids = spherical_kmeans(embeddings, n_lists, n_iter=n_iter, seed=seed)
+        assignments = _assign(embeddings, centroids)
+        ids = np.argsort(assignments, kind="stable").astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids, offsets, ids)
+
+    def candidates(self, query_vector, nprobe=ANN_NPROBE):
+        """
+        Row numbers in the nprobe lists whose centroids are closest to the query
+        """
+        nprobe = min(nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query_vector
+        lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self.ids[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+
+    def search(self, embeddings, query_vector, top_k=10, nprobe=ANN_NPROBE):
+        """
+        Approximate top_k rows by dot product
+
+        Returns:
+            tuple: (row numbers, scores), best first
+        """
+        rows = self.candidates(query_vector, nprobe)
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        scores = embeddings[rows] @ query_vector
+        if len(rows) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores)
+        return rows[order], scores[order]
+
+    def save(self, path, generation=None):
+        """
+        Save next to the vectors it indexes, e.g. storage/local_index/ivf.<generation>.npz
+        for one generation of a binary index
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        target = path / generation_file(ANN_FILE, generation)
+        tmp_path = target.with_name(target.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, ids=self.ids)
+        os.replace(tmp_path, target)
+
+    @classmethod
+    def load(cls, path, expected_rows=None, generation=None):
+        """
+        Load the index saved for a generation, returning None if it is missing or
+        indexes a different number of rows
+        """
+        path = Path(path) / generation_file(ANN_FILE, generation)
+        try:
+            arrays = np.load(path)
+        except FileNotFoundError:
+            return None
+        index = cls(arrays['centroids'], arrays['offsets'], arrays['ids'])
+        if expected_rows is not None and len(index) != expected_rows:
+            print(f"Ignoring ANN index at {path}: built for {len(index)} rows, not {expected_rows}")
+            return None
+        return index
+
+
+def exact_search(embeddings, query_vector, top_k=10):
+    """
+    Brute-force top_k rows by dot product, as the recall baseline
+    """
+    scores = embeddings @ query_vector
+    top_k = min(top_k, len(scores))
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    return top[np.argsort(-scores[top])]
+
+
+def recall_report(index, embeddings, queries, top_k=10, nprobe_values=(1, 2, 4, 8, 16, 32)):
+    """
+    Recall@k against exact search and mean latency for several nprobe settings
+
+    Args:
+        index (IVFIndex): The index to evaluate
+        embeddings (np.ndarray): The indexed, L2-normalised vectors
+        queries (np.ndarray): L2-normalised query vectors
+
+    Returns:
+        list: One dict per nprobe with 'nprobe', 'recall', 'mean_ms' and 'exact_mean_ms'
+    """
+    started = time.perf_counter()
+    truth = [set(exact_search(embeddings, query, top_k).tolist()) for query in queries]
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    report = []
+    for nprobe in nprobe_values:
+        if nprobe > index.n_lists:
+            break
+        hits = 0
+        started = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            rows, _ = index.search(embeddings, query, top_k, nprobe)
+            hits += len(expected & set(rows.tolist()))
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        report.append({
+            'nprobe': nprobe,
+            'recall': hits / sum(len(expected) for expected in truth),
+            'mean_ms': round(elapsed_ms, 4),
+            'exact_mean_ms': round(exact_ms, 4),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and evaluate the IVF index of the local engine')
+    parser.add_argument('--build', action='store_true', help='Build the ANN index for the local engine and save it')
+    parser.add_argument('--lists', type=int, help='Number of inverted lists (default: about 4 * sqrt(rows))')
+    parser.add_argument('--synthetic', type=int, help='Evaluate on this many random clustered vectors instead')
+    parser.add_argument('--queries', type=int, default=200, help='Number of evaluation queries')
+    parser.add_argument('--top-k', type=int, default=10, help='k for recall@k')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        # Clustered data is closer to real embeddings than uniform noise
+        dimensions = 256
+        centers = _normalize_rows(rng.standard_normal((max(1, args.synthetic // 100), dimensions)))
+        noise = rng.standard_normal((args.synthetic, dimensions)) * (0.6 / np.sqrt(dimensions))
+        embeddings = _normalize_rows(centers[rng.integers(0, len(centers), args.synthetic)] + noise).astype(np.float32)
+        index = IVFIndex.build(embeddings, args.lists)
+    else:
+        from local_search import get_local_engine
+        engine = get_local_engine()
+        embeddings = engine.embeddings
+        index = engine.ann if (engine.ann is not None and not args.lists) else IVFIndex.build(embeddings, args.lists)
+        if args.build:
+            engine.ann = index
+            engine.save()
+
+    # Held-out style queries: perturbed copies of indexed vectors
+    picks = rng.choice(len(embeddings), min(args.queries, len(embeddings)), replace=False)
+    noise = rng.standard_normal((len(picks), embeddings.shape[1])) * (0.3 / np.sqrt(embeddings.shape[1]))
+    queries = _normalize_rows(embeddings[picks] + noise).astype(np.float32)
+
+    print(f"IVF index: {len(embeddings)} vectors in {index.n_lists} lists")
+    for row in recall_report(index, embeddings, queries, args.top_k):
+        print(f"nprobe={row['nprobe']:<4} recall@{args.top_k}={row['recall']:.3f}  "
+              f"{row['mean_ms']:.3f} ms/query (exact {row['exact_mean_ms']:.3f} ms)")
+
+
+if __name__ == "__main__":
+    main()
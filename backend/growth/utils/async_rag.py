@@ -0,0 +1,342 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+sys.path.append(str(Path(__file__).parent))
+from rag import SEARCH_BACKEND, cache_structured, get_cloud_index, lookup_structured, match_structured
+from catalog import get_catalog
+from local_search import get_local_engine
+from lexical import HYBRID_SEARCH, ahybrid_search, ahybrid_search_batch, get_lexical_index
+from structured_cache import get_structured_cache
+from structuring import (
+    MCPServer, STRUCTURED_RESPONSE_FORMAT, STRUCTURING_SYSTEM_PROMPT, JsonObjectStreamParser,
+    format_results_for_llm, parse_servers
+)
+from metrics import stage
+from model_router import chunk_results, get_model_router, template_servers
+
+load_dotenv()
+
+# Searches allowed to run at once in this process; the rest wait for a slot
+MAX_CONCURRENT_SEARCHES = int(os.getenv("MCP_MAX_CONCURRENT_SEARCHES", "200"))
+# Per-call timeouts in seconds
+RETRIEVAL_TIMEOUT = float(os.getenv("MCP_RETRIEVAL_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("MCP_LLM_TIMEOUT", "30"))
+
+async_client = AsyncOpenAI()
+
+_search_slots = None
+
+
+def _get_search_slots():
+    # Created lazily so the semaphore binds to the server's running event loop
+    global _search_slots
+    if _search_slots is None:
+        _search_slots = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+    return _search_slots
+
+
+async def warm_up(backend: str = None):
+    """
+    Load the local and lexical indexes, the catalog and the structured cache in a
+    worker thread. Call it before serving: on a first request, building the
+    indexes from the CSV would block the event loop and every search in flight.
+    """
+    def load():
+        if (backend or SEARCH_BACKEND) == "local":
+            get_local_engine()
+        if HYBRID_SEARCH:
+            get_lexical_index()
+        get_catalog()
+        get_structured_cache()
+
+    await asyncio.to_thread(load)
+
+
+async def aretrieve_vector(query: str, top_k: int = 5, backend: str = None):
+    """
+    Async variant of rag.retrieve_vector
+
+    Returns:
+        list: List of dicts with 'url', 'text' and 'score'
+    """
+    backend = backend or SEARCH_BACKEND
+    if backend == "local":
+        return await get_local_engine().asearch(query, top_k=top_k)
+    if backend != "cloud":
+        raise ValueError(f"Unknown search backend: {backend}")
+
+    with stage("cloud_retrieve"):
+        nodes = await get_cloud_index().as_retriever().aretrieve(query)
+    final_results = sorted(nodes, key=lambda x: x.score, reverse=True)[:top_k]
+    return [
+        {
+            'url': node.metadata.get('url', 'N/A'),
+            'text': node.text,
+            'score': node.score
+        }
+        for node in final_results
+    ]
+
+
+async def aretrieve(query: str, top_k: int = 5, backend: str = None):
+    """
+    Async variant of rag.retrieve
+
+    Returns:
+        list: List of dicts with 'url', 'text' and 'score'
+    """
+    with stage("retrieve"):
+        if not HYBRID_SEARCH:
+            return await aretrieve_vector(query, top_k, backend)
+        return await ahybrid_search(query, top_k, lambda q, k: aretrieve_vector(q, k, backend))
+
+
+async def aretrieve_vector_batch(queries, top_k: int = 5, backend: str = None):
+    """
+    Async variant of rag.retrieve_vector_batch
+
+    Returns:
+        list: One list of {'url', 'text', 'score'} dicts per query
+    """
+    backend = backend or SEARCH_BACKEND
+    if backend == "local":
+        return await get_local_engine().asearch_batch(queries, top_k=top_k)
+    return await asyncio.gather(*(aretrieve_vector(query, top_k, backend) for query in queries))
+
+
+async def aretrieve_batch(queries, top_k: int = 5, backend: str = None):
+    """
+    Async variant of rag.retrieve_batch
+    """
+    with stage("retrieve_batch"):
+        if not HYBRID_SEARCH:
+            return await aretrieve_vector_batch(queries, top_k, backend)
+        return await ahybrid_search_batch(queries, top_k, lambda qs, k: aretrieve_vector_batch(qs, k, backend))
+
+
+async def aconvert_to_structured_objects(results, route=None):
+    """
+    Async variant of rag.convert_to_structured_objects
+    """
+    router = get_model_router()
+    route = route or router.route_results(results)
+    if route.model is None:
+        print(f"Structuring {len(results)} results from templates: {route.reason}")
+        return template_servers(results)
+
+    with router.track(route.model) as call:
+        response = await async_client.chat.completions.create(
+            model=route.model,
+            messages=[
+                {"role": "system", "content": STRUCTURING_SYSTEM_PROMPT},
+                {"role": "user", "content": format_results_for_llm(results)}
+            ],
+            response_format=STRUCTURED_RESPONSE_FORMAT,
+            max_tokens=route.max_tokens,
+            temperature=0.1
+        )
+        if response.usage:
+            call['prompt_tokens'] = response.usage.prompt_tokens
+            call['output_tokens'] = response.usage.completion_tokens
+    return parse_servers(response.choices[0].message.content)
+
+
+async def astructure_by_url(raw_results):
+    """
+    Async variant of rag.structure_by_url; only unseen servers reach the LLM, in concurrent chunks
+    """
+    with stage("structure"):
+        return await _astructure_by_url(raw_results)
+
+
+async def _astructure_chunk(chunk):
+    route = get_model_router().route_results(chunk)
+    if route.model is None:
+        print(f"Structuring {len(chunk)} results from templates: {route.reason}")
+        return {result['url']: server for result, server in zip(chunk, template_servers(chunk))}, False
+    structured = await asyncio.wait_for(aconvert_to_structured_objects(chunk, route), LLM_TIMEOUT)
+    return match_structured(chunk, structured), True
+
+
+async def _astructure_by_url(raw_results):
+    found, misses = await asyncio.to_thread(lookup_structured, raw_results)
+
+    if misses:
+        outcomes = await asyncio.gather(*(_astructure_chunk(chunk) for chunk in chunk_results(misses)))
+        found.update(cache_structured(misses, outcomes))
+        if any(from_llm for _, from_llm in outcomes):
+            await asyncio.to_thread(get_structured_cache().save)
+
+    return found
+
+
+async def astructure_with_cache(raw_results):
+    """
+    Async variant of rag.structure_with_cache; only unseen servers reach the LLM
+    """
+    found = await astructure_by_url(raw_results)
+    return [found[result['url']] for result in raw_results if result['url'] in found]
+
+
+async def asearch_mcp(query: str, top_k: int = 5, backend: str = None):
+    """
+    Async variant of rag.search_mcp with bounded concurrency and per-call timeouts.
+
+    Cancelling the calling task (e.g. when the client disconnects) cancels the
+    in-flight retrieval or LLM call.
+
+    Returns:
+        dict: Dictionary containing the query and structured results
+    """
+    async with _get_search_slots():
+        try:
+            raw_results = await asyncio.wait_for(aretrieve(query, top_k=top_k, backend=backend), RETRIEVAL_TIMEOUT)
+            structured_results = await astructure_with_cache(raw_results)
+            return {
+                'query': query,
+                'results': [result.model_dump() for result in structured_results]
+            }
+        except asyncio.TimeoutError:
+            print(f"Search timed out for query: {query}")
+            return {'query': query, 'results': [], 'error': 'Search timed out'}
+        except Exception as e:
+            print(f"Error during search: {e}")
+            return {'query': query, 'results': [], 'error': str(e)}
+
+
+async def asearch_mcp_batch(queries, top_k: int = 5, backend: str = None):
+    """
+    Async variant of rag.search_mcp_batch. The whole batch holds one search slot.
+
+    Returns:
+        dict: Dictionary with 'results', one {'query', 'results'} dict per query in input order
+    """
+    async with _get_search_slots():
+        try:
+            distinct = list(dict.fromkeys(queries))
+            retrieved = await asyncio.wait_for(aretrieve_batch(distinct, top_k=top_k, backend=backend), RETRIEVAL_TIMEOUT)
+            raw_by_query = dict(zip(distinct, retrieved))
+            structured = await astructure_by_url([result for raw in retrieved for result in raw])
+            return {
+                'results': [
+                    {
+                        'query': query,
+                        'results': [
+                            structured[result['url']].model_dump()
+                            for result in raw_by_query[query] if result['url'] in structured
+                        ]
+                    }
+                    for query in queries
+                ]
+            }
+        except asyncio.TimeoutError:
+            print(f"Batch search of {len(queries)} queries timed out")
+            return {'results': [{'query': query, 'results': []} for query in queries], 'error': 'Search timed out'}
+        except Exception as e:
+            print(f"Error during batch search: {e}")
+            return {'results': [{'query': query, 'results': []} for query in queries], 'error': str(e)}
+
+
+async def astream_structured_objects(results, route=None):
+    """
+    Async variant of rag.stream_structured_objects
+
+    Yields:
+        tuple: (raw result the object belongs to, MCPServer)
+    """
+    router = get_model_router()
+    route = route or router.route_results(results)
+    if route.model is None:
+        for result, server in zip(results, template_servers(results)):
+            yield result, server
+        return
+
+    with router.track(route.model):
+        async for pair in _astream_structured(results, route):
+            yield pair
+
+
+async def _astream_structured(results, route):
+    stream = await async_client.chat.completions.create(
+        model=route.model,
+        messages=[
+            {"role": "system", "content": STRUCTURING_SYSTEM_PROMPT},
+            {"role": "user", "content": format_results_for_llm(results)}
+        ],
+        response_format=STRUCTURED_RESPONSE_FORMAT,
+        max_tokens=route.max_tokens,
+        temperature=0.1,
+        stream=True,
+        timeout=LLM_TIMEOUT  # Applies per read, so a stalled stream fails instead of hanging
+    )
+
+    parser = JsonObjectStreamParser()
+    by_url = {result['url']: result for result in results}
+    position = 0
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        for obj in parser.feed(chunk.choices[0].delta.content or ""):
+            source = by_url.get(obj.get('url'))
+            if source is None and position < len(results):
+                source = results[position]
+            position += 1
+            try:
+                server = MCPServer(**obj)
+            except Exception as e:
+                print(f"Error converting streamed object: {e}")
+                continue
+            yield source, server
+
+
+async def astream_search_mcp(query: str, top_k: int = 5, backend: str = None):
+    """
+    Async variant of rag.stream_search_mcp, yielding the same events
+    """
+    async with _get_search_slots():
+        try:
+            raw_results = await asyncio.wait_for(aretrieve(query, top_k=top_k, backend=backend), RETRIEVAL_TIMEOUT)
+            ranks = {}
+            for rank, result in enumerate(raw_results):
+                ranks.setdefault(result['url'], rank)
+
+            yield {
+                'event': 'hits',
+                'query': query,
+                'hits': [{'url': result['url'], 'score': result.get('score')} for result in raw_results]
+            }
+
+            found, misses = await asyncio.to_thread(lookup_structured, raw_results)
+            for url, server in found.items():
+                yield {'event': 'result', 'rank': ranks[url], 'result': server.model_dump()}
+
+            sent = len(found)
+            route = get_model_router().route_results(misses) if misses else None
+            if misses and route.model is None:
+                print(f"Structuring {len(misses)} streamed results from templates: {route.reason}")
+                for miss, server in zip(misses, template_servers(misses)):
+                    yield {'event': 'result', 'rank': ranks[miss['url']], 'result': server.model_dump()}
+                    sent += 1
+            elif misses:
+                cache = get_structured_cache()
+                async for source, server in astream_structured_objects(misses, route):
+                    if source is not None:
+                        cache.put(source['url'], source['text'], server.model_dump())
+                    url = source['url'] if source is not None else server.url
+                    yield {'event': 'result', 'rank': ranks.get(url, sent), 'result': server.model_dump()}
+                    sent += 1
+                await asyncio.to_thread(cache.save)
+
+            yield {'event': 'done', 'count': sent}
+
+        except asyncio.TimeoutError:
+            print(f"Streaming search timed out for query: {query}")
+            yield {'event': 'error', 'error': 'Search timed out'}
+        except Exception as e:
+            print(f"Error during streaming search: {e}")
+            yield {'event': 'error', 'error': str(e)}
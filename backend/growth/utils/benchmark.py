@@ -0,0 +1,436 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+DEFAULT_CSV_PATH = Path(__file__).parent.parent / 'source' / 'MCP_description.csv'
+DEFAULT_QUERIES_PATH = Path(__file__).parent.parent / 'source' / 'benchmark_queries.json'
+
+PERCENTILES = (50, 95, 99)
+# Latency changes smaller than this are timer and scheduler noise, never a regression;
+# throughput is held to the same floor through the time per search
+MIN_LATENCY_DELTA_MS = 1.0
+_BLOCK_RE = re.compile(r"(?m)^URL: ")
+
+
+def load_queries(path=DEFAULT_QUERIES_PATH):
+    """
+    Read the labelled query set
+
+    Returns:
+        list: List of dicts with 'query' and 'relevant' (the URLs a good search returns)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def summarize_latencies(seconds):
+    """
+    p50/p95/p99, mean and max of a list of durations, in milliseconds
+    """
+    if not seconds:
+        return {'count': 0}
+    values = np.asarray(seconds) * 1000
+    summary = {'count': len(values)}
+    for percentile in PERCENTILES:
+        summary[f'p{percentile}_ms'] = round(float(np.percentile(values, percentile)), 3)
+    summary['mean_ms'] = round(float(values.mean()), 3)
+    summary['max_ms'] = round(float(values.max()), 3)
+    return summary
+
+
+class StubLLMClient:
+    """
+    Stands in for the OpenAI client: structuring calls get the StubStructuringClient
+    records for the prompt's URL/Description blocks, summaries get one line per URL.
+    Every call sleeps latency_ms, so routing and concurrency behave as with a real model.
+    """
+
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @staticmethod
+    def _rows(content):
+        rows = []
+        for block in _BLOCK_RE.split(content)[1:]:
+            url, _, rest = block.partition("\n")
+            rows.append({'url': url.strip(), 'text': rest.removeprefix("Description: ").strip()})
+        return rows
+
+    def create(self, model, messages, response_format=None, **kwargs):
+        from catalog import StubStructuringClient
+        from ingest import estimate_tokens
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        prompt = "\n".join(message['content'] for message in messages)
+        rows = self._rows(messages[-1]['content'])
+        if response_format is not None:
+            content = json.dumps({'servers': StubStructuringClient().structure(rows)})
+        else:
+            content = "\n".join(f"- **{row['url']}**: {row['text'][:200]}" for row in rows)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(content)),
+        )
+
+
+class StageRecorder:
+    """
+    Keeps every per-stage duration the pipeline reports to metrics.STAGE_SECONDS,
+    so percentiles can be computed instead of reading histogram buckets
+    """
+
+    def __init__(self, histogram):
+        self.samples = {}
+        self._histogram = histogram
+        self._observe = histogram.observe
+        histogram.observe = self.observe
+
+    def observe(self, value, **labels):
+        self.samples.setdefault(labels.get('stage', ''), []).append(value)
+        self._observe(value, **labels)
+
+    def reset(self):
+        self.samples = {}
+
+    def summary(self):
+        return {name: summarize_latencies(values) for name, values in sorted(self.samples.items())}
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def relevance(retrieve, labelled, ks):
+    """
+    recall@k for each k and MRR of the retrieved URLs against the labels
+
+    recall@k is the share of a query's relevant URLs found in its first k
+    distinct URLs; MRR uses the rank of the first relevant URL within max(ks).
+
+    Returns:
+        dict: Averages under 'recall@k' and 'mrr', plus one entry per query under 'queries'
+    """
+    depth = max(ks)
+    per_query = []
+    for item in labelled:
+        urls = list(dict.fromkeys(result['url'] for result in retrieve(item['query'], depth)))
+        relevant = set(item['relevant'])
+        rank = next((position + 1 for position, url in enumerate(urls) if url in relevant), None)
+        entry = {
+            'query': item['query'],
+            'first_relevant_rank': rank,
+            'reciprocal_rank': 1.0 / rank if rank else 0.0,
+        }
+        for k in ks:
+            entry[f'recall@{k}'] = len(relevant.intersection(urls[:k])) / len(relevant)
+        entry['missed'] = [url for url in item['relevant'] if url not in urls]
+        per_query.append(entry)
+
+    report = {
+        f'recall@{k}': round(float(np.mean([entry[f'recall@{k}'] for entry in per_query])), 4)
+        for k in ks
+    }
+    report['mrr'] = round(float(np.mean([entry['reciprocal_rank'] for entry in per_query])), 4)
+    report['queries'] = per_query
+    return report
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _isolate_storage(storage, embedder):
+    # Must run before rag and the index modules are imported, since they read these at import time
+    os.environ["SEARCH_BACKEND"] = "local"
+    os.environ["MCP_EMBEDDER"] = embedder
+    os.environ["MCP_LOCAL_INDEX_PATH"] = os.path.join(storage, "local_index")
+    os.environ["MCP_LEXICAL_INDEX_PATH"] = os.path.join(storage, "lexical_index")
+    os.environ["MCP_STRUCTURED_CACHE_PATH"] = os.path.join(storage, "structured_cache.json")
+    # No prebuilt catalog, so cold searches go through the (stubbed) LLM
+    os.environ["MCP_CATALOG_PATH"] = os.path.join(storage, "mcp_catalog.json")
+    os.environ.pop("MCP_EMBEDDING_CACHE_DB", None)
+    os.environ.pop("MCP_RESPONSE_CACHE_DB", None)
+    # The OpenAI client is created when rag is imported, even though the stub replaces it
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+
+def run_benchmark(queries_path=DEFAULT_QUERIES_PATH, csv_file=DEFAULT_CSV_PATH, top_k=5, ks=(1, 5, 10),
+                  repeat=5, concurrency=8, llm_latency_ms=0, embedder="hashing", storage=None, verbose=False,
+                  throughput_runs=3):
+    """
+    Run the offline benchmark against a fresh local index built from csv_file
+
+    Args:
+        queries_path (str): Labelled query set (see load_queries)
+        csv_file (str): MCP CSV the indexes are built from
+        top_k (int): Results per search in the latency and throughput passes
+        ks (tuple): Cut-offs for recall@k
+        repeat (int): Warm passes over the query set
+        concurrency (int): Worker threads for the throughput pass
+        llm_latency_ms (int): Simulated latency of each stub LLM call
+        embedder (str): 'hashing' (deterministic, default) or 'openai'
+        storage (str): Directory for the indexes and caches (default: a new temporary directory)
+        verbose (bool): Keep the pipeline's own prints
+        throughput_runs (int): Throughput passes, of which the fastest is reported
+
+    Returns:
+        dict: The report, ready to be written as JSON
+    """
+    storage = storage or tempfile.mkdtemp(prefix="mcp-benchmark-")
+    _isolate_storage(storage, embedder)
+
+    import metrics
+    import rag
+    from lexical import HYBRID_SEARCH, get_lexical_index
+    from local_search import get_local_engine
+
+    labelled = load_queries(queries_path)
+    queries = [item['query'] for item in labelled]
+    rag.client = StubLLMClient(llm_latency_ms)
+    recorder = StageRecorder(metrics.STAGE_SECONDS)
+
+    def search(query):
+        response = rag.search_mcp(query, top_k=top_k)
+        if 'error' in response:
+            raise RuntimeError(f"Search for {query!r} failed: {response['error']}")
+        return response
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'config': {
+                'queries': len(queries),
+                'csv': str(csv_file),
+                'top_k': top_k,
+                'ks': list(ks),
+                'repeat': repeat,
+                'concurrency': concurrency,
+                'throughput_runs': throughput_runs,
+                'llm_latency_ms': llm_latency_ms,
+                'embedder': embedder,
+                'hybrid_search': HYBRID_SEARCH,
+                'vector_storage': os.getenv("MCP_VECTOR_STORAGE", "float"),
+            },
+        },
+    }
+
+    with open(os.devnull, 'w') as devnull, (nullcontext() if verbose else redirect_stdout(devnull)):
+        build_seconds, engine = _timed(get_local_engine, os.environ["MCP_LOCAL_INDEX_PATH"], csv_file)
+        lexical_seconds, _ = _timed(get_lexical_index, os.environ["MCP_LEXICAL_INDEX_PATH"], csv_file)
+
+        # Cold: empty embedding and structured caches, so every query embeds and structures
+        recorder.reset()
+        cold = [_timed(search, query)[0] for query in queries]
+        cold_stages = recorder.summary()
+
+        recorder.reset()
+        warm = [_timed(search, query)[0] for _ in range(repeat) for query in queries]
+        warm_stages = recorder.summary()
+
+        # Best of several runs, so one slow scheduling slice does not read as a regression
+        workload = queries * repeat
+        elapsed = batch_seconds = None
+        for _ in range(max(1, throughput_runs)):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                run = [seconds for seconds, _ in executor.map(lambda query: _timed(search, query), workload)]
+            seconds = time.perf_counter() - started
+            if elapsed is None or seconds < elapsed:
+                elapsed, loaded = seconds, run
+            seconds, _ = _timed(rag.search_mcp_batch, queries, top_k)
+            batch_seconds = seconds if batch_seconds is None else min(batch_seconds, seconds)
+
+        quality = relevance(rag.retrieve, labelled, ks)
+
+    report['setup'] = {
+        'index_build_seconds': round(build_seconds, 3),
+        'lexical_build_seconds': round(lexical_seconds, 3),
+        'chunks': len(engine.records),
+    }
+    report['latency'] = {
+        'cold': {'end_to_end': summarize_latencies(cold), 'stages': cold_stages},
+        'warm': {'end_to_end': summarize_latencies(warm), 'stages': warm_stages},
+    }
+    report['throughput'] = {
+        'concurrency': concurrency,
+        'searches': len(workload),
+        'seconds': round(elapsed, 3),
+        'qps': round(len(workload) / elapsed, 2),
+        'latency': summarize_latencies(loaded),
+        'batch_seconds': round(batch_seconds, 4),
+        'batch_qps': round(len(queries) / batch_seconds, 2),
+    }
+    report['memory'] = {
+        'peak_rss_mb': _peak_rss_mb(),
+        'embeddings_mb': round(engine.embeddings.nbytes / (1024 * 1024), 2),
+    }
+    report['llm_calls'] = {dict(labels).get('model'): value for _, labels, value in metrics.LLM_CALLS.samples()}
+    report['cache'] = {
+        f"{dict(labels)['cache']}_{dict(labels)['result']}": value
+        for _, labels, value in metrics.CACHE_REQUESTS.samples()
+    }
+    report['relevance'] = quality
+    return report
+
+
+# (path in the report, True if higher is better)
+COMPARED_METRICS = [
+    (('latency', 'cold', 'end_to_end', 'p50_ms'), False),
+    (('latency', 'warm', 'end_to_end', 'p50_ms'), False),
+    (('latency', 'warm', 'end_to_end', 'p95_ms'), False),
+    (('latency', 'warm', 'end_to_end', 'p99_ms'), False),
+    (('throughput', 'qps'), True),
+    (('throughput', 'batch_qps'), True),
+    (('memory', 'peak_rss_mb'), False),
+]
+
+
+def _lookup(report, path):
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+
+def compare_reports(baseline, current, max_regression=0.2, max_quality_drop=0.0):
+    """
+    Print how current differs from baseline and list the regressions
+
+    Latency, throughput and memory regress when they are more than max_regression
+    (a fraction) worse than the baseline; latencies must also grow by at least
+    MIN_LATENCY_DELTA_MS, and throughputs must add at least that much time per
+    search. recall@k and MRR regress when they drop by more than
+    max_quality_drop (absolute).
+
+    Returns:
+        list: Descriptions of the regressions, empty if there are none
+    """
+    compared = list(COMPARED_METRICS)
+    compared += [(('relevance', key), True) for key in current.get('relevance', {})
+                 if key == 'mrr' or key.startswith('recall@')]
+
+    print(f"Baseline {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}) -> "
+          f"current {current['meta'].get('commit')} ({current['meta'].get('timestamp')})")
+    for key, value in current['meta'].get('config', {}).items():
+        if key != 'csv' and baseline['meta'].get('config', {}).get(key) != value:
+            print(f"  Warning: {key} differs ({baseline['meta'].get('config', {}).get(key)} -> {value})")
+    regressions = []
+    for path, higher_is_better in compared:
+        name = ".".join(path)
+        old, new = _lookup(baseline, path), _lookup(current, path)
+        if old is None or new is None:
+            print(f"  {name:<40} missing in one report")
+            continue
+        change = (new - old) / old if old else 0.0
+        print(f"  {name:<40} {old:>12} {new:>12} {change:>+8.1%}")
+        if path[0] == 'relevance':
+            regressed = old - new > max_quality_drop
+        else:
+            worse = -change if higher_is_better else change
+            regressed = worse > max_regression
+            if path[0] == 'latency':
+                regressed = regressed and new - old >= MIN_LATENCY_DELTA_MS
+            elif path[0] == 'throughput':
+                regressed = regressed and bool(new) and 1000 / new - 1000 / old >= MIN_LATENCY_DELTA_MS
+        if regressed:
+            regressions.append(f"{name}: {old} -> {new}")
+
+    for entry in current.get('relevance', {}).get('queries', []):
+        previous = next((item for item in baseline.get('relevance', {}).get('queries', [])
+                         if item['query'] == entry['query']), None)
+        if previous and entry['reciprocal_rank'] < previous['reciprocal_rank']:
+            print(f"  Worse ranking for {entry['query']!r}: first relevant at "
+                  f"{previous['first_relevant_rank']} -> {entry['first_relevant_rank']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline latency, throughput, memory and relevance benchmark of the search pipeline')
+    parser.add_argument('--queries', default=str(DEFAULT_QUERIES_PATH), help='Labelled query set (JSON list of {"query", "relevant"})')
+    parser.add_argument('--csv', default=str(DEFAULT_CSV_PATH), help='MCP CSV to build the indexes from')
+    parser.add_argument('--top-k', type=int, default=5, help='Results per search in the latency passes')
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 5, 10], help='Cut-offs for recall@k')
+    parser.add_argument('--repeat', type=int, default=5, help='Warm passes over the query set')
+    parser.add_argument('--concurrency', type=int, default=8, help='Worker threads for the throughput pass')
+    parser.add_argument('--throughput-runs', type=int, default=3,
+                        help='Throughput passes, of which the fastest is reported')
+    parser.add_argument('--llm-latency-ms', type=int, default=0, help='Simulated latency of each stub LLM call')
+    parser.add_argument('--embedder', choices=['hashing', 'openai'], default='hashing',
+                        help='Query and index embedder (hashing is deterministic and offline)')
+    parser.add_argument('--storage', help='Directory for the indexes and caches (default: a temporary directory)')
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--compare', help='Baseline JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed fractional slowdown of latency, throughput and memory')
+    parser.add_argument('--max-quality-drop', type=float, default=0.0, help='Allowed absolute drop of recall@k and MRR')
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.queries, args.csv, args.top_k, tuple(args.k), args.repeat, args.concurrency,
+        args.llm_latency_ms, args.embedder, args.storage, args.verbose, args.throughput_runs
+    )
+
+    warm = report['latency']['warm']['end_to_end']
+    print(f"{report['meta']['config']['queries']} queries over {report['setup']['chunks']} chunks")
+    print(f"Cold p50 {report['latency']['cold']['end_to_end']['p50_ms']} ms, "
+          f"warm p50/p95/p99 {warm['p50_ms']}/{warm['p95_ms']}/{warm['p99_ms']} ms")
+    print(f"Throughput {report['throughput']['qps']} searches/s at concurrency {args.concurrency}, "
+          f"batch {report['throughput']['batch_qps']} queries/s")
+    print(f"Peak RSS {report['memory']['peak_rss_mb']} MB, embeddings {report['memory']['embeddings_mb']} MB")
+    print("Relevance: " + ", ".join(
+        f"{key} {value}" for key, value in report['relevance'].items() if key != 'queries'
+    ))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.max_regression, args.max_quality_drop)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
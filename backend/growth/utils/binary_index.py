@@ -0,0 +1,156 @@
+import json
+import os
+import re
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+# Version 2 names the data files after a generation id stored in the header
+BINARY_FORMAT_VERSION = 2
+HEADER_FILE = "header.json"
+# Any file named <stem>.<generation>.<extension>: the data files and their sidecars
+_GENERATION_FILE_RE = re.compile(r"^[^.]+\.([0-9a-f]{12})\.[^.]+$")
+
+
+class PackedRecords:
+    """
+    Read-only sequence of JSON records packed back to back in one file.
+
+    Record i is the UTF-8 JSON in blob[offsets[i]:offsets[i + 1]]. Both the
+    blob and the offsets are memory maps, so opening is O(1) whatever the
+    corpus size and a record is only decoded when it is accessed.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return json.loads(bytes(self.blob[start:end]))
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+
+def new_generation():
+    """
+    A fresh generation id for save_binary_index and the files saved alongside it
+    """
+    return uuid.uuid4().hex[:12]
+
+
+def generation_file(name, generation):
+    """
+    Name of a sidecar file (e.g. "ivf.npz") for one generation of the index;
+    without a generation the name is returned unchanged
+    """
+    if generation is None:
+        return name
+    stem, _, extension = name.rpartition(".")
+    return f"{stem}.{generation}.{extension}"
+
+
+def _data_files(generation):
+    # (embeddings, offsets, records) file names of one generation
+    return f"embeddings.{generation}.npy", f"offsets.{generation}.npy", f"records.{generation}.bin"
+
+
+def save_binary_index(path, embeddings, records, generation=None, **header):
+    """
+    Write embeddings and records in the memory-mappable format
+
+    Each save writes a new generation of data files and then publishes it by
+    atomically replacing header.json, which names the generation. A reader
+    therefore sees either the old files or the new ones, never a mix, and
+    the old generation is deleted once the new header is in place, together
+    with the sidecar files (see generation_file) of every other generation.
+    Sidecars of the new generation must be written before this is called.
+
+    Args:
+        path (str): Output directory
+        embeddings (np.ndarray): Matrix with one row per record, stored as float32
+        records (iterable): JSON-serialisable records (dicts), in row order
+        generation (str): Generation id from new_generation (default: a new one)
+        **header: Extra header fields (e.g. the embedder name)
+
+    Returns:
+        str: The generation that was published
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    generation = generation or new_generation()
+    embeddings_file, offsets_file, records_file = _data_files(generation)
+
+    offsets = [0]
+    with open(path / records_file, 'wb') as f:
+        for record in records:
+            data = json.dumps(record, separators=(",", ":")).encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    if len(offsets) - 1 != len(embeddings):
+        (path / records_file).unlink()
+        raise ValueError(f"{len(offsets) - 1} records for {len(embeddings)} embeddings")
+
+    np.save(path / embeddings_file, embeddings)
+    np.save(path / offsets_file, np.asarray(offsets, dtype=np.int64))
+    with open(path / (HEADER_FILE + ".tmp"), 'w', encoding='utf-8') as f:
+        json.dump({
+            'format_version': BINARY_FORMAT_VERSION,
+            'generation': generation,
+            'rows': len(embeddings),
+            'dimensions': int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+            'dtype': 'float32',
+            **header,
+        }, f)
+    os.replace(path / (HEADER_FILE + ".tmp"), path / HEADER_FILE)
+
+    # Readers that already mapped the old files keep them until they close them
+    for stale in path.iterdir():
+        match = _GENERATION_FILE_RE.match(stale.name)
+        if match and match.group(1) != generation:
+            stale.unlink(missing_ok=True)
+    return generation
+
+
+def load_binary_index(path, attempts=3):
+    """
+    Open a binary index without reading it: every array is a read-only memory map
+
+    Returns:
+        tuple: (embeddings, PackedRecords, header), or None if there is no valid index at path
+    """
+    path = Path(path)
+    for attempt in range(attempts):
+        if not (path / HEADER_FILE).exists():
+            return None
+        with open(path / HEADER_FILE, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get('format_version') != BINARY_FORMAT_VERSION:
+            print(f"Ignoring binary index at {path}: format version {header.get('format_version')}")
+            return None
+
+        embeddings_file, offsets_file, records_file = _data_files(header['generation'])
+        try:
+            embeddings = np.load(path / embeddings_file, mmap_mode='r')
+            offsets = np.load(path / offsets_file, mmap_mode='r')
+            blob = b"" if offsets[-1] == 0 else np.memmap(path / records_file, dtype=np.uint8, mode='r')
+        except FileNotFoundError:
+            # A save published a new generation and removed this one after the header was read
+            continue
+        if len(embeddings) != header['rows'] or len(offsets) != header['rows'] + 1:
+            print(f"Ignoring binary index at {path}: row counts do not match the header")
+            return None
+        return embeddings, PackedRecords(blob, offsets), header
+    print(f"Ignoring binary index at {path}: it kept changing while being opened")
+    return None
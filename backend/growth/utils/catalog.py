@@ -0,0 +1,257 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from structuring import (
+    MCPServer, STRUCTURED_RESPONSE_FORMAT, STRUCTURING_SYSTEM_PROMPT, format_results_for_llm, structuring_max_tokens,
+    template_record
+)
+
+# Bump when the record layout changes so stale catalogs are rebuilt rather than read
+CATALOG_SCHEMA_VERSION = 1
+CATALOG_PATH = os.getenv("MCP_CATALOG_PATH", "./storage/mcp_catalog.json")
+
+
+def content_hash(text):
+    """
+    Hash a CSV description so unchanged rows can be reused between builds
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+def iter_csv_rows(csv_file):
+    """
+    Lazily yield the URL/Description rows of the MCP CSV, skipping empty descriptions
+
+    Yields:
+        dict: Row with 'url' and 'text'
+    """
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            url = (row.get('URL') or '').strip()
+            text = (row.get('Description') or '').strip()
+            if url and text:
+                yield {'url': url, 'text': text}
+
+
+def load_csv_rows(csv_file):
+    """
+    Read the URL/Description rows of the MCP CSV, skipping empty descriptions
+
+    Returns:
+        list: List of dicts with 'url' and 'text'
+    """
+    return list(iter_csv_rows(csv_file))
+
+
+class OpenAIStructuringClient:
+    """
+    Structures a batch of CSV rows with a chat completion.
+
+    Any object with a `structure(rows) -> list[dict]` method can be passed to
+    build_catalog instead, e.g. StubStructuringClient for offline builds.
+    """
+
+    def __init__(self, model="gpt-4o", client=None):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI()
+        self.model = model
+        self.client = client
+
+    def structure(self, rows):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": STRUCTURING_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": format_results_for_llm(rows)
+                }
+            ],
+            response_format=STRUCTURED_RESPONSE_FORMAT,
+            max_tokens=structuring_max_tokens(len(rows)),
+            temperature=0.1
+        )
+        content = response.choices[0].message.content or "{}"
+        return json.loads(content).get("servers", [])
+
+
+class StubStructuringClient:
+    """
+    Deterministic structuring client that copies fields out of the description.
+    Used for tests and offline builds where no LLM is available.
+    """
+
+    model = "stub"
+
+    def structure(self, rows):
+        return [template_record(row['url'], row['text']) for row in rows]
+
+
+def _structure_batch(client, batch):
+    """
+    Run one batch through the client and validate each record against MCPServer
+    """
+    records = client.structure(batch)
+    by_url = {str(record.get('url', '')).strip(): record for record in records}
+
+    servers = {}
+    for position, row in enumerate(batch):
+        record = by_url.get(row['url'])
+        if record is None and len(records) == len(batch):
+            record = records[position]
+        if record is None:
+            print(f"No structured record returned for {row['url']}")
+            continue
+        try:
+            server = MCPServer(**{**record, 'url': row['url']})
+        except Exception as e:
+            print(f"Invalid structured record for {row['url']}: {e}")
+            continue
+        servers[row['url']] = {**server.model_dump(), 'content_hash': content_hash(row['text'])}
+    return servers
+
+
+def build_catalog(csv_file, output_path=CATALOG_PATH, client=None, batch_size=10, max_workers=4, reuse_existing=True):
+    """
+    Build the on-disk catalog of structured MCPServer records from the CSV
+
+    Args:
+        csv_file (str): Path to MCP_description.csv
+        output_path (str): Where to write the catalog JSON
+        client: Structuring client with a `structure(rows)` method (default: OpenAI)
+        batch_size (int): Rows per LLM call
+        max_workers (int): Number of LLM calls in flight at once
+        reuse_existing (bool): Keep records whose description has not changed
+
+    Returns:
+        dict: The catalog that was written
+    """
+    client = client or OpenAIStructuringClient()
+    rows = load_csv_rows(csv_file)
+
+    previous = read_catalog_file(output_path) if reuse_existing else None
+    previous_servers = previous.get('servers', {}) if previous else {}
+
+    servers = {}
+    pending = []
+    for row in rows:
+        record = previous_servers.get(row['url'])
+        if record and record.get('content_hash') == content_hash(row['text']):
+            servers[row['url']] = record
+        else:
+            pending.append(row)
+
+    print(f"Catalog build: {len(servers)} rows reused, {len(pending)} rows to structure")
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_structure_batch, client, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                servers.update(future.result())
+            except Exception as e:
+                print(f"Error structuring batch starting at {futures[future][0]['url']}: {e}")
+
+    catalog = {
+        'schema_version': CATALOG_SCHEMA_VERSION,
+        'revision': (previous.get('revision', 0) + 1) if previous else 1,
+        'built_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'source': str(csv_file),
+        'source_hash': content_hash("".join(row['url'] + row['text'] for row in rows)),
+        'model': getattr(client, 'model', type(client).__name__),
+        'servers': servers,
+    }
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, indent=2)
+    os.replace(tmp_path, output_path)
+
+    print(f"Catalog revision {catalog['revision']} with {len(servers)} servers saved to {output_path}")
+    return catalog
+
+
+def read_catalog_file(path):
+    """
+    Read a catalog file, returning None if it is missing, unreadable or outdated
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read catalog at {path}: {e}")
+        return None
+    if catalog.get('schema_version') != CATALOG_SCHEMA_VERSION:
+        print(f"Ignoring catalog at {path}: schema version {catalog.get('schema_version')} != {CATALOG_SCHEMA_VERSION}")
+        return None
+    return catalog
+
+
+class StructuredCatalog:
+    """
+    Read-only view of the catalog file, reloaded when the file changes on disk
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = Path(path)
+        self.revision = None
+        self._servers = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            catalog = read_catalog_file(self.path) if mtime is not None else None
+            self._servers = catalog.get('servers', {}) if catalog else {}
+            self.revision = catalog.get('revision') if catalog else None
+            self._mtime = mtime
+
+    def get(self, url):
+        """
+        Return the structured record for a server URL, or None if not in the catalog
+        """
+        self._refresh()
+        record = self._servers.get((url or '').strip())
+        if record is None:
+            return None
+        return {field: record[field] for field in MCPServer.model_fields}
+
+    def __len__(self):
+        self._refresh()
+        return len(self._servers)
+
+
+_default_catalog = None
+
+
+def get_catalog():
+    """
+    Return the process-wide catalog reader
+    """
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = StructuredCatalog()
+    return _default_catalog
@@ -0,0 +1,107 @@
+import re
+
+from tokenizer import TOKENIZER_AVAILABLE, estimate_tokens, token_windows
+
+# text-embedding-3-small accepts 8191 tokens, but short windows match queries better
+DEFAULT_CHUNK_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 32
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def split_sentences(text):
+    """
+    Split text on sentence ends and blank lines, collapsing inner whitespace
+    """
+    sentences = (" ".join(part.split()) for part in _SENTENCE_END_RE.split(text))
+    return [sentence for sentence in sentences if sentence]
+
+
+def _split_long(sentence, max_tokens):
+    """
+    Hard-split a sentence longer than the window into max_tokens pieces
+    """
+    if TOKENIZER_AVAILABLE:
+        yield from token_windows(sentence, max_tokens)
+        return
+    # Without a tokenizer, fall back to the ~4 characters per token estimate
+    max_chars = max_tokens * 4
+    words = [word[start:start + max_chars] for word in sentence.split() for start in range(0, len(word), max_chars)]
+    piece = []
+    for word in words:
+        if piece and estimate_tokens(" ".join(piece + [word])) > max_tokens:
+            yield " ".join(piece)
+            piece = []
+        piece.append(word)
+    if piece:
+        yield " ".join(piece)
+
+
+def _sentence_units(text, max_tokens):
+    """
+    Yield (text, token count) sentence units that each fit in one window
+    """
+    for sentence in split_sentences(text):
+        tokens = estimate_tokens(sentence)
+        if tokens <= max_tokens:
+            yield sentence, tokens
+        else:
+            for piece in _split_long(sentence, max_tokens):
+                yield piece, estimate_tokens(piece)
+
+
+def _iter_token_windows(text, max_tokens, overlap_tokens):
+    """
+    Plain sliding token windows, ignoring sentence boundaries
+    """
+    step = max(1, max_tokens - overlap_tokens)
+    if TOKENIZER_AVAILABLE:
+        yield from token_windows(" ".join(text.split()), max_tokens, step)
+        return
+    # Without a tokenizer, treat words as tokens
+    words = text.split()
+    for start in range(0, len(words), step):
+        yield " ".join(words[start:start + max_tokens])
+        if start + max_tokens >= len(words):
+            break
+
+
+def iter_token_chunks(text, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, snap_to_sentences=True):
+    """
+    Lazily split text into chunks of at most max_tokens tokens
+
+    Args:
+        text (str): Text to split
+        max_tokens (int): Token budget per chunk
+        overlap_tokens (int): Tokens of trailing context repeated at the start
+            of the next chunk; 0 disables overlap
+        snap_to_sentences (bool): Only break between sentences, unless a single
+            sentence is longer than the window
+
+    Yields:
+        str: Chunks in order
+    """
+    if not snap_to_sentences:
+        yield from _iter_token_windows(text, max_tokens, overlap_tokens)
+        return
+
+    window = []
+    window_tokens = 0
+    for unit, tokens in _sentence_units(text, max_tokens):
+        if window and window_tokens + tokens > max_tokens:
+            yield " ".join(part for part, _ in window)
+            # Carry whole trailing sentences forward as overlap, keeping room for the new unit
+            carry = []
+            carry_tokens = 0
+            for part, part_tokens in reversed(window):
+                if carry_tokens + part_tokens > overlap_tokens or carry_tokens + part_tokens + tokens > max_tokens:
+                    break
+                carry.insert(0, (part, part_tokens))
+                carry_tokens += part_tokens
+            window = carry
+            window_tokens = carry_tokens
+        window.append((unit, tokens))
+        window_tokens += tokens
+
+    if window:
+        yield " ".join(part for part, _ in window)
@@ -6,6 +6,8 @@ import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 
+from llamacloud_client import get_llamacloud_client
+
 # Load environment variables
 load_dotenv()
 
@@ -29,17 +31,8 @@ def list_llamacloud_indices():
     """
     List all existing indices in LlamaCloud
     """
-    url = "https://api.cloud.llamaindex.ai/api/v1/pipelines"
-    
-    headers = {
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {LLAMA_CLOUD_API_KEY}'
-    }
-    
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return get_llamacloud_client(LLAMA_CLOUD_API_KEY).list_pipelines()
     except Exception as e:
         print(f"Error listing indices: {e}")
         return []
@@ -83,8 +76,6 @@ def create_llamacloud_index(index_name=None, verbose=False):
     
     print(f"\nCreating index with name: {index_name}")
     
-    url = "https://api.cloud.llamaindex.ai/api/v1/pipelines"
-    
     # Create payload based on API requirements
     payload = {
         "name": index_name,
@@ -109,28 +100,21 @@ def create_llamacloud_index(index_name=None, verbose=False):
         }
     }
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {LLAMA_CLOUD_API_KEY}'
-    }
-    
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
+        result = get_llamacloud_client(LLAMA_CLOUD_API_KEY).create_pipeline(payload)
         print(f"Index created successfully!")
         print(f"Index ID: {result.get('id')}")
         return result
         
     except requests.exceptions.HTTPError as e:
-        if response.status_code == 409:
+        response = e.response
+        if response is not None and response.status_code == 409:
             print(f"Server says index '{index_name}' already exists.")
             print(f"Response: {response.text}")
         else:
             print(f"Error creating index: {e}")
-            print(f"Response: {response.text}")
+            if response is not None:
+                print(f"Response: {response.text}")
         return None
     except Exception as e:
         print(f"Error: {e}")
@@ -146,11 +130,12 @@ def get_index_by_name(name):
     Returns:
         dict: The index data or None if not found
     """
-    indices = list_llamacloud_indices()
-    for index in indices:
-        if index.get("name") == name:
-            return index
-    return None
+    try:
+        # Served from the client's short-lived pipeline listing cache
+        return get_llamacloud_client(LLAMA_CLOUD_API_KEY).get_pipeline_by_name(name)
+    except Exception as e:
+        print(f"Error listing indices: {e}")
+        return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='LlamaCloud Index Management')
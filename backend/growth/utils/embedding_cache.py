@@ -0,0 +1,177 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from metrics import record_cache
+
+try:
+    from llama_index.core.base.embeddings.base import BaseEmbedding
+    from llama_index.core.bridge.pydantic import PrivateAttr
+except ImportError:
+    # The local NumPy engine uses EmbeddingCache without llama_index installed
+    BaseEmbedding = None
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("MCP_EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+# Optional on-disk tier shared across restarts and workers, e.g. ./storage/embeddings.sqlite
+EMBEDDING_CACHE_DB = os.getenv("MCP_EMBEDDING_CACHE_DB")
+
+
+def normalize_query(text):
+    """
+    Normalize a query so trivially different spellings share one cache entry:
+    Unicode NFKC, case-folded and with whitespace collapsed
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.casefold().split())
+
+
+def openai_model_key(model, dimensions):
+    """
+    Name of an OpenAI embedding model at a given size, e.g. "openai-text-embedding-3-small-1536":
+    the embedder name saved in index headers and the model key of this cache
+    """
+    return f"openai-{model}-{dimensions}"
+
+
+def _key(model_key, query):
+    digest = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+    return f"{model_key}|{digest}"
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed by model/dimensions and normalized query.
+
+    The first tier is a bounded in-memory LRU; the optional second tier is a
+    SQLite table storing float32 vectors as blobs.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_MAX_ENTRIES, sqlite_path=EMBEDDING_CACHE_DB):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, model_key, query):
+        """
+        Return the cached embedding as a list of floats, or None on a miss
+        """
+        key = _key(model_key, query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("embedding", True)
+                return list(vector)
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = array("f")
+                    vector.frombytes(row[0])
+                    self._remember(key, vector)
+                    self.hits += 1
+                    record_cache("embedding", True)
+                    return list(vector)
+            self.misses += 1
+            record_cache("embedding", False)
+            return None
+
+    def put(self, model_key, query, embedding):
+        key = _key(model_key, query)
+        vector = array("f", embedding)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, vector.tobytes())
+                )
+                self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Return the process-wide embedding cache
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+if BaseEmbedding is not None:
+
+    class CachedEmbedding(BaseEmbedding):
+        """
+        LlamaIndex embed model that serves query embeddings from EmbeddingCache
+        and delegates everything else to the wrapped model.
+        """
+
+        _inner: BaseEmbedding = PrivateAttr()
+        _cache: EmbeddingCache = PrivateAttr()
+        _model_key: str = PrivateAttr()
+
+        def __init__(self, inner, cache=None, **kwargs):
+            super().__init__(
+                model_name=inner.model_name,
+                embed_batch_size=inner.embed_batch_size,
+                **kwargs
+            )
+            self._inner = inner
+            self._cache = cache or get_embedding_cache()
+            # The local engine's OpenAIEmbedder uses the same key, so both share one entry per query
+            self._model_key = openai_model_key(inner.model_name, getattr(inner, 'dimensions', None))
+
+        @classmethod
+        def class_name(cls):
+            return "CachedEmbedding"
+
+        def _get_query_embedding(self, query):
+            embedding = self._cache.get(self._model_key, query)
+            if embedding is None:
+                embedding = self._inner.get_query_embedding(query)
+                self._cache.put(self._model_key, query, embedding)
+            return embedding
+
+        async def _aget_query_embedding(self, query):
+            embedding = self._cache.get(self._model_key, query)
+            if embedding is None:
+                embedding = await self._inner.aget_query_embedding(query)
+                self._cache.put(self._model_key, query, embedding)
+            return embedding
+
+        def _get_text_embedding(self, text):
+            return self._inner.get_text_embedding(text)
+
+        async def _aget_text_embedding(self, text):
+            return await self._inner.aget_text_embedding(text)
+
+        def _get_text_embeddings(self, texts):
+            return self._inner.get_text_embedding_batch(texts)
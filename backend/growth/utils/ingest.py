@@ -0,0 +1,307 @@
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from tokenizer import estimate_tokens
+
+
+def iter_batches_by_token_budget(items, max_batch_tokens=50000, max_batch_items=512, text_of=lambda item: item[1]):
+    """
+    Lazily group items into batches that stay under a token and item budget
+
+    Args:
+        items: Iterable of items (consumed lazily)
+        text_of: Returns the text of an item; defaults to the second field of a (key, text) pair
+
+    Yields:
+        list: Batches of items
+    """
+    batch = []
+    batch_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(text_of(item))
+        if batch and (batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_items):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def batch_by_token_budget(items, max_batch_tokens=50000, max_batch_items=512):
+    """
+    Group (key, text) pairs into batches that stay under a token and item budget
+
+    Returns:
+        list: List of batches, each a list of (key, text)
+    """
+    return list(iter_batches_by_token_budget(items, max_batch_tokens, max_batch_items))
+
+
+def is_rate_limit_error(error):
+    """
+    True for HTTP 429 errors from the OpenAI SDK (or anything shaped like them)
+    """
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveBackoff:
+    """
+    Backoff shared by all workers: every 429 doubles the pause (or uses the
+    server's Retry-After) and every success shrinks it again, so the pipeline
+    settles just under the provider's rate limit.
+    """
+
+    def __init__(self, initial_delay=1.0, max_delay=60.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.rate_limited = 0
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            pause = self._resume_at - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+
+    def on_rate_limit(self, retry_after=None):
+        with self._lock:
+            self.rate_limited += 1
+            self.delay = min(self.max_delay, max(self.initial_delay, self.delay * 2))
+            pause = retry_after if retry_after is not None else self.delay * (0.5 + random.random())
+            self._resume_at = max(self._resume_at, time.monotonic() + pause)
+
+    def on_success(self):
+        with self._lock:
+            self.delay = self.delay / 2 if self.delay > self.initial_delay else 0.0
+
+
+def embed_with_backoff(embed_fn, texts, backoff, max_retries=8):
+    """
+    Call embed_fn, retrying rate-limit errors after the shared backoff
+    """
+    for attempt in range(max_retries + 1):
+        backoff.wait()
+        try:
+            embeddings = embed_fn(texts)
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == max_retries:
+                raise
+            backoff.on_rate_limit(_retry_after_seconds(e))
+            continue
+        backoff.on_success()
+        return embeddings
+
+
+class EmbeddingCheckpoint:
+    """
+    Append-only JSONL file of finished embeddings keyed by content hash, so an
+    interrupted build resumes without re-embedding finished batches.
+
+    It only covers one build: delete the file once the index holding the vectors
+    has been saved, or it grows with every build and is read in full by the next.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path) if path else None
+        self.vectors = {}
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A partially written last line from an interrupted run
+                        continue
+                    self.vectors[entry["key"]] = entry["embedding"]
+
+    def add_batch(self, keys, embeddings):
+        with self._lock:
+            for key, embedding in zip(keys, embeddings):
+                self.vectors[key] = embedding
+            if self.path:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    for key, embedding in zip(keys, embeddings):
+                        f.write(json.dumps({"key": key, "embedding": list(embedding)}) + "\n")
+
+
+class EmbeddingPipeline:
+    """
+    Embeds texts in token-budgeted batches on several worker threads.
+
+    Args:
+        embed_fn: Callable taking a list of texts and returning a list of vectors
+            (e.g. an embed model's get_text_embedding_batch, or a local fake)
+        model_key (str): Identifies the model so checkpoints are not mixed across models
+        checkpoint_path (str): Optional JSONL checkpoint used to resume interrupted builds
+    """
+
+    def __init__(self, embed_fn, model_key="default", checkpoint_path=None, max_workers=4,
+                 max_batch_tokens=50000, max_batch_items=512, max_retries=8):
+        self.embed_fn = embed_fn
+        self.model_key = model_key
+        self.checkpoint = EmbeddingCheckpoint(checkpoint_path)
+        self.max_workers = max_workers
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_retries = max_retries
+        self.backoff = AdaptiveBackoff()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_key}\n{text}".encode("utf-8")).hexdigest()
+
+    def _embed_batch(self, batch):
+        keys = [key for key, _ in batch]
+        texts = [text for _, text in batch]
+        embeddings = embed_with_backoff(self.embed_fn, texts, self.backoff, self.max_retries)
+        self.checkpoint.add_batch(keys, embeddings)
+        return len(batch)
+
+    def run(self, texts):
+        """
+        Embed texts, reusing checkpointed vectors
+
+        Returns:
+            list: One embedding per input text, in input order
+        """
+        keys = [self._key(text) for text in texts]
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in self.checkpoint.vectors:
+                pending[key] = text
+
+        batches = batch_by_token_budget(pending.items(), self.max_batch_tokens, self.max_batch_items)
+        print(f"Embedding {len(pending)} of {len(texts)} texts in {len(batches)} batches "
+              f"({len(texts) - len(pending)} resumed from checkpoint)")
+
+        started = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._embed_batch, batch) for batch in batches]
+            for future in as_completed(futures):
+                done += future.result()
+
+        elapsed = time.perf_counter() - started
+        if batches:
+            print(f"Embedded {done} texts in {elapsed:.1f}s ({self.backoff.rate_limited} rate-limit retries)")
+        return [self.checkpoint.vectors[key] for key in keys]
+
+
+_DONE = object()
+
+
+def stream_ingest(items, upsert_fn, embed_fn=None, text_of=lambda item: item.text,
+                  max_batch_tokens=50000, max_batch_items=256, queue_size=4, max_retries=8):
+    """
+    Stream items through batching, embedding and upserting with bounded memory.
+
+    The stages run on their own threads connected by queues of at most
+    queue_size batches, so a slow stage blocks the ones before it
+    (backpressure) and only a few batches are ever held in memory,
+    however long the input is.
+
+    Args:
+        items: Iterable of items, consumed lazily (e.g. a generator of Documents)
+        upsert_fn: Called as upsert_fn(batch, embeddings) on the calling thread
+        embed_fn: Optional callable embedding a list of texts; if None, upsert_fn
+            receives None as embeddings (e.g. when the server embeds)
+        text_of: Returns the text to embed for an item
+
+    Returns:
+        dict: Number of items and batches processed
+    """
+    batches = queue.Queue(maxsize=queue_size)
+    embedded = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    backoff = AdaptiveBackoff()
+
+    def put(q, value):
+        # Give up if another stage failed, instead of blocking forever on a full queue
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def produce():
+        try:
+            for batch in iter_batches_by_token_budget(items, max_batch_tokens, max_batch_items, text_of):
+                if not put(batches, batch):
+                    return
+            put(batches, _DONE)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    def embed():
+        try:
+            while True:
+                batch = get(batches)
+                if batch is _DONE:
+                    put(embedded, _DONE)
+                    return
+                embeddings = None
+                if embed_fn is not None:
+                    embeddings = embed_with_backoff(embed_fn, [text_of(item) for item in batch], backoff, max_retries)
+                if not put(embedded, (batch, embeddings)):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=produce, daemon=True), threading.Thread(target=embed, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    item_count = 0
+    batch_count = 0
+    try:
+        while True:
+            entry = get(embedded)
+            if entry is _DONE:
+                break
+            batch, embeddings = entry
+            upsert_fn(batch, embeddings)
+            item_count += len(batch)
+            batch_count += 1
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return {'items': item_count, 'batches': batch_count}
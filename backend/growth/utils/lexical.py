@@ -0,0 +1,412 @@
+import json
+import os
+import re
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+
+from binary_index import new_generation
+from catalog import load_csv_rows
+from metrics import stage
+
+LEXICAL_INDEX_PATH = os.getenv("MCP_LEXICAL_INDEX_PATH", "./storage/lexical_index")
+DEFAULT_CSV_PATH = Path(__file__).parent.parent / 'source' / 'MCP_description.csv'
+# Set to 0 to fall back to pure vector retrieval
+HYBRID_SEARCH = os.getenv("MCP_HYBRID_SEARCH", "1") == "1"
+
+# Standard BM25 parameters and the usual reciprocal rank fusion constant
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Words in nearly every repo name; they say nothing about which server is meant
+GENERIC_NAME_TOKENS = {"mcp", "server", "servers", "model", "context", "protocol", "github", "com", "www", "https"}
+
+
+def tokenize(text):
+    """
+    Lowercase alphanumeric tokens
+    """
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def url_names(url):
+    """
+    Distinctive tokens of a server's owner and of its repository name, e.g.
+    https://github.com/stripe/agent-toolkit -> [['stripe'], ['agent', 'toolkit']]
+    """
+    path = urlparse(url).path.strip("/").split("/")[:2]
+    return [[token for token in tokenize(part) if token not in GENERIC_NAME_TOKENS] for part in path]
+
+
+def url_name_tokens(url):
+    """
+    Distinctive tokens of a server's owner and repository name, e.g.
+    https://github.com/stripe/agent-toolkit -> ['stripe', 'agent', 'toolkit']
+    """
+    return [token for name in url_names(url) for token in name]
+
+
+def _contains_phrase(tokens, phrase):
+    return any(tokens[start:start + len(phrase)] == phrase for start in range(len(tokens) - len(phrase) + 1))
+
+
+class LexicalIndex:
+    """
+    BM25 over one document per server (description plus URL name tokens).
+
+    Posting lists are stored in CSR form: the postings of term t are
+    doc_ids[offsets[t]:offsets[t + 1]] with matching term frequencies in tfs,
+    so scoring a term is one vectorised slice rather than a Python loop.
+    """
+
+    def __init__(self, urls, texts, vocabulary, offsets, doc_ids, tfs, doc_lengths, name_tokens):
+        self.urls = urls
+        self.texts = texts
+        self.vocabulary = vocabulary
+        self.terms = sorted(vocabulary)
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.name_tokens = name_tokens
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((len(urls) - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        # name token -> positions of servers whose name contains it
+        self.names = {}
+        for position, tokens in enumerate(name_tokens):
+            for token in set(tokens):
+                self.names.setdefault(token, []).append(position)
+        # Whole owner, repository or owner/repository names -> positions of the servers with that name
+        self.whole_names = {}
+        for position, url in enumerate(urls):
+            for name in {tuple(tokens) for tokens in url_names(url)} | {tuple(url_name_tokens(url))}:
+                if name:
+                    self.whole_names.setdefault(name, []).append(position)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build the index from CSV rows (dicts with 'url' and 'text')
+        """
+        urls, texts, name_tokens, doc_lengths = [], [], [], []
+        postings = {}
+        for position, row in enumerate(rows):
+            names = url_name_tokens(row['url'])
+            # Name tokens count twice so a server's own name outweighs passing mentions
+            tokens = tokenize(row['text']) + names * 2
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((position, count))
+            urls.append(row['url'])
+            texts.append(row['text'])
+            name_tokens.append(names)
+            doc_lengths.append(len(tokens))
+
+        vocabulary = {term: term_id for term_id, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        for term, term_id in vocabulary.items():
+            offsets[term_id + 1] = len(postings[term])
+        offsets = np.cumsum(offsets)
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for term, term_id in vocabulary.items():
+            entries = postings[term]
+            doc_ids[offsets[term_id]:offsets[term_id + 1]] = [position for position, _ in entries]
+            tfs[offsets[term_id]:offsets[term_id + 1]] = [count for _, count in entries]
+        return cls(urls, texts, vocabulary, offsets, doc_ids, tfs,
+                   np.asarray(doc_lengths, dtype=np.float32), name_tokens)
+
+    @classmethod
+    def from_csv(cls, csv_file):
+        return cls.from_rows(load_csv_rows(csv_file))
+
+    def _query_term_ids(self, query, min_prefix=4, max_expansions=8):
+        """
+        Term ids for the query; an unknown term of min_prefix or more characters
+        matches the terms it is a prefix of ("postgres" -> "postgresql")
+        """
+        term_ids = set()
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is not None:
+                term_ids.add(term_id)
+                continue
+            if len(term) < min_prefix:
+                continue
+            position = bisect_left(self.terms, term)
+            for candidate in self.terms[position:position + max_expansions]:
+                if not candidate.startswith(term):
+                    break
+                term_ids.add(self.vocabulary[candidate])
+        return term_ids
+
+    def scores(self, query):
+        """
+        BM25 score of every server for the query, as a dense float32 array
+        """
+        scores = np.zeros(len(self.urls), dtype=np.float32)
+        if not self.urls:
+            return scores
+        for term_id in self._query_term_ids(query):
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.average_length)
+            scores[docs] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def _results(self, positions, scores):
+        return [
+            {'url': self.urls[position], 'text': self.texts[position], 'score': float(scores[position])}
+            for position in positions
+        ]
+
+    def search(self, query, top_k=5):
+        """
+        Return the top_k servers by BM25 score
+
+        Returns:
+            list: List of dicts with 'url', 'text' and 'score'
+        """
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        return self._results(matched[np.argsort(-scores[matched])], scores)
+
+    def confident_matches(self, query, top_k=5, max_query_terms=3):
+        """
+        Results for a short query that names servers outright, or None.
+
+        The query is confident when it has at most max_query_terms distinctive
+        terms and they are a server's whole owner or repository name (e.g.
+        "postgres" or "stripe mcp"), or, for several terms, a phrase of its
+        name ("agent toolkit"). A common word that is only part of names, such
+        as "search", is not enough. Name matches come first, then other BM25
+        hits fill the remaining slots.
+        """
+        terms = [term for term in tokenize(query) if term not in GENERIC_NAME_TOKENS]
+        if not terms or len(terms) > max_query_terms:
+            return None
+        named = set(self.whole_names.get(tuple(terms), []))
+        if len(terms) > 1:
+            candidates = set(self.names.get(terms[0], []))
+            for term in terms[1:]:
+                candidates &= set(self.names.get(term, []))
+            named |= {position for position in candidates if _contains_phrase(self.name_tokens[position], terms)}
+        if not named:
+            return None
+        scores = self.scores(query)
+        named = sorted(named, key=lambda position: -scores[position])[:top_k]
+        results = self._results(named, scores)
+        if len(results) < top_k:
+            seen = {result['url'] for result in results}
+            results += [result for result in self.search(" ".join(terms), top_k * 2) if result['url'] not in seen][:top_k - len(results)]
+        return results
+
+    def save(self, path=LEXICAL_INDEX_PATH):
+        """
+        Save the index; documents.json names the postings file it goes with
+
+        Both files are written under temporary names and renamed into place,
+        postings first, so a reload triggered by the new documents.json never
+        reads a partial file or the previous save's postings.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        postings_file = f"postings.{new_generation()}.npz"
+        with open(path / (postings_file + ".tmp"), 'wb') as f:
+            np.savez(f, offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs, doc_lengths=self.doc_lengths)
+        os.replace(path / (postings_file + ".tmp"), path / postings_file)
+        with open(path / "documents.json.tmp", 'w', encoding='utf-8') as f:
+            json.dump({
+                'urls': self.urls,
+                'texts': self.texts,
+                'name_tokens': self.name_tokens,
+                'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get),
+                'postings': postings_file,
+            }, f)
+        os.replace(path / "documents.json.tmp", path / "documents.json")
+        # Readers that already opened an old postings file keep it until they close it
+        for stale in path.glob("postings*.npz"):
+            if stale.name != postings_file:
+                stale.unlink(missing_ok=True)
+        print(f"Lexical index with {len(self.urls)} servers and {len(self.vocabulary)} terms saved to {path}")
+
+    @classmethod
+    def load(cls, path=LEXICAL_INDEX_PATH, attempts=3):
+        """
+        Load a saved index, returning None if it is missing or unreadable
+        """
+        path = Path(path)
+        for attempt in range(attempts):
+            if not (path / "documents.json").exists():
+                return None
+            try:
+                with open(path / "documents.json", 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                with np.load(path / data.get('postings', "postings.npz")) as arrays:
+                    vocabulary = {term: term_id for term_id, term in enumerate(data['vocabulary'])}
+                    return cls(data['urls'], data['texts'], vocabulary, arrays['offsets'], arrays['doc_ids'],
+                               arrays['tfs'], arrays['doc_lengths'], data['name_tokens'])
+            except FileNotFoundError:
+                # A save replaced the postings after this documents.json was read
+                continue
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not read lexical index at {path}: {e}")
+                return None
+        print(f"Ignoring lexical index at {path}: it kept changing while being loaded")
+        return None
+
+
+def build_lexical_index(csv_file, path=LEXICAL_INDEX_PATH):
+    """
+    Build and save the lexical index from the CSV (run at ingest time)
+    """
+    global _index, _index_mtime
+    index = LexicalIndex.from_csv(csv_file)
+    index.save(path)
+    with _index_lock:
+        _index = index
+        _index_mtime = _documents_mtime(path)
+    return index
+
+
+def reciprocal_rank_fusion(result_lists, top_k=5, k=RRF_K):
+    """
+    Merge ranked result lists by summing 1 / (k + rank) per URL
+
+    The first list's entry (text and any extra fields) is kept for a URL found
+    in several lists, so pass the vector results first to keep their
+    best-matching chunk.
+
+    Returns:
+        list: List of dicts with 'url', 'text' and the fused 'score'
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, 1):
+            entry = fused.setdefault(result['url'], {**result, 'score': 0.0})
+            entry['score'] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)[:top_k]
+
+
+def hybrid_search(query, top_k, vector_search, index=None):
+    """
+    Fuse BM25 and vector retrieval, skipping the vector search for confident exact-name queries
+
+    Args:
+        query (str): The search query
+        top_k (int): Number of results to return
+        vector_search: Callable (query, top_k) -> list of {'url', 'text', 'score'}
+        index (LexicalIndex): Defaults to the process-wide index
+
+    Returns:
+        list: List of dicts with 'url', 'text' and 'score'
+    """
+    index = index or get_lexical_index()
+    with stage("lexical"):
+        confident = index.confident_matches(query, top_k)
+    if confident:
+        return confident
+    vector_results = vector_search(query, top_k * 2)
+    with stage("lexical"):
+        lexical_results = index.search(query, top_k * 2)
+    return reciprocal_rank_fusion([vector_results, lexical_results], top_k)
+
+
+async def ahybrid_search(query, top_k, vector_search, index=None):
+    """
+    Async variant of hybrid_search, for an awaitable vector_search
+    """
+    index = index or get_lexical_index()
+    with stage("lexical"):
+        confident = index.confident_matches(query, top_k)
+    if confident:
+        return confident
+    vector_results = await vector_search(query, top_k * 2)
+    with stage("lexical"):
+        lexical_results = index.search(query, top_k * 2)
+    return reciprocal_rank_fusion([vector_results, lexical_results], top_k)
+
+
+def _split_batch(queries, top_k, index):
+    # Confident results per query, and the positions of the queries that still need vector retrieval
+    results = [index.confident_matches(query, top_k) for query in queries]
+    pending = [position for position, confident in enumerate(results) if not confident]
+    return results, pending
+
+
+def hybrid_search_batch(queries, top_k, vector_search_batch, index=None):
+    """
+    hybrid_search for several queries, with one vector retrieval call for all of them
+
+    Args:
+        queries (list): The search queries
+        vector_search_batch: Callable (queries, top_k) -> one result list per query
+
+    Returns:
+        list: One list of {'url', 'text', 'score'} dicts per query
+    """
+    index = index or get_lexical_index()
+    results, pending = _split_batch(queries, top_k, index)
+    if pending:
+        vector_results = vector_search_batch([queries[position] for position in pending], top_k * 2)
+        for position, hits in zip(pending, vector_results):
+            results[position] = reciprocal_rank_fusion([hits, index.search(queries[position], top_k * 2)], top_k)
+    return results
+
+
+async def ahybrid_search_batch(queries, top_k, vector_search_batch, index=None):
+    """
+    Async variant of hybrid_search_batch, for an awaitable vector_search_batch
+    """
+    index = index or get_lexical_index()
+    results, pending = _split_batch(queries, top_k, index)
+    if pending:
+        vector_results = await vector_search_batch([queries[position] for position in pending], top_k * 2)
+        for position, hits in zip(pending, vector_results):
+            results[position] = reciprocal_rank_fusion([hits, index.search(queries[position], top_k * 2)], top_k)
+    return results
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def _documents_mtime(path):
+    try:
+        return (Path(path) / "documents.json").stat().st_mtime
+    except OSError:
+        return None
+
+
+def get_lexical_index(path=LEXICAL_INDEX_PATH, csv_file=DEFAULT_CSV_PATH):
+    """
+    Return the process-wide lexical index, loading it from disk or building it from the CSV.
+    It is reloaded when an ingest run rewrites the saved index.
+    """
+    global _index, _index_mtime
+    mtime = _documents_mtime(path)
+    if _index is None or (mtime is not None and mtime != _index_mtime):
+        with _index_lock:
+            if _index is None or (mtime is not None and mtime != _index_mtime):
+                index = LexicalIndex.load(path)
+                if index is None:
+                    print("Building lexical index from CSV...")
+                    index = LexicalIndex.from_csv(csv_file)
+                    index.save(path)
+                _index = index
+                _index_mtime = _documents_mtime(path)
+    return _index
@@ -0,0 +1,171 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Point at a local stub server in tests, e.g. LLAMA_CLOUD_BASE_URL=http://127.0.0.1:8765
+LLAMA_CLOUD_BASE_URL = os.getenv("LLAMA_CLOUD_BASE_URL", "https://api.cloud.llamaindex.ai")
+LLAMA_CLOUD_TIMEOUT = float(os.getenv("LLAMA_CLOUD_TIMEOUT", "30"))
+LLAMA_CLOUD_PIPELINES_TTL = float(os.getenv("LLAMA_CLOUD_PIPELINES_TTL", "60"))
+
+# Statuses worth retrying; 429 is retried for any method, the rest only for idempotent ones
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+class LlamaCloudClient:
+    """
+    Shared client for the LlamaCloud management API.
+
+    Keeps one keep-alive session with a connection pool, so repeated calls
+    reuse the TLS connection, retries transient failures with jittered
+    exponential backoff, and caches the pipeline listing for a few seconds so
+    name-to-id lookups do not list every pipeline each time.
+
+    Args:
+        api_key (str): LlamaCloud API key (defaults to LLAMA_CLOUD_API_KEY)
+        base_url (str): API root, overridable for stub servers
+        timeout (float): Per-request timeout in seconds
+        max_retries (int): Retries per request after the first attempt
+        pool_size (int): Connections kept open per host
+        pipelines_ttl (float): Seconds the pipeline listing is cached
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeout=LLAMA_CLOUD_TIMEOUT, max_retries=4,
+                 pool_size=16, pipelines_ttl=LLAMA_CLOUD_PIPELINES_TTL, backoff_factor=0.5):
+        self.api_key = api_key or os.getenv("LLAMA_CLOUD_API_KEY")
+        self.base_url = (base_url or LLAMA_CLOUD_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pipelines_ttl = pipelines_ttl
+
+        self.session = requests.Session()
+        # Retries are handled in request() so they can honour Retry-After and add jitter
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({'Accept': 'application/json'})
+        if self.api_key:
+            self.session.headers['Authorization'] = f'Bearer {self.api_key}'
+
+        self._pipelines = None
+        self._pipelines_at = 0.0
+        self._lock = threading.Lock()
+
+    def _sleep_before_retry(self, attempt, response=None):
+        retry_after = None
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if retry_after is None:
+            # Full jitter keeps many workers from retrying in lockstep
+            retry_after = random.uniform(0, self.backoff_factor * (2 ** attempt))
+        time.sleep(retry_after)
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request to the API, retrying connection errors and retryable statuses
+
+        Args:
+            method (str): HTTP method
+            path (str): Path under the base URL, e.g. "/api/v1/pipelines"
+
+        Returns:
+            requests.Response: The final response (raise_for_status already applied)
+        """
+        method = method.upper()
+        url = f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt or method not in IDEMPOTENT_METHODS:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+
+            retryable = response.status_code == 429 or (
+                response.status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+            )
+            if retryable and not last_attempt:
+                self._sleep_before_retry(attempt, response)
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def list_pipelines(self, use_cache=True):
+        """
+        List all pipelines (indices), served from the short-lived cache when fresh
+        """
+        with self._lock:
+            if use_cache and self._pipelines is not None and time.monotonic() - self._pipelines_at < self.pipelines_ttl:
+                return self._pipelines
+        pipelines = self.request("GET", "/api/v1/pipelines").json()
+        with self._lock:
+            self._pipelines = pipelines
+            self._pipelines_at = time.monotonic()
+        return pipelines
+
+    def invalidate_pipelines(self):
+        """
+        Drop the cached pipeline listing, e.g. after creating or deleting a pipeline
+        """
+        with self._lock:
+            self._pipelines = None
+
+    def get_pipeline_by_name(self, name):
+        """
+        Find a pipeline by name, or None if it does not exist
+        """
+        for pipeline in self.list_pipelines():
+            if pipeline.get("name") == name:
+                return pipeline
+        return None
+
+    def create_pipeline(self, payload):
+        """
+        Create a pipeline and return its JSON description
+        """
+        response = self.request("POST", "/api/v1/pipelines", json=payload)
+        self.invalidate_pipelines()
+        return response.json()
+
+    def upsert_documents(self, pipeline_id, documents, headers=None):
+        """
+        Upsert documents into a pipeline
+
+        Args:
+            pipeline_id (str): Target pipeline id
+            documents (list): Document payloads ({"text": ..., "metadata": ...})
+            headers (dict): Optional extra headers for this request
+        """
+        response = self.request("PUT", f"/api/v1/pipelines/{pipeline_id}/documents", json=documents, headers=headers)
+        return response.json()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llamacloud_client(api_key=None):
+    """
+    Return the process-wide client for an API key (default: LLAMA_CLOUD_API_KEY)
+    """
+    api_key = api_key or os.getenv("LLAMA_CLOUD_API_KEY")
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = LlamaCloudClient(api_key=api_key)
+        return _clients[api_key]
@@ -0,0 +1,409 @@
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from ann import ANN_FILE, ANN_MIN_ROWS, ANN_NPROBE, IVFIndex
+from binary_index import load_binary_index, new_generation, save_binary_index
+from catalog import load_csv_rows
+from chunking import iter_token_chunks
+from embedding_cache import get_embedding_cache, openai_model_key
+from manifest import catalog_digest
+from metrics import stage
+from quantize import BITS_FILE, CODES_FILE, SCALES_FILE, VECTOR_STORAGE, QuantizedVectors
+
+LOCAL_INDEX_PATH = os.getenv("MCP_LOCAL_INDEX_PATH", "./storage/local_index")
+DEFAULT_CSV_PATH = Path(__file__).parent.parent / 'source' / 'MCP_description.csv'
+# Model and size of the OpenAI embeddings, for the local engine and the ingest pipeline alike
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+OPENAI_EMBEDDING_DIMENSIONS = 1536
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Queries scored per matrix-matrix product in a batch search, to bound the score matrix
+_QUERY_BLOCK = 64
+
+
+class HashingEmbedder:
+    """
+    Deterministic offline embedder using signed feature hashing of words and
+    word bigrams. Good enough for tests, benchmarks and running without an API key.
+    """
+
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def _features(self, text):
+        tokens = _TOKEN_RE.findall(text.lower())
+        return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        """
+        Embed a list of texts
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dimensions)
+        """
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                matrix[row, (value >> 1) % self.dimensions] += sign
+        return matrix
+
+
+class OpenAIEmbedder:
+    """
+    Embedder backed by the OpenAI embeddings API
+    """
+
+    def __init__(self, model=OPENAI_EMBEDDING_MODEL, dimensions=OPENAI_EMBEDDING_DIMENSIONS, client=None, batch_size=256):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI()
+        self.client = client
+        self.async_client = None
+        self.model = model
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.name = openai_model_key(model, dimensions)
+
+    def embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=texts[start:start + self.batch_size],
+                dimensions=self.dimensions
+            )
+            vectors.extend(item.embedding for item in response.data)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions)
+
+    async def aembed(self, texts):
+        if self.async_client is None:
+            from openai import AsyncOpenAI
+            self.async_client = AsyncOpenAI()
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = await self.async_client.embeddings.create(
+                model=self.model,
+                input=texts[start:start + self.batch_size],
+                dimensions=self.dimensions
+            )
+            vectors.extend(item.embedding for item in response.data)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions)
+
+
+def get_embedder(name=None):
+    """
+    Return the embedder selected by name or the MCP_EMBEDDER environment variable
+
+    Args:
+        name (str): 'openai' (default) or 'hashing'
+    """
+    name = name or os.getenv("MCP_EMBEDDER", "openai")
+    if name == "hashing":
+        return HashingEmbedder()
+    if name == "openai":
+        return OpenAIEmbedder()
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorEngine:
+    """
+    In-process vector search over all chunk embeddings held in one contiguous
+    float32 matrix. Rows are L2-normalised so a dot product is cosine similarity.
+    With an IVF index attached, a query only scores the rows in its nearest
+    clusters instead of the whole matrix. With quantized codes attached, the
+    matrix may be a read-only memory map: queries are scored on the int8 (and
+    sign-bit) codes and only the final candidates' float rows are read.
+    source_digest is the catalog_digest of the rows the engine was built
+    from, so a saved engine can be told apart from the current CSV, and
+    generation is the binary-index generation it was saved or loaded as.
+    """
+
+    def __init__(self, embeddings, records, embedder, ann=None, quantized=None, normalized=False, source_digest=None,
+                 generation=None):
+        if normalized:
+            # Saved matrices are already unit-norm; keeping them as-is preserves a memory map
+            self.embeddings = embeddings
+        else:
+            self.embeddings = np.ascontiguousarray(_normalize_rows(np.asarray(embeddings, dtype=np.float32)))
+        self.records = records
+        self.embedder = embedder
+        self.ann = ann
+        self.quantized = quantized
+        self.source_digest = source_digest
+        self.generation = generation
+
+    def build_ann(self, n_lists=None):
+        """
+        Cluster the embeddings into an IVF index used by later searches
+        """
+        self.ann = IVFIndex.build(self.embeddings, n_lists)
+        print(f"Built IVF index with {self.ann.n_lists} lists over {len(self.records)} chunks")
+        return self.ann
+
+    @classmethod
+    def from_rows(cls, rows, embedder):
+        """
+        Build an engine from CSV rows (dicts with 'url' and 'text'), one record per chunk
+        """
+        records = [
+            {'url': row['url'], 'text': chunk, 'chunk_id': chunk_id}
+            for row in rows
+            for chunk_id, chunk in enumerate(iter_token_chunks(row['text']))
+        ]
+        # Embed the URL with each chunk, as LlamaIndex does with the url metadata
+        embeddings = embedder.embed([f"url: {record['url']}\n\n{record['text']}" for record in records])
+        return cls(embeddings, records, embedder, source_digest=catalog_digest(rows))
+
+    @classmethod
+    def from_csv(cls, csv_file, embedder):
+        return cls.from_rows(load_csv_rows(csv_file), embedder)
+
+    def embed_query(self, query):
+        cache = get_embedding_cache()
+        cached = cache.get(self.embedder.name, query)
+        if cached is not None:
+            vector = np.asarray(cached, dtype=np.float32)
+        else:
+            with stage("embed_query"):
+                vector = self.embedder.embed([query])[0]
+            cache.put(self.embedder.name, query, vector)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def aembed_query(self, query):
+        """
+        Async variant of embed_query for embedders that support it (others are cheap and run inline)
+        """
+        if not hasattr(self.embedder, "aembed"):
+            return self.embed_query(query)
+        cache = get_embedding_cache()
+        cached = cache.get(self.embedder.name, query)
+        if cached is not None:
+            vector = np.asarray(cached, dtype=np.float32)
+        else:
+            with stage("embed_query"):
+                vector = (await self.embedder.aembed([query]))[0]
+            cache.put(self.embedder.name, query, vector)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _embed_misses(self, queries):
+        # Cached rows plus the positions and texts of the queries still to embed
+        cache = get_embedding_cache()
+        matrix = np.zeros((len(queries), self.embeddings.shape[1]), dtype=np.float32)
+        missing = []
+        for row, query in enumerate(queries):
+            cached = cache.get(self.embedder.name, query)
+            if cached is not None:
+                matrix[row] = cached
+            else:
+                missing.append(row)
+        return matrix, missing
+
+    def _finish_batch(self, queries, matrix, missing, vectors):
+        cache = get_embedding_cache()
+        for row, vector in zip(missing, vectors):
+            matrix[row] = vector
+            cache.put(self.embedder.name, queries[row], vector)
+        return _normalize_rows(matrix)
+
+    def embed_queries(self, queries):
+        """
+        Embed several queries with one embedder call for all cache misses
+
+        Returns:
+            np.ndarray: float32 matrix of unit-norm query vectors, one row per query
+        """
+        matrix, missing = self._embed_misses(queries)
+        with stage("embed_queries"):
+            vectors = self.embedder.embed([queries[row] for row in missing]) if missing else []
+        return self._finish_batch(queries, matrix, missing, vectors)
+
+    async def aembed_queries(self, queries):
+        """
+        Async variant of embed_queries
+        """
+        if not hasattr(self.embedder, "aembed"):
+            return self.embed_queries(queries)
+        matrix, missing = self._embed_misses(queries)
+        with stage("embed_queries"):
+            vectors = (await self.embedder.aembed([queries[row] for row in missing])) if missing else []
+        return self._finish_batch(queries, matrix, missing, vectors)
+
+    def _best_per_url(self, top, top_scores, top_k):
+        results = []
+        seen = set()
+        for position, score in zip(top, top_scores):
+            record = self.records[position]
+            if record['url'] in seen:
+                continue
+            seen.add(record['url'])
+            results.append({'url': record['url'], 'text': record['text'], 'score': float(score)})
+            if len(results) == top_k:
+                break
+        return results
+
+    def search_vector(self, query_vector, top_k=5):
+        """
+        Return the best chunk per URL for a query vector, highest score first
+
+        Returns:
+            list: List of dicts with 'url', 'text' and 'score'
+        """
+        if not self.records:
+            return []
+        # Over-fetch so that several chunks of one server do not crowd out others
+        candidates = min(len(self.records), top_k * 3)
+        if self.ann is not None:
+            top, top_scores = self.ann.search(self.embeddings, query_vector, candidates, ANN_NPROBE)
+        elif self.quantized is not None:
+            top, top_scores = self.quantized.search(
+                query_vector, candidates, rescore_vectors=self.embeddings, use_bits=VECTOR_STORAGE == "binary"
+            )
+        else:
+            scores = self.embeddings @ query_vector
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+            top_scores = scores[top]
+        return self._best_per_url(top, top_scores, top_k)
+
+    def search_vectors(self, query_vectors, top_k=5):
+        """
+        Best chunk per URL for each row of a query matrix. Without an ANN index
+        or quantized codes, a block of queries is scored against the whole
+        matrix in one matrix-matrix product.
+
+        Returns:
+            list: One list of {'url', 'text', 'score'} dicts per query vector
+        """
+        if not self.records:
+            return [[] for _ in query_vectors]
+        if self.ann is not None or self.quantized is not None:
+            return [self.search_vector(vector, top_k) for vector in query_vectors]
+
+        candidates = min(len(self.records), top_k * 3)
+        results = []
+        for start in range(0, len(query_vectors), _QUERY_BLOCK):
+            scores = query_vectors[start:start + _QUERY_BLOCK] @ self.embeddings.T
+            top = np.argpartition(-scores, candidates - 1, axis=1)[:, :candidates]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+            results.extend(self._best_per_url(rows, row_scores, top_k) for rows, row_scores in zip(top, top_scores))
+        return results
+
+    def search(self, query, top_k=5):
+        vector = self.embed_query(query)
+        with stage("vector_search"):
+            return self.search_vector(vector, top_k)
+
+    async def asearch(self, query, top_k=5):
+        vector = await self.aembed_query(query)
+        with stage("vector_search"):
+            return self.search_vector(vector, top_k)
+
+    def search_batch(self, queries, top_k=5):
+        vectors = self.embed_queries(queries)
+        with stage("vector_search_batch"):
+            return self.search_vectors(vectors, top_k)
+
+    async def asearch_batch(self, queries, top_k=5):
+        vectors = await self.aembed_queries(queries)
+        with stage("vector_search_batch"):
+            return self.search_vectors(vectors, top_k)
+
+    def save(self, path=LOCAL_INDEX_PATH):
+        path = Path(path)
+        # The ANN index and quantized codes are sidecars of the new generation, written before it is published
+        generation = new_generation()
+        if self.ann is not None:
+            self.ann.save(path, generation)
+        if VECTOR_STORAGE != "float":
+            self.quantized = self.quantized or QuantizedVectors.quantize(self.embeddings)
+            self.quantized.save(path, generation)
+        self.generation = save_binary_index(
+            path, self.embeddings, self.records, generation,
+            embedder=self.embedder.name, source_digest=self.source_digest
+        )
+        # Superseded by the binary format and by per-generation sidecars
+        for name in ("records.json", ANN_FILE, CODES_FILE, SCALES_FILE, BITS_FILE):
+            (path / name).unlink(missing_ok=True)
+        print(f"Local index with {len(self.records)} chunks saved to {path}")
+
+    @classmethod
+    def load(cls, path, embedder):
+        """
+        Open a saved engine, returning None if it is missing or was built with another embedder.
+
+        Embeddings and records are memory-mapped, so this is O(1) in the corpus
+        size and worker processes share the pages through the OS page cache.
+        """
+        path = Path(path)
+        opened = load_binary_index(path)
+        if opened is None:
+            return None
+        embeddings, records, header = opened
+        if header.get('embedder') != embedder.name:
+            print(f"Ignoring local index at {path}: built with {header.get('embedder')}, not {embedder.name}")
+            return None
+        ann = IVFIndex.load(path, expected_rows=len(records), generation=header['generation'])
+        quantized = None
+        if VECTOR_STORAGE != "float":
+            # Only the compact codes are read into memory; float rows are paged in for rescoring
+            quantized = QuantizedVectors.load(path, expected_rows=len(records), generation=header['generation'])
+            if quantized is None:
+                quantized = QuantizedVectors.quantize(embeddings)
+                quantized.save(path, header['generation'])
+        return cls(
+            embeddings, records, embedder, ann, quantized, normalized=True,
+            source_digest=header.get('source_digest'), generation=header['generation']
+        )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_local_engine(path=LOCAL_INDEX_PATH, csv_file=DEFAULT_CSV_PATH):
+    """
+    Return the process-wide local engine, loading it from disk or building it from the CSV
+
+    A saved engine built from other rows than the CSV currently holds is rebuilt,
+    so catalog edits are served after the next start.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                embedder = get_embedder()
+                rows = load_csv_rows(csv_file) if Path(csv_file).exists() else None
+                engine = LocalVectorEngine.load(path, embedder)
+                if engine is not None and rows is not None and engine.source_digest != catalog_digest(rows):
+                    print(f"Local index at {path} is out of date with {csv_file}")
+                    engine = None
+                if engine is None:
+                    print("Building local index from CSV...")
+                    engine = LocalVectorEngine.from_rows(load_csv_rows(csv_file) if rows is None else rows, embedder)
+                    if len(engine.records) >= ANN_MIN_ROWS:
+                        engine.build_ann()
+                    engine.save(path)
+                elif engine.ann is None and len(engine.records) >= ANN_MIN_ROWS:
+                    engine.build_ann()
+                    engine.ann.save(path, engine.generation)
+                _engine = engine
+    return _engine
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+# Lives inside the index directory, so query_only's IndexManager reloads when it changes
+MANIFEST_NAME = "manifest.json"
+# LlamaCloud pipeline that upsert_cloud.py fills and the cloud search backend reads
+CLOUD_COLLECTION_NAME = "elegant-hawk-2025-04-08"
+# backend/, whose storage directory holds the cloud manifest wherever the scripts are run from
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def row_hash(url, text):
+    """
+    Content hash of one CSV row (URL plus description)
+    """
+    return hashlib.sha256(f"{url.strip()}\n{text.strip()}".encode("utf-8")).hexdigest()
+
+
+def catalog_digest(rows):
+    """
+    Content hash of a whole catalog: the hashes of its rows, in order
+
+    Args:
+        rows (iterable): Dicts with 'url' and 'text'
+    """
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(row_hash(row['url'], row['text']).encode("ascii"))
+    return digest.hexdigest()
+
+
+def cloud_manifest_path(collection_name=CLOUD_COLLECTION_NAME):
+    """
+    Manifest of the rows upserted into a LlamaCloud pipeline, rewritten by every cloud upsert
+    """
+    return BACKEND_DIR / "storage" / f"{collection_name}_cloud_manifest.json"
+
+
+def load_manifest(path):
+    """
+    Load an ingestion manifest, returning None if it is missing or from another version
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read manifest at {path}: {e}")
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path, rows, **extra):
+    """
+    Write the manifest of ingested rows
+
+    Args:
+        path (str): Manifest file path
+        rows (dict): url -> {'hash': row hash, 'doc_ids': [document ids]}
+        **extra: Additional top-level fields (e.g. the LlamaCloud pipeline id)
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'updated_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        **extra,
+        'rows': rows,
+    }
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def diff_rows(current, previous):
+    """
+    Compare current row hashes with the manifest's rows
+
+    Args:
+        current (dict): url -> row hash for the CSV as it is now
+        previous (dict): url -> {'hash': ..., 'doc_ids': [...]} from the manifest
+
+    Returns:
+        tuple: (added urls, changed urls, removed urls)
+    """
+    added = [url for url in current if url not in previous]
+    changed = [url for url in current if url in previous and previous[url]['hash'] != current[url]]
+    removed = [url for url in previous if url not in current]
+    return added, changed, removed
+
+
+def group_documents_by_url(documents):
+    """
+    Group Document chunks by the URL of the CSV row they came from
+    """
+    grouped = {}
+    for doc in documents:
+        grouped.setdefault(doc.metadata.get('url', '').strip(), []).append(doc)
+    return grouped
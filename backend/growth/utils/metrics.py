@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Set to 0 to turn every timer and counter into a no-op
+METRICS_ENABLED = os.getenv("MCP_METRICS", "1") == "1"
+
+# Upper bounds in seconds, from a cached lookup to a slow LLM call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels, as Prometheus expects
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][position] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        samples = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((self.name + "_bucket", key + (("le", le),), cumulative))
+            samples.append((self.name + "_sum", key, total))
+            samples.append((self.name + "_count", key, count))
+        return samples
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        return _registry.setdefault(metric.name, metric)
+
+
+def counter(name, help_text):
+    """
+    Return the process-wide counter called name, creating it on first use
+    """
+    return _register(Counter(name, help_text))
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS):
+    """
+    Return the process-wide histogram called name, creating it on first use
+    """
+    return _register(Histogram(name, help_text, buckets))
+
+
+STAGE_SECONDS = histogram("mcp_stage_seconds", "Time spent in each stage of the search pipeline")
+REQUEST_SECONDS = histogram("mcp_request_seconds", "HTTP request latency by route")
+LLM_SECONDS = histogram("mcp_llm_seconds", "LLM call latency by model")
+LLM_TOKENS = counter("mcp_llm_tokens_total", "LLM tokens by model and kind (prompt or completion)")
+LLM_CALLS = counter("mcp_llm_calls_total", "LLM calls by model; model=\"template\" counts template fallbacks")
+CACHE_REQUESTS = counter("mcp_cache_requests_total", "Cache lookups by cache and result (hit or miss)")
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the block as one pipeline stage, e.g. with stage("retrieve"): ...
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def record_cache(cache, hit, count=1):
+    """
+    Count cache lookups as hits or misses
+    """
+    if count:
+        CACHE_REQUESTS.inc(count, cache=cache, result="hit" if hit else "miss")
+
+
+def record_llm_call(model, seconds, prompt_tokens=None, completion_tokens=None):
+    """
+    Record one LLM call with its latency and, when the response reported usage, its tokens
+    """
+    LLM_CALLS.inc(model=model)
+    LLM_SECONDS.observe(seconds, model=model)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4)
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_label_text(labels)} {value}")
+    return "\n".join(lines) + "\n"
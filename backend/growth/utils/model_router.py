@@ -0,0 +1,237 @@
+import argparse
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from ingest import estimate_tokens
+from metrics import LLM_CALLS, record_llm_call
+from structuring import MCPServer, structuring_max_tokens, template_record
+
+# Expected end-to-end seconds for one LLM call once calls queue up; slower tiers are
+# skipped, and past the fastest tier results are built from a template instead
+LLM_LATENCY_BUDGET = float(os.getenv("MCP_LLM_LATENCY_BUDGET", "10"))
+# LLM calls the account serves in parallel before latency starts to climb with queue depth
+LLM_CONCURRENCY = int(os.getenv("MCP_LLM_CONCURRENCY", "16"))
+# Results per structuring call; larger sets are split and structured concurrently,
+# so the estimate of each call stays within the budget of the best tier
+STRUCTURING_CHUNK_SIZE = int(os.getenv("MCP_STRUCTURING_CHUNK_SIZE", "5"))
+# Set to 0 to always use the first tier, as before routing existed
+MODEL_ROUTING = os.getenv("MCP_MODEL_ROUTING", "1") == "1"
+
+# Typical output per structured server, used for latency estimates (the hard cap is larger)
+EXPECTED_TOKENS_PER_SERVER = 150
+# Weight of a new observation in the per-model seconds-per-token average
+_RATE_SMOOTHING = 0.2
+
+# Best tier first. Latency is overhead plus prompt and output tokens at the tier's rates.
+STRUCTURING_TIERS = [
+    {
+        'model': os.getenv("MCP_STRUCTURING_MODEL", "gpt-4o"),
+        'overhead_seconds': 0.6,
+        'seconds_per_input_token': 1 / 5000,
+        'seconds_per_token': 1 / 90,
+    },
+    {
+        'model': os.getenv("MCP_STRUCTURING_FAST_MODEL", "gpt-4o-mini"),
+        'overhead_seconds': 0.4,
+        'seconds_per_input_token': 1 / 8000,
+        'seconds_per_token': 1 / 140,
+    },
+]
+SUMMARY_TIERS = STRUCTURING_TIERS[1:]
+
+# model is None for the template fallback
+Route = namedtuple("Route", ["model", "max_tokens", "estimated_seconds", "reason"])
+
+
+class ModelRouter:
+    """
+    Picks the model tier for each LLM call from the number of results, the
+    input size and the number of LLM calls already in flight.
+
+    Latency is estimated as overhead plus input and expected output tokens
+    at the model's rates, scaled by how far the in-flight calls exceed
+    LLM_CONCURRENCY. Output seconds per token start from the tier defaults and
+    follow the latencies observed through track(), kept apart per kind of call
+    ("structuring" or "summary") since their prompts and outputs differ.
+
+    Only queueing makes the router degrade: while no more than LLM_CONCURRENCY
+    calls are in flight, the best tier is used whatever the size of the call.
+    Past that, the first tier whose estimate fits the latency budget wins, and
+    when none does, results are built from templates.
+    """
+
+    def __init__(self, latency_budget=LLM_LATENCY_BUDGET, concurrency=LLM_CONCURRENCY):
+        self.latency_budget = latency_budget
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._rates = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        How much slower calls are than on an idle account, from the calls in flight (at least 1)
+        """
+        return max(1.0, (self.in_flight + 1) / self.concurrency)
+
+    def estimate(self, tier, output_tokens, input_tokens=0, kind="structuring"):
+        """
+        Expected seconds for a call of this kind to the tier at the current queue depth
+        """
+        rate = self._rates.get((kind, tier['model']), tier['seconds_per_token'])
+        seconds = tier['overhead_seconds'] + input_tokens * tier['seconds_per_input_token'] + output_tokens * rate
+        return seconds * self.load()
+
+    def route(self, count, input_tokens, tiers=STRUCTURING_TIERS, kind="structuring"):
+        """
+        Choose the tier for structuring (or summarizing) count results
+
+        Args:
+            count (int): Number of results in the call
+            input_tokens (int): Tokens of the prompt's user content
+            tiers (list): Candidate tiers, best first
+            kind (str): "structuring" or "summary", whose observed rates are used
+
+        Returns:
+            Route: The chosen model (None for the template fallback), its max_tokens and the reason
+        """
+        max_tokens = structuring_max_tokens(count)
+        if not MODEL_ROUTING:
+            return Route(tiers[0]['model'], max_tokens, None, "routing disabled")
+
+        output_tokens = count * EXPECTED_TOKENS_PER_SERVER
+        if self.load() <= 1.0:
+            seconds = self.estimate(tiers[0], output_tokens, input_tokens, kind)
+            return Route(tiers[0]['model'], max_tokens, seconds, "no queueing")
+        reason = "no tiers"
+        for tier in tiers:
+            seconds = self.estimate(tier, output_tokens, input_tokens, kind)
+            if seconds > self.latency_budget:
+                reason = f"{tier['model']} estimated at {seconds:.1f}s with {self.in_flight} calls in flight"
+                continue
+            return Route(tier['model'], max_tokens, seconds, "within budget")
+        return Route(None, max_tokens, None, reason)
+
+    def route_results(self, results, tiers=STRUCTURING_TIERS, kind="structuring"):
+        """
+        route() for a list of raw results with 'text'
+        """
+        return self.route(len(results), sum(estimate_tokens(result['text']) for result in results), tiers, kind)
+
+    @contextmanager
+    def track(self, model, kind="structuring"):
+        """
+        Count an LLM call as in flight while the block runs
+
+        Every kind of call counts towards the queue depth, but only feeds the
+        latency estimate of its own kind.
+
+        Yields:
+            dict: Set 'prompt_tokens' and 'output_tokens' from the response usage; they are
+            recorded in the metrics and update the model's latency estimate
+        """
+        call = {'prompt_tokens': None, 'output_tokens': None}
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            yield call
+        finally:
+            elapsed = time.perf_counter() - started
+            record_llm_call(model, elapsed, call['prompt_tokens'], call['output_tokens'])
+            with self._lock:
+                self.in_flight -= 1
+                if call['output_tokens']:
+                    self._observe(kind, model, elapsed, call['output_tokens'], call['prompt_tokens'] or 0)
+
+    def _observe(self, kind, model, seconds, output_tokens, prompt_tokens=0):
+        tier = next((tier for tier in STRUCTURING_TIERS if tier['model'] == model), None)
+        if tier is None:
+            return
+        # Seconds per token under the current load, so queueing is not counted twice
+        fixed = tier['overhead_seconds'] + prompt_tokens * tier['seconds_per_input_token']
+        rate = max(0.0, seconds / self.load() - fixed) / output_tokens
+        previous = self._rates.get((kind, model), tier['seconds_per_token'])
+        self._rates[(kind, model)] = (1 - _RATE_SMOOTHING) * previous + _RATE_SMOOTHING * rate
+
+
+def chunk_results(results, size=STRUCTURING_CHUNK_SIZE):
+    """
+    Split results into structuring calls of at most size results each
+    """
+    return [results[start:start + size] for start in range(0, len(results), max(1, size))]
+
+
+def _full_descriptions(results):
+    # The whole CSV description per URL, from the lexical index, when it is available
+    try:
+        from lexical import get_lexical_index
+        index = get_lexical_index()
+        texts = dict(zip(index.urls, index.texts))
+    except Exception as e:
+        print(f"Template structuring falls back to retrieved chunks: {e}")
+        texts = {}
+    return [{'url': result['url'], 'text': texts.get(result['url'], result['text'])} for result in results]
+
+
+def template_servers(results):
+    """
+    Deterministic MCPServer objects built straight from the CSV descriptions, without an LLM
+
+    Args:
+        results (list): List of raw results with 'url' and 'text'
+
+    Returns:
+        list: List of MCPServer objects in the same order as results
+    """
+    LLM_CALLS.inc(model="template")
+    return [MCPServer(**template_record(row['url'], row['text'])) for row in _full_descriptions(results)]
+
+
+def template_summary(results):
+    """
+    Plain markdown summary of the results, one line per server, without an LLM
+    """
+    return "\n".join(
+        f"- **{server.url}**: {server.description}"
+        for server in template_servers(results)
+    )
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router():
+    """
+    Return the process-wide model router
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show how structuring calls are routed as load grows')
+    parser.add_argument('--counts', type=int, nargs='+', default=[1, 5, 10, 20, 100], help='Results per call')
+    parser.add_argument('--tokens-per-result', type=int, default=200, help='Input tokens per result')
+    parser.add_argument('--in-flight', type=int, nargs='+', default=[0, LLM_CONCURRENCY, 4 * LLM_CONCURRENCY],
+                        help='Simulated calls in flight')
+    args = parser.parse_args()
+
+    router = ModelRouter()
+    for in_flight in args.in_flight:
+        router.in_flight = in_flight
+        for count in args.counts:
+            route = router.route(count, count * args.tokens_per_result)
+            seconds = "-" if route.estimated_seconds is None else f"{route.estimated_seconds:.1f}s"
+            print(f"in_flight={in_flight:<4} count={count:<4} {route.model or 'template':<12} {seconds:>7}  {route.reason}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from binary_index import generation_file
+
+# "float" keeps the full matrix in memory; "int8" or "binary" search compact codes
+# and only read the float rows of the final candidates for rescoring
+VECTOR_STORAGE = os.getenv("MCP_VECTOR_STORAGE", "float")
+# Candidates kept per result after the Hamming pass, and after the int8 pass
+BINARY_OVERSAMPLE = int(os.getenv("MCP_BINARY_OVERSAMPLE", "20"))
+INT8_OVERSAMPLE = int(os.getenv("MCP_INT8_OVERSAMPLE", "4"))
+
+# Rows widened to float32 at a time in a full int8 scan, to bound temporary memory
+_SCORE_CHUNK = 8192
+
+CODES_FILE = "codes_int8.npy"
+SCALES_FILE = "scales.npy"
+BITS_FILE = "sign_bits.npy"
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+def _top(scores, count):
+    """
+    Positions of the count highest scores, best first
+    """
+    count = min(count, len(scores))
+    top = np.argpartition(-scores, count - 1)[:count]
+    return top[np.argsort(-scores[top])]
+
+
+class QuantizedVectors:
+    """
+    Compact copy of an embedding matrix for first-pass scoring.
+
+    Each row is stored as int8 codes with one float32 scale (symmetric, per
+    row), a quarter of the float32 size, and optionally as packed sign bits
+    (1 bit per dimension, 1/32 of the size). A search narrows the rows by
+    Hamming distance on the sign bits, then by int8 dot product, and finally
+    rescores the survivors against the float rows, which may be a read-only
+    memory map so that only those rows are ever read from disk.
+    """
+
+    def __init__(self, codes, scales, bits=None):
+        self.codes = codes
+        self.scales = scales
+        self.bits = bits
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def quantize(cls, embeddings, with_bits=True):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        bits = np.packbits(embeddings > 0, axis=1) if with_bits else None
+        return cls(codes, scales.astype(np.float32), bits)
+
+    def hamming_candidates(self, query_vector, count):
+        """
+        Rows whose sign bits differ least from the query's
+        """
+        query_bits = np.packbits(query_vector > 0)
+        bits = self.bits
+        if bits.shape[1] % 8 == 0:
+            # Count bits 64 at a time rather than byte by byte
+            bits = bits.view(np.uint64)
+            query_bits = query_bits.view(np.uint64)
+        distances = _popcount(np.bitwise_xor(bits, query_bits)).sum(axis=1, dtype=np.int32)
+        return _top(-distances.astype(np.float32), count)
+
+    def int8_scores(self, query_vector):
+        """
+        Approximate dot product of every row with the query, widening the codes block by block
+        """
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), _SCORE_CHUNK):
+            block = self.codes[start:start + _SCORE_CHUNK].astype(np.float32)
+            scores[start:start + len(block)] = block @ query_vector
+        return scores * self.scales
+
+    def search(self, query_vector, top_k=10, rescore_vectors=None, use_bits=True):
+        """
+        Approximate top_k rows by dot product
+
+        Args:
+            query_vector (np.ndarray): float32 query, same space as the indexed rows
+            rescore_vectors (np.ndarray): Optional float matrix (or memmap) for exact rescoring
+            use_bits (bool): Run the Hamming first pass when sign bits are available
+
+        Returns:
+            tuple: (row numbers, scores), best first
+        """
+        if not len(self.codes):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        if use_bits and self.bits is not None:
+            rows = self.hamming_candidates(query_vector, top_k * BINARY_OVERSAMPLE)
+            scores = (self.codes[rows].astype(np.float32) @ query_vector) * self.scales[rows]
+        else:
+            rows = np.arange(len(self.codes))
+            scores = self.int8_scores(query_vector)
+        keep = _top(scores, top_k * INT8_OVERSAMPLE if rescore_vectors is not None else top_k)
+        rows, scores = rows[keep], scores[keep]
+
+        if rescore_vectors is not None:
+            # Sorted row order keeps reads from a memory map sequential
+            order = np.argsort(rows)
+            rows = rows[order]
+            scores = np.asarray(rescore_vectors[rows], dtype=np.float32) @ query_vector
+            keep = _top(scores, top_k)
+            rows, scores = rows[keep], scores[keep]
+        return rows, scores
+
+    def save(self, path, generation=None):
+        """
+        Save the codes as sidecars of one generation of the binary index at path
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        codes_file, scales_file, bits_file = (
+            path / generation_file(name, generation) for name in (CODES_FILE, SCALES_FILE, BITS_FILE)
+        )
+        # Codes last: load() treats their presence as the codes being complete
+        _save_array(scales_file, self.scales)
+        if self.bits is not None:
+            _save_array(bits_file, self.bits)
+        else:
+            bits_file.unlink(missing_ok=True)
+        _save_array(codes_file, self.codes)
+
+    @classmethod
+    def load(cls, path, expected_rows=None, generation=None):
+        """
+        Load the codes saved for a generation, returning None if they are missing
+        or cover a different number of rows
+        """
+        path = Path(path)
+        codes_file, scales_file, bits_file = (
+            path / generation_file(name, generation) for name in (CODES_FILE, SCALES_FILE, BITS_FILE)
+        )
+        try:
+            codes = np.load(codes_file)
+            if expected_rows is not None and len(codes) != expected_rows:
+                print(f"Ignoring quantized vectors at {path}: built for {len(codes)} rows, not {expected_rows}")
+                return None
+            bits = np.load(bits_file) if bits_file.exists() else None
+            return cls(codes, np.load(scales_file), bits)
+        except FileNotFoundError:
+            # Not saved yet, or removed by a newer save of the index
+            return None
+
+
+def _save_array(path, array):
+    # Written under a temporary name and renamed, so a reader never sees half a file
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+# Representative searches from the directory, used when no query file is given
+SAMPLE_QUERIES = [
+    "web search", "browser automation", "postgres database", "github issues and pull requests",
+    "send slack messages", "read files from google drive", "stripe payments", "kubernetes cluster",
+    "vector database for embeddings", "scrape websites", "calendar events", "email inbox",
+    "observability and logs", "crypto wallet and blockchain", "generate images", "notion pages",
+]
+
+
+def recall_report(engine, queries, top_k=10):
+    """
+    Recall@k of int8 and binary+int8 search (both with float rescoring) against exact float search,
+    plus the in-memory size of each representation
+
+    Returns:
+        dict: Sizes in bytes and, per mode, 'recall' and 'mean_ms'
+    """
+    embeddings = np.asarray(engine.embeddings, dtype=np.float32)
+    quantized = QuantizedVectors.quantize(embeddings)
+    vectors = np.stack([engine.embed_query(query) for query in queries]).astype(np.float32)
+    truth = [set(_top(embeddings @ vector, top_k).tolist()) for vector in vectors]
+
+    report = {
+        'rows': len(embeddings),
+        'float32_bytes': int(embeddings.nbytes),
+        'int8_bytes': int(quantized.codes.nbytes + quantized.scales.nbytes),
+        'binary_bytes': int(quantized.bits.nbytes),
+    }
+    modes = {
+        'int8': lambda vector: quantized.search(vector, top_k, rescore_vectors=embeddings, use_bits=False),
+        'int8_no_rescore': lambda vector: quantized.search(vector, top_k, use_bits=False),
+        'binary+int8': lambda vector: quantized.search(vector, top_k, rescore_vectors=embeddings),
+    }
+    for name, search in modes.items():
+        hits = 0
+        started = time.perf_counter()
+        for vector, expected in zip(vectors, truth):
+            rows, _ = search(vector)
+            hits += len(expected & set(rows.tolist()))
+        report[name] = {
+            'recall': hits / sum(len(expected) for expected in truth),
+            'mean_ms': round((time.perf_counter() - started) * 1000 / len(vectors), 4),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize the local index and measure recall against float search')
+    parser.add_argument('--queries-file', type=str, help='File with one evaluation query per line')
+    parser.add_argument('--top-k', type=int, default=10, help='k for recall@k')
+    parser.add_argument('--save', action='store_true', help='Save the int8 and sign-bit codes next to the local index')
+    args = parser.parse_args()
+
+    from local_search import LOCAL_INDEX_PATH, get_local_engine
+    engine = get_local_engine()
+    queries = SAMPLE_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    report = recall_report(engine, queries, args.top_k)
+    print(f"{report['rows']} vectors: float32 {report['float32_bytes'] / 1e6:.2f} MB, "
+          f"int8 {report['int8_bytes'] / 1e6:.2f} MB, sign bits {report['binary_bytes'] / 1e6:.2f} MB")
+    for mode in ('int8', 'int8_no_rescore', 'binary+int8'):
+        print(f"{mode:<16} recall@{args.top_k}={report[mode]['recall']:.3f}  {report[mode]['mean_ms']:.3f} ms/query")
+
+    if args.save:
+        QuantizedVectors.quantize(engine.embeddings).save(LOCAL_INDEX_PATH, engine.generation)
+        print(f"Quantized vectors saved to {LOCAL_INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
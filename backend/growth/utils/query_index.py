@@ -6,22 +6,31 @@ from llama_index.embeddings.openai import OpenAIEmbedding
 # pip install llama-index-llms-openai
 # pip install llama-index-embeddings-openai
 # pip install llama-index-indices-managed-llama-cloud
-# pip install pandas
 # pip install python-dotenv
 # pip install requests
 
+import csv
+import hashlib
 import os
-import pandas as pd
+import sys
+import threading
+import time
 import numpy as np
 import json
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from dotenv import load_dotenv
 
+sys.path.append(str(Path(__file__).parent))
+from ingest import stream_ingest
+from llamacloud_client import get_llamacloud_client
+
 load_dotenv()
 
+# Concurrent upload workers for bulk loads
+UPSERT_WORKERS = int(os.getenv("MCP_UPSERT_WORKERS", "4"))
+
 def create_pipeline(api_key):
-    url = "https://api.cloud.llamaindex.ai/api/v1/pipelines"
-    
     payload = {
         "embedding_config": {
             "type": "OPENAI_EMBEDDING",
@@ -51,24 +60,9 @@ def create_pipeline(api_key):
         "pipeline_type": "MANAGED"
     }
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {api_key}'
-    }
-    
-    response = requests.post(url, headers=headers, json=payload)
-    return response.json()
+    return get_llamacloud_client(api_key).create_pipeline(payload)
 
-def upsert_documents(api_key, documents):
-    url = "https://api.cloud.llamaindex.ai/api/v1/pipelines"
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {api_key}'
-    }
-    
+def documents_payload(documents):
     # Convert documents to the expected format
     docs_payload = []
     for doc in documents:
@@ -76,13 +70,67 @@ def upsert_documents(api_key, documents):
             "text": doc.text,
             "metadata": doc.metadata
         })
-    
-    payload = {
-        "documents": docs_payload
-    }
-    
-    response = requests.put(url, headers=headers, json=payload)
-    return response.json()
+    return docs_payload
+
+def idempotency_key(pipeline_id, docs_payload):
+    # Same batch, same key: a retried or re-run upload is recognisable as a duplicate
+    body = json.dumps(docs_payload, sort_keys=True)
+    return hashlib.sha256(f"{pipeline_id}\n{body}".encode("utf-8")).hexdigest()
+
+def upsert_documents(api_key, documents, pipeline_id):
+    docs_payload = documents_payload(documents)
+    
+    # Reuses the pooled keep-alive session instead of a new connection per batch
+    return get_llamacloud_client(api_key).upsert_documents(
+        pipeline_id,
+        docs_payload,
+        headers={'Idempotency-Key': idempotency_key(pipeline_id, docs_payload)}
+    )
+
+class ConcurrentUploader:
+    """
+    Uploads document batches on a thread pool with a bounded number in flight.
+    
+    submit() blocks once max_in_flight batches are pending, so a streamed
+    input is never read further ahead than the uploads can keep up with.
+    Failed requests are retried by the shared LlamaCloud client; finish()
+    waits for everything and returns one aggregated summary.
+    """
+    
+    def __init__(self, api_key, pipeline_id, max_workers=UPSERT_WORKERS, max_in_flight=None):
+        self.api_key = api_key
+        self.pipeline_id = pipeline_id
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = threading.BoundedSemaphore(max_in_flight or max_workers * 2)
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.summary = {'batches': 0, 'succeeded': 0, 'failed': 0, 'documents': 0, 'errors': []}
+    
+    def _upload(self, batch_number, batch):
+        try:
+            # LlamaCloudClient.request already retries transient failures with backoff
+            upsert_documents(self.api_key, batch, self.pipeline_id)
+            with self.lock:
+                self.summary['succeeded'] += 1
+                self.summary['documents'] += len(batch)
+        except Exception as e:
+            with self.lock:
+                self.summary['failed'] += 1
+                self.summary['errors'].append(f"batch {batch_number}: {e}")
+        finally:
+            self.slots.release()
+    
+    def submit(self, batch):
+        self.slots.acquire()
+        with self.lock:
+            self.summary['batches'] += 1
+            batch_number = self.summary['batches']
+        self.executor.submit(self._upload, batch_number, batch)
+    
+    def finish(self):
+        self.executor.shutdown(wait=True)
+        self.summary['elapsed_seconds'] = round(time.perf_counter() - self.started, 2)
+        return self.summary
 
 def create_and_upsert_index():
     # Configure LlamaIndex settings
@@ -102,37 +150,36 @@ def create_and_upsert_index():
     pipeline = create_pipeline(api_key)
     print("Pipeline created:", pipeline)
     
-    # Read the CSV file
+    # Stream the CSV so only a few batches of documents are in memory at a time
     csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'source', 'MCP_description.csv')
-    df = pd.read_csv(csv_path)
-    
-    # Create documents for each row
-    documents = []
-    for idx, row in df.iterrows():
-        # Skip rows where Description is NaN
-        if pd.isna(row['Description']) or pd.isna(row['URL']):
-            print(f"Skipping row {idx} due to missing data")
-            continue
-            
-        # Create a document with the description as the text content
-        doc = Document(
-            text=str(row['Description']).strip(),
-            metadata={
-                'url': str(row['URL']).strip(),
-                'id': f"doc_{idx}"
-            }
-        )
-        documents.append(doc)
-    
-    print(f"Upserting {len(documents)} documents...")
-    
-    # Use batch processing for better performance
-    batch_size = 20
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i + batch_size]
-        response = upsert_documents(api_key, batch)
-        print(f"Upserted batch {i//batch_size + 1} of {(len(documents)-1)//batch_size + 1}")
-        print("Response:", response)
+    
+    def iter_documents():
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            for idx, row in enumerate(csv.DictReader(f)):
+                # Skip rows with a missing Description or URL
+                if not (row.get('Description') or '').strip() or not (row.get('URL') or '').strip():
+                    print(f"Skipping row {idx} due to missing data")
+                    continue
+                
+                # Create a document with the description as the text content
+                yield Document(
+                    text=row['Description'].strip(),
+                    metadata={
+                        'url': row['URL'].strip(),
+                        'id': f"doc_{idx}"
+                    }
+                )
+    
+    uploader = ConcurrentUploader(api_key, pipeline['id'])
+    
+    # The pipeline embeds server-side, so batches go straight to the uploader
+    stream_ingest(iter_documents(), lambda batch, _embeddings: uploader.submit(batch), max_batch_items=20)
+    summary = uploader.finish()
+    
+    print(f"Upserted {summary['documents']} documents in {summary['succeeded']} of {summary['batches']} batches "
+          f"({summary['failed']} failed, {summary['elapsed_seconds']}s)")
+    for error in summary['errors']:
+        print(f"  {error}")
     
     print("Upsert complete!")
     return index
@@ -1,10 +1,21 @@
+import hashlib
 import os
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 from llama_index.core import StorageContext
 from llama_index.core.indices.loading import load_index_from_storage
+from llama_index.core.schema import NodeWithScore, TextNode
 from llama_index.core.settings import Settings
 from llama_index.embeddings.openai import OpenAIEmbedding
+import sys
+
+sys.path.append(str(Path(__file__).parent))
+from embedding_cache import CachedEmbedding
+from manifest import MANIFEST_NAME
+from lexical import HYBRID_SEARCH, hybrid_search
+from local_search import LocalVectorEngine, OpenAIEmbedder
 
 # Load environment variables
 load_dotenv()
@@ -12,30 +23,139 @@ load_dotenv()
 # Get API key from environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Default index path
+INDEX_PATH = Path("./storage/mcp_index")
+# Memory-mapped export written next to the index by upsert_mcp_data
+BINARY_INDEX_DIR = "binary"
+
+class IndexManager:
+    """
+    Process-wide owner of the loaded index.
+    
+    The index is loaded lazily on first use and shared by every request. At most
+    every `check_interval` seconds the storage directory is checked, and the
+    index is reloaded when any of its files (including the manifest) changed.
+    
+    When the binary export exists, searches are served from it: opening it
+    only maps the files, so there is no JSON to parse at startup and worker
+    processes share the pages. The LlamaIndex index is then only loaded if
+    get_index() is called.
+    """
+    
+    def __init__(self, index_path=INDEX_PATH, check_interval=5.0):
+        self.index_path = Path(index_path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._embed_model = None
+        self._index = None
+        self._engine = None
+        self._loaded = False
+        self._retrievers = {}
+        self._signature = None
+        self._last_check = 0.0
+    
+    def _storage_signature(self):
+        """
+        Fingerprint of the storage directory: its own mtime, the mtime and size
+        of each file, and the manifest contents
+        """
+        if not self.index_path.exists():
+            return None
+        entries = [("", self.index_path.stat().st_mtime_ns, 0)]
+        with os.scandir(self.index_path) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        manifest_path = self.index_path / MANIFEST_NAME
+        manifest_hash = hashlib.sha256(manifest_path.read_bytes()).hexdigest() if manifest_path.exists() else None
+        return (tuple(sorted(entries)), manifest_hash)
+    
+    def _load(self, signature):
+        if signature is None:
+            raise FileNotFoundError(f"Index not found at {self.index_path}. Please create the index first using upsert_mcp_data.py")
+        
+        started = time.perf_counter()
+        self._index = None
+        self._retrievers = {}
+        self._engine = LocalVectorEngine.load(self.index_path / BINARY_INDEX_DIR, OpenAIEmbedder())
+        if self._engine is not None:
+            print(f"Opened binary index at {self.index_path / BINARY_INDEX_DIR} in {time.perf_counter() - started:.3f}s")
+        else:
+            self._load_index()
+        self._signature = signature
+        self._loaded = True
+    
+    def _load_index(self):
+        if self._embed_model is None:
+            # Configure the same embedding model as used for creation, once per process;
+            # repeated queries are served from the embedding cache
+            self._embed_model = CachedEmbedding(OpenAIEmbedding(
+                model="text-embedding-3-small",
+                api_key=OPENAI_API_KEY,
+                dimensions=1536
+            ))
+            Settings.embed_model = self._embed_model
+        
+        started = time.perf_counter()
+        storage_context = StorageContext.from_defaults(persist_dir=str(self.index_path))
+        index = load_index_from_storage(storage_context, embed_model=self._embed_model)
+        print(f"Loaded index from {self.index_path} in {time.perf_counter() - started:.2f}s")
+        
+        self._index = index
+    
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._last_check < self.check_interval:
+                return
+            signature = self._storage_signature()
+            if not self._loaded or signature != self._signature:
+                if self._loaded:
+                    print(f"Index at {self.index_path} changed on disk, reloading")
+                self._load(signature)
+            self._last_check = now
+    
+    def get_index(self):
+        """
+        Return the shared index, loading or reloading it if needed
+        """
+        self._refresh()
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            return self._index
+    
+    def get_engine(self):
+        """
+        Return the memory-mapped engine, or None if the index has no binary export
+        """
+        self._refresh()
+        return self._engine
+    
+    def get_retriever(self, similarity_top_k):
+        """
+        Return a shared retriever for the current index and the given top_k
+        """
+        index = self.get_index()
+        with self._lock:
+            retriever = self._retrievers.get(similarity_top_k)
+            if retriever is None:
+                retriever = index.as_retriever(similarity_top_k=similarity_top_k)
+                self._retrievers[similarity_top_k] = retriever
+            return retriever
+
+index_manager = IndexManager()
+
 def initialize_search():
     """
     Initialize the search functionality by loading the index and configuring the embedding model
+    
+    The index is loaded once per process and kept warm by index_manager.
     """
-    # Configure the same embedding model as used for creation
-    embed_model = OpenAIEmbedding(
-        model="text-embedding-3-small",
-        api_key=OPENAI_API_KEY,
-        dimensions=1536
-    )
-    
-    # Configure settings with the embedding model
-    Settings.embed_model = embed_model
-    
-    # Default index path
-    index_path = Path("./storage/mcp_index")
-    
-    if not index_path.exists():
-        raise FileNotFoundError(f"Index not found at {index_path}. Please create the index first using upsert_mcp_data.py")
-    
-    # Load the index
-    storage_context = StorageContext.from_defaults(persist_dir=str(index_path))
-    index = load_index_from_storage(storage_context)
-    return index
+    return index_manager.get_index()
 
 def search_mcp(query: str, top_k: int = 5):
     """
@@ -48,11 +168,14 @@ def search_mcp(query: str, top_k: int = 5):
     Returns:
         list: List of search results with their scores and metadata
     """
-    try:
-        index = initialize_search()
+    def vector_search(query, k):
+        # The memory-mapped engine already returns the best chunk per URL
+        engine = index_manager.get_engine()
+        if engine is not None:
+            return engine.search(query, top_k=k)
         
-        # Create retriever with specified number of results
-        retriever = index.as_retriever(similarity_top_k=top_k * 2)
+        # Reuse the warm retriever for this number of results
+        retriever = index_manager.get_retriever(k * 2)
         
         # Get results
         results = retriever.retrieve(query)
@@ -64,14 +187,29 @@ def search_mcp(query: str, top_k: int = 5):
             if url not in grouped_results or result.score > grouped_results[url].score:
                 grouped_results[url] = result
         
-        # Sort and limit to top_k results
+        # Sort and limit to k results
         final_results = sorted(
             grouped_results.values(),
             key=lambda x: x.score,
             reverse=True
-        )[:top_k]
+        )[:k]
+        return [
+            {'url': result.metadata.get('url'), 'text': result.text, 'score': result.score, 'node': result}
+            for result in final_results
+        ]
+    
+    def as_node(result):
+        # Results from the binary engine or BM25 get a node built from their text
+        if 'node' in result:
+            return NodeWithScore(node=result['node'].node, score=result['score'])
+        return NodeWithScore(node=TextNode(text=result['text'], metadata={'url': result['url']}), score=result['score'])
+    
+    try:
+        if not HYBRID_SEARCH:
+            return [as_node(result) for result in vector_search(query, top_k)]
         
-        return final_results
+        # Fuse with BM25
+        return [as_node(result) for result in hybrid_search(query, top_k, vector_search)]
         
     except Exception as e:
         print(f"Error during search: {e}")
@@ -131,8 +131,23 @@ import os
 from dotenv import load_dotenv
 from openai import OpenAI  # Import the OpenAI client
 from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
-from pydantic import BaseModel
-import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+from structured_cache import get_structured_cache
+from structuring import (
+    MCPServer, STRUCTURED_RESPONSE_FORMAT, STRUCTURING_SYSTEM_PROMPT, JsonObjectStreamParser,
+    format_results_for_llm, parse_servers
+)
+from catalog import get_catalog
+from local_search import get_local_engine
+from lexical import HYBRID_SEARCH, hybrid_search, hybrid_search_batch
+from metrics import record_cache, stage
+from model_router import (
+    LLM_CONCURRENCY, SUMMARY_TIERS, chunk_results, get_model_router, template_servers, template_summary
+)
 
 
 # Load environment variables
@@ -143,20 +158,27 @@ load_dotenv()
 # Initialize the OpenAI client
 client = OpenAI()
 LLAMA_CLOUD_API_KEY=os.getenv("LLAMA_CLOUD_API_KEY")
-# Initialize the LlamaCloudIndex
-index = LlamaCloudIndex(
-    # name="frequent-primate-2025-04-08",
-    name="elegant-hawk-2025-04-08",
-    project_name="Default",
-    organization_id="8e327feb-280a-4a46-abcb-67662f3a4522",
-    api_key=LLAMA_CLOUD_API_KEY  # Ensure this key is set in your .env file
-)
+# Retrieval backend: "cloud" (LlamaCloud) or "local" (in-process NumPy engine)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "cloud")
+# Concurrent LlamaCloud retrievals per batch search
+CLOUD_BATCH_WORKERS = int(os.getenv("MCP_CLOUD_BATCH_WORKERS", "8"))
 
-class MCPServer(BaseModel):
-    url: str
-    description: str
-    what_can_it_do: str
-    why_is_it_useful: str
+index = None
+
+def get_cloud_index():
+    """
+    Return the LlamaCloudIndex, connecting on first use so the local backend never needs it
+    """
+    global index
+    if index is None:
+        index = LlamaCloudIndex(
+            # name="frequent-primate-2025-04-08",
+            name="elegant-hawk-2025-04-08",
+            project_name="Default",
+            organization_id="8e327feb-280a-4a46-abcb-67662f3a4522",
+            api_key=LLAMA_CLOUD_API_KEY  # Ensure this key is set in your .env file
+        )
+    return index
 
 def summarize_results_with_llm(results):
     """
@@ -182,133 +204,421 @@ def summarize_results_with_llm(results):
         "Keep the summary concise and to the point. Use markdown formatting whenever possible to separate each MCP server description. It should be very easy to distinguish each MCP server description, and their URLs."
     )
     
+    router = get_model_router()
+    route = router.route_results(results, SUMMARY_TIERS, kind="summary")
+    if route.model is None:
+        print(f"Summarizing from templates: {route.reason}")
+        return template_summary(results)
+    
     # Call the LLM
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user",
-                "content": input_text
-            }
-        ],
-        temperature=0.1  # Set low temperature for deterministic output
-    )
+    with router.track(route.model, kind="summary") as call:
+        response = client.chat.completions.create(
+            model=route.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": input_text
+                }
+            ],
+            temperature=0.1  # Set low temperature for deterministic output
+        )
+        if response.usage:
+            call['prompt_tokens'] = response.usage.prompt_tokens
+            call['output_tokens'] = response.usage.completion_tokens
     
     # Extract the summary from the response
     summary = response.choices[0].message.content.strip()
     return summary
 
-def convert_to_structured_objects(results):
+def convert_to_structured_objects(results, route=None):
     """
     Use LLM to convert results into structured MCPServer objects
     
     Args:
         results (list): List of raw results from RAG
+        route (Route): Model tier from the router (default: routed here)
         
     Returns:
-        list: List of structured MCPServer objects
+        list: List of structured MCPServer objects, from templates if no tier fits the latency budget
     """
+    router = get_model_router()
+    route = route or router.route_results(results)
+    if route.model is None:
+        print(f"Structuring {len(results)} results from templates: {route.reason}")
+        return template_servers(results)
+    
     # Prepare the input for the LLM
-    input_text = "\n".join([
-        f"URL: {result['url']}\nDescription: {result['text']}"
-        for result in results
-    ])
+    input_text = format_results_for_llm(results)
     
     # Define the system prompt
-    system_prompt = (
-        "You are an AI assistant. Convert the following MCP server descriptions into structured JSON objects. "
-        "Each object should contain a 'url', 'description', 'what_can_it_do', and 'why_is_it_useful'. Output the objects in a JSON array format."
-    )
+    system_prompt = STRUCTURING_SYSTEM_PROMPT
     
-    # Call the LLM
-    response = client.chat.completions.create(
-        model="gpt-4o",  # Consider switching back to gpt-4 for better output
+    # Call the LLM; the schema rules out fences and stray text, the cap scales with the result count
+    with router.track(route.model) as call:
+        response = client.chat.completions.create(
+            model=route.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": input_text
+                }
+            ],
+            response_format=STRUCTURED_RESPONSE_FORMAT,
+            max_tokens=route.max_tokens,
+            temperature=0.1  # Set low temperature for deterministic output
+        )
+        if response.usage:
+            call['prompt_tokens'] = response.usage.prompt_tokens
+            call['output_tokens'] = response.usage.completion_tokens
+    
+    # Extract the structured objects from the response
+    return parse_servers(response.choices[0].message.content)
+
+def lookup_structured(raw_results):
+    """
+    Look raw results up in the prebuilt catalog, then the structured cache
+    
+    Args:
+        raw_results (list): List of raw results with 'url' and 'text'
+        
+    Returns:
+        tuple: (dict of url -> MCPServer found, list of distinct raw results still missing)
+    """
+    catalog = get_catalog()
+    cache = get_structured_cache()
+    
+    found = {}
+    misses = []
+    catalog_hits = cache_hits = 0
+    for result in raw_results:
+        record = catalog.get(result['url'])
+        if record is not None:
+            catalog_hits += 1
+        else:
+            record = cache.get(result['url'], result['text'])
+            cache_hits += record is not None
+        if record is not None:
+            found[result['url']] = MCPServer(**record)
+        elif all(miss['url'] != result['url'] for miss in misses):
+            misses.append(result)
+    
+    record_cache("catalog", True, catalog_hits)
+    record_cache("catalog", False, len(raw_results) - catalog_hits)
+    record_cache("structured", True, cache_hits)
+    record_cache("structured", False, len(raw_results) - catalog_hits - cache_hits)
+    print(f"Structured lookup: {len(found)} hits, {len(misses)} misses")
+    return found, misses
+
+def structure_by_url(raw_results):
+    """
+    Structure raw results from the prebuilt catalog, then the cache, and only
+    call the LLM for servers found in neither, STRUCTURING_CHUNK_SIZE results
+    per call with the calls running concurrently
+    
+    Args:
+        raw_results (list): List of raw results with 'url' and 'text'
+        
+    Returns:
+        dict: url -> MCPServer for every result that could be structured
+    """
+    with stage("structure"):
+        return _structure_by_url(raw_results)
+
+def match_structured(results, structured):
+    """
+    Pair the objects of a structuring call with the raw results they came from
+    
+    Returns:
+        dict: url -> MCPServer for every result the LLM returned an object for
+    """
+    by_url = {server.url: server for server in structured}
+    found = {}
+    for position, result in enumerate(results):
+        server = by_url.get(result['url'])
+        # The LLM sometimes rewrites URLs slightly; fall back to the input order
+        if server is None and len(structured) == len(results):
+            server = structured[position]
+        if server is not None:
+            found[result['url']] = server
+    return found
+
+def _structure_chunk(chunk):
+    # Routed when the call starts, so chunks that start later see the calls already in flight
+    route = get_model_router().route_results(chunk)
+    if route.model is None:
+        print(f"Structuring {len(chunk)} results from templates: {route.reason}")
+        return {result['url']: server for result, server in zip(chunk, template_servers(chunk))}, False
+    return match_structured(chunk, convert_to_structured_objects(chunk, route)), True
+
+def cache_structured(misses, outcomes):
+    """
+    Store the LLM-structured objects of each chunk in the structured cache
+    
+    Template cards are only a stand-in under load, so they are not cached.
+    
+    Args:
+        misses (list): Raw results that were structured
+        outcomes (list): (url -> MCPServer, True if the LLM produced them) per chunk
+        
+    Returns:
+        dict: url -> MCPServer for every chunk
+    """
+    cache = get_structured_cache()
+    texts = {miss['url']: miss['text'] for miss in misses}
+    found = {}
+    for servers, from_llm in outcomes:
+        found.update(servers)
+        if from_llm:
+            for url, server in servers.items():
+                cache.put(url, texts[url], server.model_dump())
+    return found
+
+def _structure_by_url(raw_results):
+    cached, misses = lookup_structured(raw_results)
+    if not misses:
+        return cached
+    
+    chunks = chunk_results(misses)
+    if len(chunks) == 1:
+        outcomes = [_structure_chunk(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), LLM_CONCURRENCY)) as executor:
+            outcomes = list(executor.map(_structure_chunk, chunks))
+    cached.update(cache_structured(misses, outcomes))
+    if any(from_llm for _, from_llm in outcomes):
+        get_structured_cache().save()
+    return cached
+
+def structure_with_cache(raw_results):
+    """
+    Structure raw results, using the LLM only for unseen servers
+    
+    Args:
+        raw_results (list): List of raw results with 'url' and 'text'
+        
+    Returns:
+        list: List of MCPServer objects in the same order as raw_results
+    """
+    structured = structure_by_url(raw_results)
+    return [structured[result['url']] for result in raw_results if result['url'] in structured]
+
+def stream_structured_objects(results, route=None):
+    """
+    Stream MCPServer objects out of the LLM completion as each one is finished
+    
+    Args:
+        results (list): List of raw results with 'url' and 'text'
+        route (Route): Model tier from the router (default: routed here)
+        
+    Yields:
+        tuple: (raw result the object belongs to, MCPServer)
+    """
+    router = get_model_router()
+    route = route or router.route_results(results)
+    if route.model is None:
+        yield from zip(results, template_servers(results))
+        return
+    with router.track(route.model):
+        yield from _stream_structured(results, route)
+
+def _stream_structured(results, route):
+    stream = client.chat.completions.create(
+        model=route.model,
         messages=[
             {
                 "role": "system",
-                "content": system_prompt
+                "content": STRUCTURING_SYSTEM_PROMPT
             },
             {
                 "role": "user",
-                "content": input_text
+                "content": format_results_for_llm(results)
             }
         ],
-        temperature=0.1  # Set low temperature for deterministic output
+        response_format=STRUCTURED_RESPONSE_FORMAT,
+        max_tokens=route.max_tokens,
+        temperature=0.1,
+        stream=True
     )
     
-    # Extract the structured objects from the response
-    structured_objects = response.choices[0].message.content.strip()
-    print(f"LLM Output (raw): {structured_objects}")  # Detailed logging for inspection
-    
-    # Remove Markdown formatting (triple backticks and json label)
-    if structured_objects.startswith('```json') and structured_objects.endswith('```'):
-        structured_objects = structured_objects[7:-3].strip()
-    elif structured_objects.startswith('```') and structured_objects.endswith('```'):
-        structured_objects = structured_objects[3:-3].strip()
-    
-    print(f"LLM Output (cleaned): {structured_objects}")  # Log cleaned output
+    parser = JsonObjectStreamParser()
+    by_url = {result['url']: result for result in results}
+    position = 0
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        for obj in parser.feed(delta):
+            # Objects come back in input order, so fall back to position if the URL was rewritten
+            source = by_url.get(obj.get('url'))
+            if source is None and position < len(results):
+                source = results[position]
+            position += 1
+            try:
+                server = MCPServer(**obj)
+            except Exception as e:
+                print(f"Error converting streamed object: {e}")
+                continue
+            yield source, server
+
+def stream_search_mcp(query: str, top_k: int = 5, backend: str = None):
+    """
+    Search the MCP index and yield events as soon as each piece is available
     
-    # Check if the structured_objects is empty
-    if not structured_objects:
-        print("Error: LLM output is empty.")
-        return []
+    Events are dicts with an 'event' key:
+      - 'hits': the raw retrieval hits (url and score), sent first
+      - 'result': one structured MCPServer with its 'rank' among the hits
+      - 'done' or 'error': sent last
     
-    # Convert the structured objects into MCPServer instances
+    Args:
+        query (str): The search query
+        top_k (int): Number of results to return (default: 5)
+        backend (str): Retrieval backend, "cloud" or "local" (default: SEARCH_BACKEND)
+    """
     try:
-        structured_results = json.loads(structured_objects)  # Use json.loads for safe parsing
-        return [MCPServer(**obj) for obj in structured_results]
-    except json.JSONDecodeError as e:
-        print(f"JSON decoding error: {e}")
-        # Attempt to clean the output and retry parsing
-        try:
-            # Remove any leading/trailing whitespace and retry
-            cleaned_output = structured_objects.strip()
-            structured_results = json.loads(cleaned_output)
-            return [MCPServer(**obj) for obj in structured_results]
-        except json.JSONDecodeError as e:
-            print(f"Retry JSON decoding error: {e}")
-            return []
+        raw_results = retrieve(query, top_k=top_k, backend=backend)
+        ranks = {}
+        for rank, result in enumerate(raw_results):
+            ranks.setdefault(result['url'], rank)
+        
+        yield {
+            'event': 'hits',
+            'query': query,
+            'hits': [{'url': result['url'], 'score': result.get('score')} for result in raw_results]
+        }
+        
+        found, misses = lookup_structured(raw_results)
+        for url, server in found.items():
+            yield {'event': 'result', 'rank': ranks[url], 'result': server.model_dump()}
+        
+        sent = len(found)
+        route = get_model_router().route_results(misses) if misses else None
+        if misses and route.model is None:
+            print(f"Structuring {len(misses)} streamed results from templates: {route.reason}")
+            for miss, server in zip(misses, template_servers(misses)):
+                yield {'event': 'result', 'rank': ranks[miss['url']], 'result': server.model_dump()}
+                sent += 1
+        elif misses:
+            cache = get_structured_cache()
+            for source, server in stream_structured_objects(misses, route):
+                if source is not None:
+                    cache.put(source['url'], source['text'], server.model_dump())
+                url = source['url'] if source is not None else server.url
+                yield {'event': 'result', 'rank': ranks.get(url, sent), 'result': server.model_dump()}
+                sent += 1
+            cache.save()
+        
+        yield {'event': 'done', 'count': sent}
+        
     except Exception as e:
-        print(f"Error converting to structured objects: {e}")
-        return []
+        print(f"Error during streaming search: {e}")
+        yield {'event': 'error', 'error': str(e)}
 
-def search_mcp(query: str, top_k: int = 5):
+def retrieve_vector(query: str, top_k: int = 5, backend: str = None):
+    """
+    Retrieve the top_k results for a query by embedding similarity alone
+    
+    Returns:
+        list: List of dicts with 'url', 'text' and 'score'
+    """
+    backend = backend or SEARCH_BACKEND
+    if backend == "local":
+        return get_local_engine().search(query, top_k=top_k)
+    if backend != "cloud":
+        raise ValueError(f"Unknown search backend: {backend}")
+    
+    # Retrieve nodes from the cloud index (LlamaCloud embeds the query server-side)
+    with stage("cloud_retrieve"):
+        nodes = get_cloud_index().as_retriever().retrieve(query)
+    
+    # Sort and limit to top_k results
+    final_results = sorted(
+        nodes,
+        key=lambda x: x.score,
+        reverse=True
+    )[:top_k]
+    
+    return [
+        {
+            'url': node.metadata.get('url', 'N/A'),
+            'text': node.text,
+            'score': node.score
+        }
+        for node in final_results
+    ]
+
+def retrieve(query: str, top_k: int = 5, backend: str = None):
+    """
+    Retrieve the top_k raw results for a query from the configured backend,
+    fused with BM25 so exact server names rank reliably
+    
+    Args:
+        query (str): The search query
+        top_k (int): Number of results to return
+        backend (str): "cloud" or "local" (default: SEARCH_BACKEND)
+        
+    Returns:
+        list: List of dicts with 'url', 'text' and 'score'
+    """
+    with stage("retrieve"):
+        if not HYBRID_SEARCH:
+            return retrieve_vector(query, top_k, backend)
+        return hybrid_search(query, top_k, lambda q, k: retrieve_vector(q, k, backend))
+
+def retrieve_vector_batch(queries, top_k: int = 5, backend: str = None):
+    """
+    retrieve_vector for several queries. The local backend embeds them in one
+    call and scores them in one matrix product; LlamaCloud has no batch
+    retrieval, so cloud queries run concurrently instead.
+    
+    Returns:
+        list: One list of {'url', 'text', 'score'} dicts per query
+    """
+    backend = backend or SEARCH_BACKEND
+    if backend == "local":
+        return get_local_engine().search_batch(queries, top_k=top_k)
+    if backend != "cloud":
+        raise ValueError(f"Unknown search backend: {backend}")
+    
+    with ThreadPoolExecutor(max_workers=min(CLOUD_BATCH_WORKERS, max(1, len(queries)))) as executor:
+        return list(executor.map(lambda query: retrieve_vector(query, top_k, backend), queries))
+
+def retrieve_batch(queries, top_k: int = 5, backend: str = None):
+    """
+    retrieve for several queries, with one vector retrieval pass for all of them
+    
+    Returns:
+        list: One list of {'url', 'text', 'score'} dicts per query
+    """
+    with stage("retrieve_batch"):
+        if not HYBRID_SEARCH:
+            return retrieve_vector_batch(queries, top_k, backend)
+        return hybrid_search_batch(queries, top_k, lambda qs, k: retrieve_vector_batch(qs, k, backend))
+
+def search_mcp(query: str, top_k: int = 5, backend: str = None):
     """
     Search the MCP index with a natural language query and return structured results
     
     Args:
         query (str): The search query
         top_k (int): Number of results to return (default: 5)
+        backend (str): Retrieval backend, "cloud" or "local" (default: SEARCH_BACKEND)
         
     Returns:
         dict: Dictionary containing the query and structured results
     """
     try:
-        # Retrieve nodes from the cloud index
-        nodes = index.as_retriever().retrieve(query)
-        
-        # Sort and limit to top_k results
-        final_results = sorted(
-            nodes,
-            key=lambda x: x.score,
-            reverse=True
-        )[:top_k]
+        raw_results = retrieve(query, top_k=top_k, backend=backend)
         
-        # Ensure results are in the correct format
-        raw_results = [
-            {
-                'url': node.metadata.get('url', 'N/A'),
-                'text': node.text
-            }
-            for node in final_results
-        ]
-        
-        # Convert raw results to structured objects using LLM
-        structured_results = convert_to_structured_objects(raw_results)
+        # Convert raw results to structured objects, using the LLM only for unseen servers
+        structured_results = structure_with_cache(raw_results)
         
         return {
             'query': query,
@@ -323,16 +633,61 @@ def search_mcp(query: str, top_k: int = 5):
             'error': str(e)
         }
 
+def search_mcp_batch(queries, top_k: int = 5, backend: str = None):
+    """
+    Search the MCP index for several queries at once
+    
+    Retrieval is batched (see retrieve_batch) and the results of all queries
+    are structured together, so servers shared between queries are looked up
+    once and the catalog and cache misses of all queries share the same
+    concurrent structuring calls.
+    
+    Args:
+        queries (list): The search queries
+        top_k (int): Number of results per query (default: 5)
+        backend (str): Retrieval backend, "cloud" or "local" (default: SEARCH_BACKEND)
+        
+    Returns:
+        dict: Dictionary with 'results', one {'query', 'results'} dict per query in input order
+    """
+    try:
+        # Repeated queries are retrieved once
+        distinct = list(dict.fromkeys(queries))
+        raw_by_query = dict(zip(distinct, retrieve_batch(distinct, top_k=top_k, backend=backend)))
+        
+        structured = structure_by_url([result for raw in raw_by_query.values() for result in raw])
+        
+        return {
+            'results': [
+                {
+                    'query': query,
+                    'results': [
+                        structured[result['url']].model_dump()
+                        for result in raw_by_query[query] if result['url'] in structured
+                    ]
+                }
+                for query in queries
+            ]
+        }
+        
+    except Exception as e:
+        print(f"Error during batch search: {e}")
+        return {
+            'results': [{'query': query, 'results': []} for query in queries],
+            'error': str(e)
+        }
+
 def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='Search MCP Descriptions')
     parser.add_argument('query', type=str, help='The search query')
     parser.add_argument('--top-k', type=int, default=2, help='Number of results to return')
+    parser.add_argument('--backend', type=str, choices=['cloud', 'local'], help='Retrieval backend (default: SEARCH_BACKEND)')
     
     args = parser.parse_args()
     
-    results = search_mcp(args.query, args.top_k)
+    results = search_mcp(args.query, args.top_k, backend=args.backend)
     
     print(results['results'])  # Print results instead of summary
 
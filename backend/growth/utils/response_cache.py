@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from catalog import CATALOG_PATH
+from embedding_cache import normalize_query
+from lexical import LEXICAL_INDEX_PATH
+from local_search import LOCAL_INDEX_PATH
+from manifest import MANIFEST_NAME, cloud_manifest_path
+from metrics import record_cache
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("MCP_RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+# The cloud index can also change outside this process, so entries expire even without a rebuild
+RESPONSE_CACHE_TTL = int(os.getenv("MCP_RESPONSE_CACHE_TTL", "3600"))
+# Optional on-disk tier shared across restarts and workers, e.g. ./storage/responses.sqlite
+RESPONSE_CACHE_DB = os.getenv("MCP_RESPONSE_CACHE_DB")
+# max-age sent with GET /api/search responses, for browsers and CDNs
+SEARCH_MAX_AGE = int(os.getenv("MCP_SEARCH_MAX_AGE", "300"))
+# Bump to invalidate every cached response, e.g. after re-ingesting straight into LlamaCloud
+INDEX_VERSION_OVERRIDE = os.getenv("MCP_INDEX_VERSION", "")
+# The index files are stat'ed at most this often; a rebuild is noticed within this delay
+INDEX_VERSION_CHECK_SECONDS = float(os.getenv("MCP_INDEX_VERSION_CHECK_SECONDS", "1.0"))
+
+DEFAULT_INDEX_PATH = "./storage/mcp_index"
+
+
+def _index_files():
+    """
+    Files rewritten by every ingest or rebuild; their size and mtime make up the index version
+    """
+    return [
+        Path(DEFAULT_INDEX_PATH) / MANIFEST_NAME,
+        Path(DEFAULT_INDEX_PATH) / "binary" / "header.json",
+        Path(LOCAL_INDEX_PATH) / "header.json",
+        Path(LEXICAL_INDEX_PATH) / "documents.json",
+        Path(CATALOG_PATH),
+        cloud_manifest_path(),
+    ]
+
+
+_versions = {}
+
+
+def index_version(backend=None):
+    """
+    Short fingerprint of the indexes a search reads. It changes whenever an
+    ingest run rewrites one of them, which invalidates every cached response.
+    The fingerprint is reused for INDEX_VERSION_CHECK_SECONDS between checks.
+    """
+    checked_at, version = _versions.get(backend, (None, None))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at >= INDEX_VERSION_CHECK_SECONDS:
+        version = _fingerprint(backend)
+        _versions[backend] = (now, version)
+    return version
+
+
+def _fingerprint(backend):
+    parts = [backend or "", INDEX_VERSION_OVERRIDE]
+    for path in _index_files():
+        try:
+            stat = path.stat()
+            parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            parts.append("-")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def response_key(query, top_k, version):
+    """
+    Cache key of a search: index version, top_k and normalized query
+    """
+    return hashlib.sha256(f"{version}|{int(top_k)}|{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+def render(entry, query):
+    """
+    JSON body and ETag of a cached search for the query as the client spelled it
+
+    The results are stored already serialised, so a hit only encodes the query string.
+
+    Returns:
+        tuple: (body, etag)
+    """
+    body = '{"query": ' + json.dumps(query) + ', "results": ' + entry['results'] + '}'
+    etag = hashlib.sha256(f"{query}\0{entry['digest']}".encode("utf-8")).hexdigest()[:32]
+    return body, etag
+
+
+class ResponseCache:
+    """
+    Two-tier cache of search results keyed by response_key().
+
+    The first tier is a bounded in-memory LRU; the optional second tier is a
+    SQLite table. Entries hold the results as a JSON string plus its digest,
+    and are dropped when the index version they were computed against changes
+    or when they outlive the TTL.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL,
+                 sqlite_path=RESPONSE_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, version TEXT NOT NULL, stored_at REAL NOT NULL, results TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def _check_version(self, version):
+        # Called with the lock held: a new index version drops everything computed against the old one
+        if version == self._version:
+            return
+        if self._version is not None:
+            print(f"Index version changed to {version}, clearing {len(self._entries)} cached responses")
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE version != ?", (version,))
+            self._db.commit()
+        self._version = version
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key, version):
+        """
+        Return the cached entry (dict with 'results' and 'digest'), or None on a miss or expiry
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT stored_at, results FROM responses WHERE key = ? AND version = ?", (key, version)
+                ).fetchone()
+                if row is not None:
+                    entry = {
+                        'stored_at': row[0],
+                        'results': row[1],
+                        'digest': hashlib.sha256(row[1].encode("utf-8")).hexdigest(),
+                    }
+                    self._remember(key, entry)
+            if entry is not None and time.time() - entry['stored_at'] >= self.ttl_seconds:
+                self._entries.pop(key, None)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                record_cache("response", False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache("response", True)
+            return entry
+
+    def put(self, key, version, results):
+        """
+        Store the results (a list of dicts) of a search
+
+        Returns:
+            dict: The new entry, ready for render()
+        """
+        serialized = json.dumps(results)
+        entry = {
+            'stored_at': time.time(),
+            'results': serialized,
+            'digest': hashlib.sha256(serialized.encode("utf-8")).hexdigest(),
+        }
+        with self._lock:
+            self._check_version(version)
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, version, stored_at, results) VALUES (?, ?, ?, ?)",
+                    (key, version, entry['stored_at'], serialized)
+                )
+                self._db.commit()
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    @property
+    def persistent(self):
+        """
+        True when lookups and stores also query the SQLite tier, i.e. block on disk
+        """
+        return self._db is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the process-wide search response cache
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ResponseCache()
+    return _default_cache
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+from embedding_cache import normalize_query
+
+
+def search_key(query, top_k):
+    """
+    Coalescing key for a search: normalized query text plus top_k
+    """
+    return (normalize_query(query), int(top_k))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and get the same result, or the same exception.
+    Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    asyncio variant of SingleFlight.
+
+    The shared call runs as its own task, so one waiter being cancelled (e.g.
+    its client disconnected) does not cancel it for the others; it is only
+    cancelled once every waiter has gone.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        entry = self._calls.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            entry = {'task': task, 'waiters': 0}
+            self._calls[key] = entry
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is entry else None)
+
+        entry['waiters'] += 1
+        try:
+            return await asyncio.shield(entry['task'])
+        except asyncio.CancelledError:
+            if entry['waiters'] == 1 and not entry['task'].done():
+                entry['task'].cancel()
+            raise
+        finally:
+            entry['waiters'] -= 1
+
+    def in_flight(self):
+        return len(self._calls)
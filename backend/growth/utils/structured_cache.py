@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Default location and limits, overridable from the environment
+CACHE_PATH = os.getenv("MCP_STRUCTURED_CACHE_PATH", "./storage/structured_cache.json")
+CACHE_TTL_SECONDS = int(os.getenv("MCP_STRUCTURED_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("MCP_STRUCTURED_CACHE_MAX_ENTRIES", "2000"))
+
+
+def content_hash(text):
+    """
+    Hash the retrieved node text so edits to a description invalidate its entry
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(url, text):
+    """
+    Build the cache key for a retrieved result from its URL and node text
+    """
+    return f"{url}|{content_hash(text)}"
+
+
+class StructuredResultCache:
+    """
+    Persistent LRU cache of structured MCPServer records with a TTL.
+
+    Entries are plain dicts (the output of MCPServer.model_dump()) keyed by
+    server URL plus a hash of the node text. The cache is saved as JSON so
+    it survives restarts of the Flask process.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.path = Path(path) if path else None
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read structured cache at {self.path}: {e}")
+            return
+
+        now = time.time()
+        # Entries are stored oldest first so the LRU order is preserved
+        for key, entry in data.get("entries", []):
+            if now - entry["stored_at"] < self.ttl_seconds:
+                self._entries[key] = entry
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, url, text):
+        """
+        Return the cached record for a result, or None on a miss or expiry
+        """
+        key = cache_key(url, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["stored_at"] >= self.ttl_seconds:
+                del self._entries[key]
+                self._dirty = True
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry["record"])
+
+    def put(self, url, text, record):
+        """
+        Store a structured record for a result
+        """
+        key = cache_key(url, text)
+        with self._lock:
+            self._entries[key] = {"stored_at": time.time(), "record": dict(record)}
+            self._entries.move_to_end(key)
+            self._evict()
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the cache to disk if it changed since the last save
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {"entries": list(self._entries.items())}
+            self._dirty = False
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not write structured cache to {self.path}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_structured_cache():
+    """
+    Return the process-wide structured result cache, creating it on first use
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = StructuredResultCache()
+    return _default_cache
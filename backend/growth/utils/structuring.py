@@ -0,0 +1,187 @@
+import json
+import os
+
+from pydantic import BaseModel, ValidationError
+
+# Output budget per structured server; completions are capped at count * this (plus a little overhead)
+STRUCTURING_TOKENS_PER_SERVER = int(os.getenv("MCP_STRUCTURING_TOKENS_PER_SERVER", "300"))
+STRUCTURING_MAX_TOKENS = int(os.getenv("MCP_STRUCTURING_MAX_TOKENS", "16000"))
+
+
+class MCPServer(BaseModel):
+    url: str
+    description: str
+    what_can_it_do: str
+    why_is_it_useful: str
+
+
+# Shared by the request-time structuring in rag.py and the offline catalog build
+STRUCTURING_SYSTEM_PROMPT = (
+    "You are an AI assistant. Convert the following MCP server descriptions into structured JSON objects. "
+    "Each object should contain a 'url', 'description', 'what_can_it_do', and 'why_is_it_useful'. "
+    "Output a JSON object whose 'servers' key holds the array of objects, one per description."
+)
+
+
+def _strict_object_schema(model):
+    # Structured outputs in strict mode need every property required and no extra properties
+    properties = {
+        name: {key: value for key, value in field.items() if key != "title"}
+        for name, field in model.model_json_schema()["properties"].items()
+    }
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+# response_format constraining a completion to {"servers": [MCPServer, ...]}
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "mcp_servers",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"servers": {"type": "array", "items": _strict_object_schema(MCPServer)}},
+            "required": ["servers"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def structuring_max_tokens(count):
+    """
+    Output token cap for structuring count servers
+    """
+    return min(STRUCTURING_MAX_TOKENS, 50 + count * STRUCTURING_TOKENS_PER_SERVER)
+
+
+def template_record(url, text):
+    """
+    MCPServer fields copied straight out of a description, without an LLM
+
+    Used by the router's template fallback and by offline catalog builds.
+
+    Returns:
+        dict: 'url', 'description', 'what_can_it_do' and 'why_is_it_useful'
+    """
+    text = " ".join(text.split())
+    first_sentence = text.split(". ")[0].rstrip(".") + "."
+    return {
+        'url': url,
+        'description': first_sentence,
+        'what_can_it_do': text,
+        'why_is_it_useful': f"Gives AI agents access to {url.rstrip('/').split('/')[-1]} as a tool.",
+    }
+
+
+def format_results_for_llm(results):
+    """
+    Format raw results as the plain-text input used for structuring prompts
+
+    Args:
+        results (list): List of dicts with 'url' and 'text'
+
+    Returns:
+        str: One URL/Description block per result
+    """
+    return "\n".join([
+        f"URL: {result['url']}\nDescription: {result['text']}"
+        for result in results
+    ])
+
+
+class JsonObjectStreamParser:
+    """
+    Incrementally extracts complete top-level JSON objects from a token stream.
+
+    The LLM answers with {"servers": [...]} or a bare JSON array (possibly in
+    markdown fences); everything before the first '[' is skipped, and each
+    `{...}` element of the array is returned from feed() as soon as its
+    closing brace arrives, so results can be used before the whole
+    completion has finished.
+    """
+
+    def __init__(self):
+        self._in_array = False
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        """
+        Consume the next chunk of text
+
+        Returns:
+            list: Objects (dicts) completed by this chunk
+        """
+        completed = []
+        for char in text:
+            if not self._in_array:
+                # Skip the {"servers": wrapper up to the array it holds
+                self._in_array = char == '['
+                continue
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                # Anything between objects (brackets, commas, fences) is skipped
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        completed.append(json.loads("".join(self._buffer)))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed object in LLM stream: {e}")
+                    self._buffer = []
+        return completed
+
+
+def parse_servers(content):
+    """
+    Validate the servers of a structuring completion one by one
+
+    Args:
+        content (str): Completion text, {"servers": [...]} or a bare JSON array
+
+    Returns:
+        list: MCPServer objects; an invalid object is skipped rather than the whole response
+    """
+    if not content:
+        print("Structuring output is empty")
+        return []
+    try:
+        data = json.loads(content)
+        items = data.get("servers", []) if isinstance(data, dict) else data
+    except json.JSONDecodeError:
+        # A completion cut off at max_tokens still holds every object finished before the cut
+        items = JsonObjectStreamParser().feed(content)
+        print(f"Structuring output was truncated or malformed, recovered {len(items)} objects")
+
+    servers = []
+    for item in items if isinstance(items, list) else []:
+        try:
+            servers.append(MCPServer.model_validate(item))
+        except ValidationError as e:
+            url = item.get("url") if isinstance(item, dict) else None
+            print(f"Skipping invalid structured object for {url}: {e.error_count()} validation errors")
+    return servers
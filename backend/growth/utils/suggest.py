@@ -0,0 +1,180 @@
+import re
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from urllib.parse import urlparse
+
+from catalog import load_csv_rows
+from lexical import GENERIC_NAME_TOKENS, tokenize
+
+DEFAULT_CSV_PATH = Path(__file__).parent.parent / 'source' / 'MCP_description.csv'
+# The frontend's curated server list; optional, skipped when the frontend is not checked out
+DEFAULT_TAGS_PATH = Path(__file__).resolve().parents[3] / 'frontend' / 'lib' / 'data.ts'
+
+# Servers outrank tags, which outrank description keywords
+KIND_WEIGHTS = {'server': 3.0, 'tag': 2.0, 'keyword': 1.0}
+MIN_KEYWORD_LENGTH = 4
+# Most completions one lookup returns
+MAX_SUGGESTIONS = 20
+# Prefixes up to this long match a large share of the keys, so their rankings are computed up front
+PRECOMPUTED_PREFIX_LENGTH = 2
+MIN_KEYWORD_DOCUMENTS = 3
+_STOPWORDS = {
+    "about", "allows", "also", "based", "between", "from", "have", "into", "like", "more",
+    "other", "over", "such", "that", "their", "them", "then", "there", "these", "this", "through",
+    "using", "various", "well", "when", "which", "while", "will", "with", "within", "without", "your",
+}
+
+_TAGS_RE = re.compile(r"tags:\s*\[([^\]]*)\]")
+_NAME_RE = re.compile(r"\bname:\s*\"([^\"]+)\"")
+_QUOTED_RE = re.compile(r"\"([^\"]+)\"")
+
+
+def server_name(url):
+    """
+    Display name of a server from its repository URL, e.g.
+    https://github.com/executeautomation/mcp-playwright -> mcp-playwright
+    """
+    parts = [part for part in urlparse(url).path.split("/") if part]
+    return parts[1] if len(parts) > 1 else (parts[0] if parts else url)
+
+
+def load_frontend_terms(path=DEFAULT_TAGS_PATH):
+    """
+    Read server names and tags from a data.ts-style file
+
+    Returns:
+        tuple: (names, tags), or two empty lists if the file is missing
+    """
+    path = Path(path)
+    if not path.exists():
+        return [], []
+    source = path.read_text(encoding='utf-8')
+    names = _NAME_RE.findall(source)
+    tags = [tag for group in _TAGS_RE.findall(source) for tag in _QUOTED_RE.findall(group)]
+    return names, tags
+
+
+class SuggestIndex:
+    """
+    Prefix completion over server names, tags and description keywords.
+
+    Every completion is stored under its full text and under each of its
+    words, in one sorted list of keys; a lookup bisects to the range of keys
+    with the prefix and ranks every completion in it. Short prefixes have
+    wide ranges, so their top MAX_SUGGESTIONS are ranked once when the index
+    is built.
+    """
+
+    def __init__(self, entries):
+        # entries: list of dicts with 'text', 'kind', 'weight' and optionally 'url'
+        self.entries = entries
+        keyed = []
+        for position, entry in enumerate(entries):
+            # Keys use the same normalisation as queries, so "mcp-s" matches "mcp-server-box"
+            words = tokenize(entry['text'])
+            keys = {" ".join(words)} | set(words)
+            for key in keys:
+                keyed.append((key, position))
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.positions = [position for _, position in keyed]
+        short_prefixes = {key[:length] for key in self.keys for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1)}
+        self.precomputed = {prefix: self._rank(prefix)[:MAX_SUGGESTIONS] for prefix in short_prefixes}
+
+    @classmethod
+    def from_sources(cls, csv_file=DEFAULT_CSV_PATH, tags_path=DEFAULT_TAGS_PATH):
+        """
+        Build the index from the CSV and, when present, the frontend data file
+        """
+        rows = load_csv_rows(csv_file)
+        entries = []
+        seen = set()
+
+        def add(text, kind, weight, url=None):
+            if not text or (kind, text.lower()) in seen:
+                return
+            seen.add((kind, text.lower()))
+            entry = {'text': text, 'kind': kind, 'weight': weight}
+            if url:
+                entry['url'] = url
+            entries.append(entry)
+
+        for row in rows:
+            add(server_name(row['url']), 'server', KIND_WEIGHTS['server'], row['url'])
+
+        names, tags = load_frontend_terms(tags_path)
+        for name in names:
+            add(name, 'server', KIND_WEIGHTS['server'])
+        for tag in tags:
+            add(tag, 'tag', KIND_WEIGHTS['tag'])
+
+        document_frequency = {}
+        for row in rows:
+            for token in set(tokenize(row['text'])):
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        for token, count in document_frequency.items():
+            if (count >= MIN_KEYWORD_DOCUMENTS and len(token) >= MIN_KEYWORD_LENGTH and not token.isdigit()
+                    and token not in _STOPWORDS and token not in GENERIC_NAME_TOKENS):
+                # More common keywords rank higher, but never above a tag
+                add(token, 'keyword', KIND_WEIGHTS['keyword'] + min(count, 100) / 101)
+
+        return cls(entries)
+
+    def _rank(self, prefix):
+        """
+        Positions of every entry with a key starting with prefix, best first
+        """
+        start = bisect_left(self.keys, prefix)
+        # Keys are lowercase ASCII, so this bounds every key that starts with the prefix
+        end = bisect_left(self.keys, prefix + "\uffff", start)
+        matches = {}
+        for offset in range(start, end):
+            key = self.keys[offset]
+            position = self.positions[offset]
+            entry = self.entries[position]
+            # Exact matches first, then by kind and weight, then shorter completions
+            rank = (key == prefix, entry['weight'], -len(entry['text']))
+            if position not in matches or rank > matches[position]:
+                matches[position] = rank
+        return sorted(matches, key=lambda position: matches[position], reverse=True)
+
+    def suggest(self, prefix, limit=8):
+        """
+        Ranked completions for a prefix
+
+        Args:
+            prefix (str): What the user has typed so far
+            limit (int): Number of completions, at most MAX_SUGGESTIONS
+
+        Returns:
+            list: Dicts with 'text', 'kind' and, for CSV servers, 'url'
+        """
+        prefix = " ".join(tokenize(prefix)) if prefix else ""
+        if not prefix:
+            return []
+        limit = max(0, min(limit, MAX_SUGGESTIONS))
+        ranked = self.precomputed.get(prefix)
+        if ranked is None:
+            ranked = self._rank(prefix)
+        ranked = ranked[:limit]
+        return [
+            {field: value for field, value in self.entries[position].items() if field != 'weight'}
+            for position in ranked
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_suggest_index():
+    """
+    Return the process-wide suggestion index, building it on first use
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SuggestIndex.from_sources()
+    return _index
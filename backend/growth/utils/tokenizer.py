@@ -0,0 +1,56 @@
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# Without tiktoken, token counts are estimated from the text length
+TOKENIZER_AVAILABLE = _encoding is not None
+
+
+def estimate_tokens(text):
+    """
+    Count tokens with the embedding model's tokenizer, or approximate 4 characters per token
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def token_windows(text, max_tokens, step=None):
+    """
+    Split text into windows of at most max_tokens tokens, starting step tokens apart
+
+    A token can hold part of a multibyte character, so a cut that falls inside a
+    character is moved back to where the character starts; no window decodes to
+    U+FFFD. Requires tiktoken (see TOKENIZER_AVAILABLE).
+
+    Args:
+        text (str): Text to split
+        max_tokens (int): Token budget per window
+        step (int): Tokens between window starts (default: max_tokens, no overlap)
+
+    Yields:
+        str: Non-empty, stripped windows in order
+    """
+    step = step or max_tokens
+    tokens = _encoding.encode(text, disallowed_special=())
+    data = text.encode("utf-8")
+    # Byte offset at which each token starts, then the end of the text
+    offsets = [0]
+    for token_bytes in _encoding.decode_tokens_bytes(tokens):
+        offsets.append(offsets[-1] + len(token_bytes))
+
+    def boundary(position):
+        offset = offsets[position]
+        while 0 < offset < len(data) and (data[offset] & 0xC0) == 0x80:
+            offset -= 1
+        return offset
+
+    for start in range(0, len(tokens), step):
+        end = min(start + max_tokens, len(tokens))
+        window = data[boundary(start):boundary(end)].decode("utf-8").strip()
+        if window:
+            yield window
+        if end >= len(tokens):
+            break
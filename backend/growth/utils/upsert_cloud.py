@@ -1,5 +1,4 @@
 import os
-import pandas as pd
 from llama_cloud.client import LlamaCloud
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_cloud.types import CloudDocumentCreate, CloudPineconeVectorStore, CloudS3DataSource
@@ -27,6 +26,8 @@ csv_path = 'growth/source/MCP_description.csv'
 
 # Process CSV data into document chunks
 from upsert_mcp_data import process_csv_to_documents
+from catalog import load_csv_rows
+from manifest import cloud_manifest_path, diff_rows, group_documents_by_url, load_manifest, row_hash, save_manifest
 
 documents = process_csv_to_documents(csv_path)
 
@@ -56,15 +57,49 @@ pipeline = {
 
 pipeline = client.pipelines.upsert_pipeline(request=pipeline)
 
-# Add documents to the pipeline
+# Only send rows whose URL or description changed since the last run
+MANIFEST_PATH = cloud_manifest_path(COLLECTION_NAME)
+BATCH_SIZE = 100
+
+by_url = group_documents_by_url(documents)
+current = {row['url']: row_hash(row['url'], row['text']) for row in load_csv_rows(csv_path)}
+
+manifest = load_manifest(MANIFEST_PATH)
+if manifest is None or manifest.get('pipeline_id') != pipeline.id:
+    # Unknown pipeline state: upsert everything (ids are stable, so this is idempotent)
+    previous = {}
+else:
+    previous = manifest['rows']
+
+added, changed, removed = diff_rows(current, previous)
+print(f"{len(added)} rows added, {len(changed)} changed, {len(removed)} removed")
+
+# Add or replace documents in the pipeline
 cloud_documents = [
     CloudDocumentCreate(
+        id=doc.id_,
         text=doc.text,
         metadata=doc.metadata
     )
-    for doc in documents
+    for url in added + changed
+    for doc in by_url.get(url, [])
 ]
 
-client.pipelines.create_batch_pipeline_documents(pipeline.id, request=cloud_documents)
+for start in range(0, len(cloud_documents), BATCH_SIZE):
+    client.pipelines.upsert_batch_pipeline_documents(pipeline.id, request=cloud_documents[start:start + BATCH_SIZE])
+
+# Delete documents of removed rows, and chunks a changed row no longer has
+stale_ids = [doc_id for url in removed for doc_id in previous[url]['doc_ids']]
+for url in changed:
+    new_ids = {doc.id_ for doc in by_url.get(url, [])}
+    stale_ids.extend(doc_id for doc_id in previous[url]['doc_ids'] if doc_id not in new_ids)
+
+for doc_id in stale_ids:
+    client.pipelines.delete_pipeline_document(doc_id, pipeline.id)
+
+rows = {url: entry for url, entry in previous.items() if url not in removed}
+for url in added + changed:
+    rows[url] = {'hash': current[url], 'doc_ids': [doc.id_ for doc in by_url.get(url, [])]}
+save_manifest(MANIFEST_PATH, rows, pipeline_id=pipeline.id)
 
-print("Documents upserted to LlamaCloud pipeline successfully.") 
\ No newline at end of file
+print(f"Upserted {len(cloud_documents)} and deleted {len(stale_ids)} documents in the LlamaCloud pipeline.")
@@ -14,10 +14,23 @@ from llama_index.core import StorageContext
 from llama_index.core.settings import Settings
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.indices.loading import load_index_from_storage
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import MetadataMode, NodeWithScore
 
 # Import functions from claude.py
 sys.path.append(str(Path(__file__).parent))
 from claude import list_llamacloud_indices, create_llamacloud_index, get_index_by_name
+from catalog import CATALOG_PATH, build_catalog
+from embedding_cache import CachedEmbedding, openai_model_key
+from ingest import EmbeddingPipeline, stream_ingest
+from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, iter_token_chunks
+from manifest import MANIFEST_NAME, diff_rows, group_documents_by_url, load_manifest, row_hash, save_manifest
+from catalog import load_csv_rows
+from lexical import build_lexical_index
+from ann import ANN_FILE, ANN_MIN_ROWS, ANN_NPROBE, IVFIndex, _normalize_rows
+from binary_index import new_generation, save_binary_index
+from local_search import OPENAI_EMBEDDING_DIMENSIONS, OPENAI_EMBEDDING_MODEL
+import numpy as np
 
 # Load environment variables
 load_dotenv()
@@ -45,50 +58,60 @@ def list_indices():
     
     return indices
 
-def process_csv_to_documents(csv_file):
+def iter_csv_documents(csv_file, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
     """
-    Process CSV file and convert to LlamaIndex Document objects with improved text processing
+    Lazily read the CSV and yield one LlamaIndex Document per chunk
+    
+    Each description is chunked once into token windows snapped to sentence
+    boundaries. The URL is carried in metadata, which is part of the embedded
+    text, so it is not repeated in the chunk body. Only one row is held in
+    memory at a time.
+    
+    Args:
+        csv_file (str): Path to the CSV file
+        max_tokens (int): Token budget per chunk
+        overlap_tokens (int): Tokens shared between consecutive chunks (0 disables overlap)
+    """
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        
+        for row in reader:
+            text = row.get('Description', '')
+            url = row.get('URL', '')
+            
+            if not text.strip():
+                continue
+            
+            # Create smaller chunks for better semantic matching
+            chunks = list(iter_token_chunks(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens))
+            
+            for i, chunk in enumerate(chunks):
+                yield Document(
+                    # Stable ids let incremental updates replace or delete a row's chunks
+                    id_=f"{url.strip()}#{i}",
+                    text=chunk,
+                    metadata={
+                        "url": url,
+                        "chunk_id": i,
+                        "total_chunks": len(chunks),
+                        "source": "MCP_description.csv"
+                    },
+                    # Only the URL is worth embedding; the rest would just add tokens
+                    excluded_embed_metadata_keys=["chunk_id", "total_chunks", "source"],
+                    excluded_llm_metadata_keys=["chunk_id", "total_chunks", "source"]
+                )
+
+def process_csv_to_documents(csv_file, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
     """
-    documents = []
+    Process CSV file and convert to LlamaIndex Document objects
     
+    Args:
+        csv_file (str): Path to the CSV file
+        max_tokens (int): Token budget per chunk
+        overlap_tokens (int): Tokens shared between consecutive chunks (0 disables overlap)
+    """
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            for row in reader:
-                text = row.get('Description', '')
-                url = row.get('URL', '')
-                
-                if not text.strip():
-                    continue
-                
-                # Create a structured document that preserves the full context
-                # and makes it easier for the embedding model to understand
-                doc_text = f"""
-                Repository: {url}
-                
-                Description:
-                {text}
-                
-                This MCP server provides the following capabilities:
-                {text}
-                """
-                
-                # Create smaller chunks for better semantic matching
-                chunks = chunk_text(doc_text, chunk_size=512, overlap=50)
-                
-                for i, chunk in enumerate(chunks):
-                    doc = Document(
-                        text=chunk,
-                        metadata={
-                            "url": url,
-                            "chunk_id": i,
-                            "total_chunks": len(chunks),
-                            "source": "MCP_description.csv"
-                        }
-                    )
-                    documents.append(doc)
-                
+        documents = list(iter_csv_documents(csv_file, max_tokens, overlap_tokens))
         print(f"Processed {len(documents)} document chunks from {csv_file}")
         return documents
         
@@ -99,67 +122,257 @@ def process_csv_to_documents(csv_file):
         print(f"Error processing CSV file: {e}")
         return []
 
-def chunk_text(text, chunk_size=512, overlap=50):
+def build_structured_catalog(csv_file, output_path=CATALOG_PATH, client=None, batch_size=10, max_workers=4):
+    """
+    Build the structured MCPServer catalog from the CSV so search does not need the LLM
+    
+    Args:
+        csv_file (str): Path to the CSV file
+        output_path (str): Where to write the catalog
+        client: Optional structuring client (defaults to OpenAI)
+        batch_size (int): Rows per LLM call
+        max_workers (int): Number of concurrent LLM calls
+        
+    Returns:
+        dict: The catalog, or None if the CSV could not be read
+    """
+    try:
+        return build_catalog(csv_file, output_path, client=client, batch_size=batch_size, max_workers=max_workers)
+    except FileNotFoundError:
+        print(f"Error: File not found: {csv_file}")
+        return None
+
+def _make_ingest_embed_model():
+    # Configure embedding model - IMPORTANT: Use the same model consistently
+    return OpenAIEmbedding(
+        model=OPENAI_EMBEDDING_MODEL,  # shared with local_search.OpenAIEmbedder, which embeds the queries
+        api_key=OPENAI_API_KEY,
+        dimensions=OPENAI_EMBEDDING_DIMENSIONS,
+        max_retries=0  # rate limits are retried by the pipeline's shared backoff instead
+    )
+
+def embedding_checkpoint_path(index_name):
+    """
+    JSONL checkpoint of the embeddings of an index build in progress
+    """
+    return Path("./storage") / f"{index_name}_embeddings.jsonl"
+
+def embed_documents_to_nodes(documents, embed_model, index_name, embed_fn=None, max_workers=4):
     """
-    Split text into overlapping chunks to improve semantic search
+    Split documents into nodes and embed them through EmbeddingPipeline
+    
+    Chunks are embedded in token-budgeted batches on several threads, with
+    adaptive backoff on rate limits and a checkpoint next to the index so an
+    interrupted build resumes where it stopped.
+    
+    Returns:
+        list: Nodes with their embeddings set
     """
-    words = text.split()
-    chunks = []
-    start = 0
+    # Split documents into nodes with the same transformations from_documents would use
+    nodes = run_transformations(documents, Settings.transformations, show_progress=True)
     
-    while start < len(words):
-        end = start + chunk_size
-        chunk = ' '.join(words[start:end])
-        chunks.append(chunk)
-        start = start + (chunk_size - overlap)
+    pipeline = EmbeddingPipeline(
+        embed_fn or embed_model.get_text_embedding_batch,
+        model_key=f"{embed_model.model_name}:{embed_model.dimensions}" if embed_fn is None
+        else getattr(embed_fn, "__qualname__", type(embed_fn).__name__),
+        checkpoint_path=embedding_checkpoint_path(index_name),
+        max_workers=max_workers
+    )
+    embeddings = pipeline.run([node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes])
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+    return nodes
+
+def csv_manifest_rows(csv_file, doc_ids_by_url):
+    """
+    Manifest rows for the CSV as it is now
     
-    return chunks
+    Args:
+        csv_file (str): Path to the CSV file
+        doc_ids_by_url (dict): url -> ids of the Documents indexed for that row
+        
+    Returns:
+        dict: url -> {'hash': row hash, 'doc_ids': [document ids]}
+    """
+    return {
+        row['url']: {'hash': row_hash(row['url'], row['text']), 'doc_ids': doc_ids_by_url.get(row['url'], [])}
+        for row in load_csv_rows(csv_file)
+    }
 
-def create_and_populate_index(documents, index_name=None):
+def create_and_populate_index(documents, index_name=None, embed_fn=None, max_workers=4, csv_file=None):
     """
     Create a new local index and populate it with documents
     
     Args:
         documents (list): List of Document objects
         index_name (str): Optional name for the index
+        embed_fn: Optional callable embedding a list of texts (defaults to OpenAI)
+        max_workers (int): Number of embedding batches in flight at once
+        csv_file (str): CSV the documents were read from; when given, the manifest
+            is written so the next update_index only touches changed rows
         
     Returns:
         VectorStoreIndex: The created index
     """
-    # Configure embedding model - IMPORTANT: Use the same model consistently
-    embed_model = OpenAIEmbedding(
-        model="text-embedding-3-small",  # or "text-embedding-3-large", but be consistent
-        api_key=OPENAI_API_KEY,
-        dimensions=1536  # explicitly set dimensions for text-embedding-3-small
-    )
+    embed_model = _make_ingest_embed_model()
     
     # Configure settings with the embedding model
     Settings.embed_model = embed_model
     
-    # Create a new index with the documents
-    index = VectorStoreIndex.from_documents(documents)
+    index_name = index_name or "mcp_index"
+    nodes = embed_documents_to_nodes(documents, embed_model, index_name, embed_fn, max_workers)
+    
+    # Nodes that already carry embeddings are stored without calling the embed model again
+    index = VectorStoreIndex(nodes)
     
     print(f"Created new index with {len(documents)} documents")
     
     # Save the index to disk
-    index_path = Path("./storage") / (index_name or "mcp_index")
+    index_path = Path("./storage") / index_name
     index_path.mkdir(parents=True, exist_ok=True)
     
     index.storage_context.persist(persist_dir=str(index_path))
+    export_binary_index(index, index_path, save_ann_index(index, index_path))
+    # The saved index holds the vectors now; the checkpoint was only needed to resume this build
+    embedding_checkpoint_path(index_name).unlink(missing_ok=True)
+    if csv_file is not None:
+        doc_ids = {url: [doc.id_ for doc in docs] for url, docs in group_documents_by_url(documents).items()}
+        save_manifest(index_path / MANIFEST_NAME, csv_manifest_rows(csv_file, doc_ids))
+    print(f"Index saved to {index_path}")
+    
+    return index
+
+def stream_csv_to_index(csv_file, index_name=None, embed_fn=None, batch_size=256, queue_size=4):
+    """
+    Build a local index by streaming CSV rows through chunking, embedding and
+    insertion, for catalogs too large to load as a list of documents
+    
+    Args:
+        csv_file (str): Path to the CSV file
+        index_name (str): Optional name for the index
+        embed_fn: Optional callable embedding a list of texts (defaults to OpenAI)
+        batch_size (int): Maximum chunks per embedding batch
+        queue_size (int): Batches buffered between stages
+        
+    Returns:
+        VectorStoreIndex: The created index
+    """
+    embed_model = _make_ingest_embed_model()
+    Settings.embed_model = embed_model
+    index_name = index_name or "mcp_index"
+    
+    index = VectorStoreIndex([])
+    # Chunk ids per row for the manifest, collected as the rows stream past
+    doc_ids = {}
+    
+    def iter_nodes():
+        for document in iter_csv_documents(csv_file):
+            doc_ids.setdefault(document.metadata['url'].strip(), []).append(document.id_)
+            yield from run_transformations([document], Settings.transformations)
+    
+    def insert(nodes, embeddings):
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        index.insert_nodes(nodes)
+    
+    summary = stream_ingest(
+        iter_nodes(),
+        insert,
+        embed_fn=embed_fn or embed_model.get_text_embedding_batch,
+        text_of=lambda node: node.get_content(metadata_mode=MetadataMode.EMBED),
+        max_batch_items=batch_size,
+        queue_size=queue_size
+    )
+    print(f"Streamed {summary['items']} chunks in {summary['batches']} batches into the index")
+    build_lexical_index(csv_file)
+    
+    index_path = Path("./storage") / index_name
+    index_path.mkdir(parents=True, exist_ok=True)
+    index.storage_context.persist(persist_dir=str(index_path))
+    export_binary_index(index, index_path, save_ann_index(index, index_path))
+    save_manifest(index_path / MANIFEST_NAME, csv_manifest_rows(csv_file, doc_ids))
     print(f"Index saved to {index_path}")
     
     return index
 
+def update_index(csv_file, index_name=None, embed_fn=None, max_workers=4):
+    """
+    Bring the local index in line with the CSV, only touching rows that changed
+    
+    Each row is hashed (URL plus description) and compared with the manifest
+    stored in the index directory. Added and changed rows are re-chunked,
+    re-embedded and inserted; changed and removed rows have their old chunks
+    deleted. Without an index or manifest, the index is built from scratch.
+    
+    Args:
+        csv_file (str): Path to the CSV file
+        index_name (str): Optional name for the index
+        embed_fn: Optional callable embedding a list of texts (defaults to OpenAI)
+        max_workers (int): Number of embedding batches in flight at once
+        
+    Returns:
+        VectorStoreIndex: The up-to-date index, or None if the CSV had no rows
+    """
+    index_name = index_name or "mcp_index"
+    index_path = Path("./storage") / index_name
+    manifest_path = index_path / MANIFEST_NAME
+    
+    documents = process_csv_to_documents(csv_file)
+    if not documents:
+        return None
+    by_url = group_documents_by_url(documents)
+    current = {row['url']: row_hash(row['url'], row['text']) for row in load_csv_rows(csv_file)}
+    # BM25 postings are rebuilt in full; it takes milliseconds
+    build_lexical_index(csv_file)
+    
+    def manifest_rows(urls, rows=None):
+        rows = dict(rows or {})
+        for url in urls:
+            rows[url] = {'hash': current[url], 'doc_ids': [doc.id_ for doc in by_url.get(url, [])]}
+        return rows
+    
+    manifest = load_manifest(manifest_path)
+    if manifest is None or not index_path.exists():
+        print("No manifest found, building the full index")
+        return create_and_populate_index(documents, index_name, embed_fn, max_workers, csv_file)
+    
+    previous = manifest['rows']
+    added, changed, removed = diff_rows(current, previous)
+    print(f"Incremental update: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+    
+    index = load_existing_index(str(index_path))
+    if not (added or changed or removed):
+        return index
+    
+    for url in changed + removed:
+        for doc_id in previous[url]['doc_ids']:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+    
+    new_documents = [doc for url in added + changed for doc in by_url.get(url, [])]
+    if new_documents:
+        embed_model = _make_ingest_embed_model()
+        nodes = embed_documents_to_nodes(new_documents, embed_model, index_name, embed_fn, max_workers)
+        index.insert_nodes(nodes)
+    
+    index.storage_context.persist(persist_dir=str(index_path))
+    export_binary_index(index, index_path, save_ann_index(index, index_path))
+    embedding_checkpoint_path(index_name).unlink(missing_ok=True)
+    
+    rows = {url: entry for url, entry in previous.items() if url not in removed}
+    save_manifest(manifest_path, manifest_rows(added + changed, rows))
+    print(f"Index at {index_path} updated")
+    return index
+
 def load_existing_index(index_path):
     """
     Load an existing index from disk
     """
-    # Configure the same embedding model as used for creation
-    embed_model = OpenAIEmbedding(
-        model="text-embedding-3-small",  # must match the model used for creation
+    # Configure the same embedding model as used for creation; repeated queries are served from cache
+    embed_model = CachedEmbedding(OpenAIEmbedding(
+        model=OPENAI_EMBEDDING_MODEL,  # must match the model used for creation
         api_key=OPENAI_API_KEY,
-        dimensions=1536
-    )
+        dimensions=OPENAI_EMBEDDING_DIMENSIONS
+    ))
     
     # Configure settings with the embedding model
     Settings.embed_model = embed_model
@@ -169,15 +382,116 @@ def load_existing_index(index_path):
     print(f"Loaded existing index from {index_path}")
     return index
 
-def search_index(index, query, top_k=5):
+ANN_NODE_IDS = "ann_node_ids.json"
+
+def save_ann_index(index, index_path, n_lists=None):
     """
-    Enhanced search with better relevance scoring and result grouping
+    Build an IVF index over the vector store's embeddings and save it in the
+    index directory, so large indices are searched without a full scan.
+    Below ANN_MIN_ROWS an exact scan is fast enough and any stale ANN files are removed.
+    """
+    index_path = Path(index_path)
+    embedding_dict = index.vector_store.to_dict().get('embedding_dict', {})
+    if len(embedding_dict) < ANN_MIN_ROWS and not n_lists:
+        for name in (ANN_FILE, ANN_NODE_IDS):
+            (index_path / name).unlink(missing_ok=True)
+        return None
+    
+    node_ids = list(embedding_dict)
+    embeddings = _normalize_rows(np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32))
+    ann = IVFIndex.build(embeddings, n_lists)
+    ann.save(index_path)
+    with open(index_path / ANN_NODE_IDS, 'w', encoding='utf-8') as f:
+        json.dump(node_ids, f)
+    print(f"ANN index with {ann.n_lists} lists over {len(node_ids)} chunks saved to {index_path}")
+    return ann
+
+# Subdirectory of the index holding the memory-mapped copy served by query_only
+BINARY_INDEX_DIR = "binary"
+
+def export_binary_index(index, index_path, ann=None):
     """
-    retriever = index.as_retriever(
-        similarity_top_k=top_k * 2  # Retrieve more results initially for better filtering
+    Export the index's embeddings, chunk texts and metadata into the
+    memory-mapped binary format, so search processes can open it in O(1)
+    instead of parsing the JSON docstore and vector store
+    
+    Args:
+        index (VectorStoreIndex): Index backed by the default SimpleVectorStore
+        index_path (str): The index's storage directory
+        ann (IVFIndex): Optional ANN index over the same rows, saved alongside
+    """
+    binary_path = Path(index_path) / BINARY_INDEX_DIR
+    embedding_dict = index.vector_store.to_dict().get('embedding_dict', {})
+    node_ids = list(embedding_dict)
+    nodes = index.docstore.get_nodes(node_ids)
+    records = (
+        {
+            'url': node.metadata.get('url', ''),
+            'text': node.get_content(),
+            'chunk_id': node.metadata.get('chunk_id', 0),
+            'node_id': node.node_id,
+        }
+        for node in nodes
+    )
+    embeddings = _normalize_rows(np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32).reshape(len(node_ids), -1))
+    # The ANN index is a sidecar of the new generation; without one, the old generation's goes with it
+    generation = new_generation()
+    if ann is not None:
+        ann.save(binary_path, generation)
+    # The name local_search.OpenAIEmbedder gives the same model, so query_only can open it
+    save_binary_index(
+        binary_path, embeddings, records, generation,
+        embedder=openai_model_key(OPENAI_EMBEDDING_MODEL, OPENAI_EMBEDDING_DIMENSIONS)
     )
+    (binary_path / ANN_FILE).unlink(missing_ok=True)
+    print(f"Binary index with {len(node_ids)} chunks exported to {binary_path}")
+
+def load_ann_index(index, index_path):
+    """
+    Load the IVF index saved next to a LlamaIndex index
     
-    results = retriever.retrieve(query)
+    Returns:
+        dict: 'ivf', 'node_ids' and the unit-norm 'embeddings' matrix, or None if there is no ANN index
+    """
+    index_path = Path(index_path)
+    if not (index_path / ANN_NODE_IDS).exists():
+        return None
+    with open(index_path / ANN_NODE_IDS, 'r', encoding='utf-8') as f:
+        node_ids = json.load(f)
+    ivf = IVFIndex.load(index_path, expected_rows=len(node_ids))
+    if ivf is None:
+        return None
+    embedding_dict = index.vector_store.to_dict().get('embedding_dict', {})
+    if set(embedding_dict) != set(node_ids):
+        print(f"Ignoring ANN index at {index_path}: it does not match the vector store")
+        return None
+    embeddings = _normalize_rows(np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32))
+    return {'ivf': ivf, 'node_ids': node_ids, 'embeddings': embeddings}
+
+def _ann_retrieve(index, ann, query, top_k):
+    query_vector = np.asarray(Settings.embed_model.get_query_embedding(query), dtype=np.float32)
+    norm = np.linalg.norm(query_vector)
+    if norm:
+        query_vector = query_vector / norm
+    rows, scores = ann['ivf'].search(ann['embeddings'], query_vector, top_k, ANN_NPROBE)
+    nodes = index.docstore.get_nodes([ann['node_ids'][row] for row in rows])
+    return [NodeWithScore(node=node, score=float(score)) for node, score in zip(nodes, scores)]
+
+def search_index(index, query, top_k=5, ann=None):
+    """
+    Enhanced search with better relevance scoring and result grouping
+    
+    Args:
+        ann (dict): Optional ANN index from load_ann_index; without it every chunk is scanned
+    """
+    if ann is not None:
+        results = _ann_retrieve(index, ann, query, top_k * 2)
+    else:
+        retriever = index.as_retriever(
+            similarity_top_k=top_k * 2  # Retrieve more results initially for better filtering
+        )
+        
+        results = retriever.retrieve(query)
     
     # Group results by URL to avoid duplicate sources
     grouped_results = {}
@@ -203,16 +517,28 @@ def main():
     parser.add_argument('--top-k', type=int, default=5, help='Number of search results to return')
     parser.add_argument('--list-cloud', action='store_true', help='List all available indices in LlamaCloud')
     parser.add_argument('--create', action='store_true', help='Create a new index')
+    parser.add_argument('--update', action='store_true', help='Incrementally update the index from the CSV')
+    parser.add_argument('--stream', action='store_true', help='With --create, stream the CSV instead of loading it in memory')
     parser.add_argument('--name', type=str, help='Name for the new index')
+    parser.add_argument('--build-catalog', action='store_true', help='Build the structured MCPServer catalog from the CSV')
+    parser.add_argument('--catalog-path', type=str, default=CATALOG_PATH, help='Path to the structured catalog file')
+    parser.add_argument('--workers', type=int, default=4, help='Number of concurrent LLM or embedding calls for --build-catalog and --create')
     
     args = parser.parse_args()
     
     if args.list_cloud:
         list_indices()
+    elif args.build_catalog:
+        build_structured_catalog(args.csv_file, args.catalog_path, max_workers=args.workers)
+    elif args.update:
+        update_index(args.csv_file, args.name, max_workers=args.workers)
+    elif args.create and args.stream:
+        stream_csv_to_index(args.csv_file, args.name)
     elif args.create:
         documents = process_csv_to_documents(args.csv_file)
         if documents:
-            create_and_populate_index(documents, args.name)
+            create_and_populate_index(documents, args.name, max_workers=args.workers, csv_file=args.csv_file)
+            build_lexical_index(args.csv_file)
     elif args.search:
         # Load the index if it exists
         index_path = Path(args.index_path)
@@ -222,7 +548,7 @@ def main():
             return
             
         index = load_existing_index(str(index_path))
-        results = search_index(index, args.search, args.top_k)
+        results = search_index(index, args.search, args.top_k, ann=load_ann_index(index, index_path))
         
         print(f"\nFound {len(results)} results for query: {args.search}\n")
         for i, result in enumerate(results, 1):
@@ -235,6 +561,8 @@ def main():
         print("No action specified. Please use one of the following:")
         print("  --list-cloud: List all available indices in LlamaCloud")
         print("  --create: Create a new index")
+        print("  --update: Incrementally update the index from the CSV")
+        print("  --build-catalog: Build the structured MCPServer catalog")
         print("  --search: Search an existing index")
         parser.print_help()
 
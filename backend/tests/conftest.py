@@ -0,0 +1,13 @@
+import os
+import sys
+from pathlib import Path
+
+# The backend modules import each other flat, as app.py and asgi.py arrange it
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.append(str(BACKEND_DIR))
+sys.path.append(str(BACKEND_DIR / 'growth' / 'utils'))
+
+# Offline defaults, read when the modules are first imported
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("MCP_EMBEDDER", "hashing")
+os.environ.setdefault("SEARCH_BACKEND", "local")
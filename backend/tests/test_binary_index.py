@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+
+from binary_index import HEADER_FILE, generation_file, load_binary_index, new_generation, save_binary_index
+
+
+def _records(count):
+    return [{'url': f'https://github.com/owner/repo{row}', 'text': f'chunk {row}'} for row in range(count)]
+
+
+def test_round_trip(tmp_path):
+    embeddings = np.random.default_rng(0).standard_normal((3, 4)).astype(np.float32)
+    generation = save_binary_index(tmp_path, embeddings, _records(3), embedder="hashing-512")
+
+    loaded, records, header = load_binary_index(tmp_path)
+    assert header['generation'] == generation
+    assert header['embedder'] == "hashing-512"
+    np.testing.assert_array_equal(loaded, embeddings)
+    assert list(records) == _records(3)
+    assert records[-1] == _records(3)[-1]
+
+
+def test_new_save_removes_the_old_generation_and_its_sidecars(tmp_path):
+    first = save_binary_index(tmp_path, np.ones((2, 4)), _records(2))
+    (tmp_path / generation_file("ivf.npz", first)).write_bytes(b"old")
+
+    second = new_generation()
+    (tmp_path / generation_file("ivf.npz", second)).write_bytes(b"new")
+    assert save_binary_index(tmp_path, np.zeros((2, 4)), _records(2), second) == second
+
+    names = {path.name for path in tmp_path.iterdir()}
+    assert not any(first in name for name in names)
+    assert generation_file("ivf.npz", second) in names
+    assert json.loads((tmp_path / HEADER_FILE).read_text())['generation'] == second
+
+
+def test_load_retries_when_a_save_replaces_the_files(tmp_path, monkeypatch):
+    save_binary_index(tmp_path, np.ones((2, 4)), _records(2))
+    original_load = np.load
+    calls = []
+
+    def racing_load(path, *args, **kwargs):
+        # The first read finds its generation gone, as if a save published a new one meanwhile
+        if not calls:
+            calls.append(path)
+            save_binary_index(tmp_path, np.zeros((2, 4)), _records(2))
+            raise FileNotFoundError(path)
+        return original_load(path, *args, **kwargs)
+
+    monkeypatch.setattr(np, "load", racing_load)
+    embeddings, _, _ = load_binary_index(tmp_path)
+    assert not embeddings.any()
+
+
+def test_missing_or_mismatched_index_is_ignored(tmp_path):
+    assert load_binary_index(tmp_path) is None
+    save_binary_index(tmp_path, np.ones((2, 4)), _records(2))
+    header = json.loads((tmp_path / HEADER_FILE).read_text())
+    header['rows'] = 5
+    (tmp_path / HEADER_FILE).write_text(json.dumps(header))
+    assert load_binary_index(tmp_path) is None
@@ -0,0 +1,23 @@
+import pytest
+
+from config import MAX_TOP_K, clamp_top_k
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, 2),
+    (5, 5),
+    ("7", 7),
+    (0, 1),
+    (-3, 1),
+    (MAX_TOP_K + 100, MAX_TOP_K),
+    ("abc", None),
+    ("3.5", None),
+    ([3], None),
+    (True, None),
+])
+def test_clamp_top_k(value, expected):
+    assert clamp_top_k(value) == expected
+
+
+def test_clamp_top_k_default():
+    assert clamp_top_k(None, default=4) == 4
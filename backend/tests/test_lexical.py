@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from lexical import LexicalIndex, reciprocal_rank_fusion
+
+ROWS = [
+    {'url': 'https://github.com/stripe/agent-toolkit', 'text': 'Payments, invoices and customers through the Stripe API.'},
+    {'url': 'https://github.com/brave/brave-search-mcp', 'text': 'Web search through the Brave Search API.'},
+    {'url': 'https://github.com/acme/memory-graph', 'text': 'Persistent memory for agents as a knowledge graph.'},
+    {'url': 'https://github.com/acme/postgres', 'text': 'Read-only queries against a postgres database.'},
+]
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex.from_rows(ROWS)
+
+
+def _urls(results):
+    return [result['url'] for result in results]
+
+
+def test_whole_names_and_name_phrases_are_confident(index):
+    assert _urls(index.confident_matches("stripe", 1)) == ['https://github.com/stripe/agent-toolkit']
+    assert _urls(index.confident_matches("postgres mcp", 1)) == ['https://github.com/acme/postgres']
+    assert _urls(index.confident_matches("agent toolkit", 1)) == ['https://github.com/stripe/agent-toolkit']
+
+
+def test_common_words_in_names_are_not_confident(index):
+    assert index.confident_matches("search", 3) is None
+    assert index.confident_matches("memory", 3) is None
+    assert index.confident_matches("toolkit agent", 3) is None
+
+
+def test_bm25_ranks_description_matches(index):
+    assert _urls(index.search("knowledge graph", 2))[0] == 'https://github.com/acme/memory-graph'
+    assert index.search("nothing matches this", 2) == []
+
+
+def test_save_replaces_the_postings_file(tmp_path, index):
+    index.save(tmp_path)
+    first = {path.name for path in tmp_path.glob("postings*.npz")}
+    index.save(tmp_path)
+    second = {path.name for path in tmp_path.glob("postings*.npz")}
+    assert len(first) == len(second) == 1 and first != second
+    assert not list(tmp_path.glob("*.tmp"))
+
+    loaded = LexicalIndex.load(tmp_path)
+    assert loaded.urls == index.urls
+    np.testing.assert_array_equal(loaded.scores("postgres"), index.scores("postgres"))
+
+
+def test_unreadable_index_loads_as_none(tmp_path, index):
+    assert LexicalIndex.load(tmp_path) is None
+    index.save(tmp_path)
+    (tmp_path / "documents.json").write_text('{"urls": [')
+    assert LexicalIndex.load(tmp_path) is None
+
+
+def test_reciprocal_rank_fusion_keeps_the_first_lists_entry():
+    fused = reciprocal_rank_fusion([
+        [{'url': 'a', 'text': 'vector chunk'}, {'url': 'b', 'text': 'b'}],
+        [{'url': 'b', 'text': 'b'}, {'url': 'a', 'text': 'lexical text'}],
+    ], top_k=2)
+    assert {entry['url']: entry['text'] for entry in fused}['a'] == 'vector chunk'
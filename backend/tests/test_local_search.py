@@ -0,0 +1,75 @@
+import csv
+
+import numpy as np
+import pytest
+
+import local_search
+from local_search import HashingEmbedder, LocalVectorEngine, get_local_engine
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['URL', 'Description'])
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def fresh_engine(monkeypatch):
+    monkeypatch.setattr(local_search, "_engine", None)
+    monkeypatch.setattr(local_search, "get_embedder", lambda name=None: HashingEmbedder())
+
+
+def test_saved_engine_is_rebuilt_when_the_csv_changes(tmp_path, monkeypatch, fresh_engine):
+    csv_file = tmp_path / "servers.csv"
+    _write_csv(csv_file, [['https://github.com/a/postgres', 'Query postgres databases.']])
+    engine = get_local_engine(tmp_path / "index", csv_file)
+    assert [record['url'] for record in engine.records] == ['https://github.com/a/postgres']
+
+    monkeypatch.setattr(local_search, "_engine", None)
+    assert get_local_engine(tmp_path / "index", csv_file).source_digest == engine.source_digest
+
+    _write_csv(csv_file, [
+        ['https://github.com/a/postgres', 'Query postgres databases.'],
+        ['https://github.com/b/slack', 'Send slack messages.'],
+    ])
+    monkeypatch.setattr(local_search, "_engine", None)
+    rebuilt = get_local_engine(tmp_path / "index", csv_file)
+    assert {record['url'] for record in rebuilt.records} == {'https://github.com/a/postgres', 'https://github.com/b/slack'}
+    assert LocalVectorEngine.load(tmp_path / "index", HashingEmbedder()).source_digest == rebuilt.source_digest
+
+
+def _engine(rows, seed):
+    records = [{'url': f'https://github.com/owner/repo{row}', 'text': f'chunk {row}', 'chunk_id': 0} for row in range(rows)]
+    return LocalVectorEngine(np.random.default_rng(seed).standard_normal((rows, 8)), records, HashingEmbedder(8))
+
+
+def test_quantized_codes_follow_the_saved_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_search, "VECTOR_STORAGE", "int8")
+    _engine(6, seed=1).save(tmp_path)
+
+    # A float rebuild with the same row count must not leave the old codes behind
+    monkeypatch.setattr(local_search, "VECTOR_STORAGE", "float")
+    rebuilt = _engine(6, seed=2)
+    rebuilt.save(tmp_path)
+    assert not list(tmp_path.glob("codes_int8*"))
+
+    monkeypatch.setattr(local_search, "VECTOR_STORAGE", "int8")
+    loaded = LocalVectorEngine.load(tmp_path, HashingEmbedder(8))
+    decoded = loaded.quantized.codes.astype(np.float32) * loaded.quantized.scales[:, None]
+    np.testing.assert_allclose(decoded, np.asarray(loaded.embeddings), atol=0.02)
+    assert [path.name for path in tmp_path.glob("codes_int8*")] == [f"codes_int8.{loaded.generation}.npy"]
+
+
+def test_ann_index_follows_the_saved_generation(tmp_path):
+    engine = _engine(40, seed=3)
+    engine.build_ann(n_lists=4)
+    engine.save(tmp_path)
+    loaded = LocalVectorEngine.load(tmp_path, HashingEmbedder(8))
+    assert loaded.ann is not None
+    assert [path.name for path in tmp_path.glob("ivf*")] == [f"ivf.{loaded.generation}.npz"]
+
+    # Rebuilt without an ANN index: the old one must not be paired with the new rows
+    _engine(40, seed=4).save(tmp_path)
+    assert not list(tmp_path.glob("ivf*"))
+    assert LocalVectorEngine.load(tmp_path, HashingEmbedder(8)).ann is None
@@ -0,0 +1,39 @@
+from manifest import catalog_digest, diff_rows, load_manifest, row_hash, save_manifest
+
+
+def test_row_hash_ignores_surrounding_whitespace_only():
+    assert row_hash(" https://a ", "text\n") == row_hash("https://a", "text")
+    assert row_hash("https://a", "text") != row_hash("https://a", "text!")
+    assert row_hash("https://a", "b") != row_hash("https://a\nb", "")
+
+
+def test_diff_rows_finds_added_changed_and_removed():
+    previous = {
+        'https://kept': {'hash': row_hash('https://kept', 'same'), 'doc_ids': ['1']},
+        'https://edited': {'hash': row_hash('https://edited', 'old'), 'doc_ids': ['2']},
+        'https://gone': {'hash': row_hash('https://gone', 'x'), 'doc_ids': ['3']},
+    }
+    current = {
+        'https://kept': row_hash('https://kept', 'same'),
+        'https://edited': row_hash('https://edited', 'new'),
+        'https://new': row_hash('https://new', 'y'),
+    }
+    assert diff_rows(current, previous) == (['https://new'], ['https://edited'], ['https://gone'])
+    unchanged = {url: entry['hash'] for url, entry in previous.items()}
+    assert diff_rows(unchanged, previous) == ([], [], [])
+
+
+def test_manifest_round_trip(tmp_path):
+    rows = {'https://a': {'hash': row_hash('https://a', 't'), 'doc_ids': ['d1', 'd2']}}
+    save_manifest(tmp_path / "manifest.json", rows, pipeline_id="p")
+    manifest = load_manifest(tmp_path / "manifest.json")
+    assert manifest['rows'] == rows
+    assert manifest['pipeline_id'] == "p"
+    assert load_manifest(tmp_path / "missing.json") is None
+
+
+def test_catalog_digest_follows_the_rows():
+    rows = [{'url': 'https://a', 'text': 'one'}, {'url': 'https://b', 'text': 'two'}]
+    assert catalog_digest(rows) == catalog_digest([dict(row) for row in rows])
+    assert catalog_digest(rows) != catalog_digest(rows[:1])
+    assert catalog_digest(rows) != catalog_digest([rows[0], {'url': 'https://b', 'text': 'two!'}])
@@ -0,0 +1,39 @@
+from model_router import LLM_CONCURRENCY, STRUCTURING_TIERS, SUMMARY_TIERS, ModelRouter, template_servers
+
+
+def test_idle_router_always_picks_a_model():
+    router = ModelRouter()
+    for count in (1, 5, 20, 100):
+        route = router.route(count, 200 * count)
+        assert route.model == STRUCTURING_TIERS[0]['model'], route.reason
+
+
+def test_router_degrades_only_under_load():
+    router = ModelRouter(latency_budget=10, concurrency=LLM_CONCURRENCY)
+    router.in_flight = 10 * LLM_CONCURRENCY
+    assert router.route(20, 4000).model is None
+    router.in_flight = 0
+    assert router.route(20, 4000).model is not None
+
+
+def test_summary_calls_do_not_move_structuring_rates():
+    router = ModelRouter()
+    model = SUMMARY_TIERS[0]['model']
+    tier = next(tier for tier in STRUCTURING_TIERS if tier['model'] == model)
+    before = router.estimate(tier, 750, 1000)
+    with router.track(model, kind="summary") as call:
+        call['prompt_tokens'], call['output_tokens'] = 1000, 10
+    assert router.estimate(tier, 750, 1000) == before
+    assert router.estimate(tier, 750, 1000, kind="summary") != before
+
+
+def test_template_servers_keep_order(monkeypatch):
+    import model_router
+    monkeypatch.setattr(model_router, "_full_descriptions", lambda results: results)
+    results = [
+        {'url': 'https://github.com/a/one', 'text': 'First server. More text.'},
+        {'url': 'https://github.com/b/two', 'text': 'Second server'},
+    ]
+    servers = template_servers(results)
+    assert [server.url for server in servers] == [result['url'] for result in results]
+    assert servers[0].description == "First server."
@@ -0,0 +1,70 @@
+import json
+
+import response_cache
+from response_cache import ResponseCache, index_version, render, response_key
+
+
+def test_response_key_normalizes_the_query():
+    assert response_key(" Web  Search", 3, "v1") == response_key("web search", 3, "v1")
+    assert response_key("web search", 3, "v1") != response_key("web search", 3, "v2")
+
+
+def test_new_index_version_drops_older_entries():
+    cache = ResponseCache(sqlite_path=None)
+    cache.put("key", "v1", [{'url': 'https://a'}])
+    assert cache.get("key", "v1") is not None
+    assert cache.get("key", "v2") is None
+    assert cache.get("key", "v1") is None
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    cache = ResponseCache(ttl_seconds=10, sqlite_path=None)
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache.put("key", "v1", [])
+    now[0] += 9
+    assert cache.get("key", "v1") is not None
+    now[0] += 1
+    assert cache.get("key", "v1") is None
+
+
+def test_sqlite_tier_survives_restarts_and_is_invalidated(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    ResponseCache(sqlite_path=path).put("key", "v1", [{'url': 'https://a'}])
+
+    restarted = ResponseCache(sqlite_path=path)
+    assert restarted.persistent
+    entry = restarted.get("key", "v1")
+    assert json.loads(entry['results']) == [{'url': 'https://a'}]
+    body, etag = render(entry, "Query")
+    assert json.loads(body) == {'query': "Query", 'results': [{'url': 'https://a'}]}
+    assert etag == render(entry, "Query")[1]
+
+    assert restarted.get("key", "v2") is None
+    assert ResponseCache(sqlite_path=path).get("key", "v1") is None
+
+
+def test_index_version_follows_index_rewrites(tmp_path, monkeypatch):
+    header = tmp_path / "header.json"
+    header.write_text("{}")
+    monkeypatch.setattr(response_cache, "_index_files", lambda: [header, tmp_path / "missing.json"])
+    monkeypatch.setattr(response_cache, "_versions", {})
+    monkeypatch.setattr(response_cache, "INDEX_VERSION_CHECK_SECONDS", 0)
+
+    before = index_version("local")
+    assert index_version("local") == before
+    header.write_text('{"generation": "new"}')
+    assert index_version("local") != before
+    assert index_version("cloud") != index_version("local")
+
+
+def test_index_version_is_reused_between_checks(tmp_path, monkeypatch):
+    header = tmp_path / "header.json"
+    header.write_text("{}")
+    monkeypatch.setattr(response_cache, "_index_files", lambda: [header])
+    monkeypatch.setattr(response_cache, "_versions", {})
+    monkeypatch.setattr(response_cache, "INDEX_VERSION_CHECK_SECONDS", 3600)
+
+    before = index_version("local")
+    header.write_text('{"generation": "new"}')
+    assert index_version("local") == before
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight, search_key
+
+
+def test_search_key_normalizes_the_query():
+    assert search_key("  Web   SEARCH ", "3") == search_key("web search", 3)
+    assert search_key("web search", 3) != search_key("web search", 4)
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        time.sleep(0.1)
+        return value * 2
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow, 21))) for _ in range(5)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [21]
+    assert results == [42] * 5
+    assert flight.in_flight() == 0
+
+
+def test_errors_reach_every_waiter_and_are_not_kept():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.do("key", lambda: "ok") == "ok"
+
+
+def test_async_calls_share_one_task():
+    calls = []
+
+    async def search(query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return query.upper()
+
+    async def main():
+        flight = AsyncSingleFlight()
+        results = await asyncio.gather(*(flight.do("key", search, "mcp") for _ in range(5)))
+        return results, flight.in_flight()
+
+    results, in_flight = asyncio.run(main())
+    assert calls == ["mcp"]
+    assert results == ["MCP"] * 5
+    assert in_flight == 0
+
+
+def test_cancelling_one_waiter_keeps_the_call_for_the_others():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def search():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("key", search))
+        second = asyncio.ensure_future(flight.do("key", search))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ("done", True)
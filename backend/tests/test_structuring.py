@@ -0,0 +1,40 @@
+import json
+
+from structuring import JsonObjectStreamParser, parse_servers
+
+
+def _server(name):
+    return {
+        'url': f'https://github.com/owner/{name}',
+        'description': f'{name} server.',
+        'what_can_it_do': 'Things, with "quotes" and {braces}.',
+        'why_is_it_useful': 'Agents.',
+    }
+
+
+def test_parses_the_servers_wrapper_and_bare_arrays():
+    servers = [_server("one"), _server("two")]
+    assert [server.url for server in parse_servers(json.dumps({'servers': servers}))] == [s['url'] for s in servers]
+    assert len(parse_servers(json.dumps(servers))) == 2
+
+
+def test_recovers_the_objects_finished_before_a_truncation():
+    content = json.dumps({'servers': [_server("one"), _server("two"), _server("three")]})
+    cut = content[:content.index('"three') + 20]
+    assert [server.url for server in parse_servers(cut)] == [_server("one")['url'], _server("two")['url']]
+
+
+def test_skips_invalid_objects_and_empty_output():
+    content = json.dumps({'servers': [_server("one"), {'url': 'https://github.com/owner/bad'}]})
+    assert [server.url for server in parse_servers(content)] == [_server("one")['url']]
+    assert parse_servers("") == []
+    assert parse_servers("not json at all") == []
+
+
+def test_stream_parser_emits_objects_as_they_close():
+    content = "```json\n" + json.dumps({'servers': [_server("one"), _server("two")]}) + "\n```"
+    parser = JsonObjectStreamParser()
+    completed = []
+    for start in range(0, len(content), 7):
+        completed.extend(parser.feed(content[start:start + 7]))
+    assert completed == [_server("one"), _server("two")]
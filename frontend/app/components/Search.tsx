@@ -1,6 +1,6 @@
 'use client';
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Search as SearchIcon, ArrowRight } from "lucide-react";
 import { BentoItem, BentoGridProps, itemsSample } from "@/app/components/ui/bento-grid";
 import { Sparkles } from "lucide-react";
@@ -15,6 +15,19 @@ interface SearchResult {
   why_is_it_useful: string;
 }
 
+interface StreamEvent {
+  event: 'hits' | 'result' | 'done' | 'error';
+  rank?: number;
+  result?: SearchResult;
+  error?: string;
+}
+
+interface Suggestion {
+  text: string;
+  kind: 'server' | 'tag' | 'keyword';
+  url?: string;
+}
+
 interface RecentSearch {
   query: string;
   timestamp: string;
@@ -30,6 +43,36 @@ export default function Search() {
   const [error, setError] = useState('');
   const [isBackendAvailable, setIsBackendAvailable] = useState(true);
   const [summary, setSummary] = useState('');
+  const [suggestions, setSuggestions] = useState<Suggestion[]>([]);
+  const pickedSuggestion = useRef('');
+
+  // Typeahead: cheap prefix lookups while typing, debounced so fast typists send few requests
+  useEffect(() => {
+    const prefix = query.trim();
+    if (prefix.length < 2 || prefix === pickedSuggestion.current) {
+      setSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(
+          `${API_BASE_URL}/suggest?q=${encodeURIComponent(prefix)}&limit=6`,
+          { signal: controller.signal }
+        );
+        if (response.ok) {
+          const data = await response.json();
+          setSuggestions(data.suggestions || []);
+        }
+      } catch (err) {
+        // Aborted by a newer keystroke, or the backend is down; suggestions are optional
+      }
+    }, 120);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query]);
 
   // useEffect(() => {
   //   checkBackendHealth();
@@ -55,12 +98,14 @@ export default function Search() {
       return;
     }
 
+    setSuggestions([]);
     setIsLoading(true);
     setError('');
     setSummary('');
+    setResults([]);
 
     try {
-      const response = await fetch(`${API_BASE_URL}/search`, {
+      const response = await fetch(`${API_BASE_URL}/search/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -71,13 +116,36 @@ export default function Search() {
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json();
         throw new Error(errorData.error || 'Search failed');
       }
 
-      const data = await response.json();
-      setResults(data.results || []);
+      // The backend sends one JSON event per line; render each result as it arrives
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const ranked: { rank: number; result: SearchResult }[] = [];
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const event: StreamEvent = JSON.parse(line);
+          if (event.event === 'result' && event.result) {
+            ranked.push({ rank: event.rank ?? ranked.length, result: event.result });
+            ranked.sort((a, b) => a.rank - b.rank);
+            setResults(ranked.map((item) => item.result));
+          } else if (event.event === 'error') {
+            throw new Error(event.error || 'Search failed');
+          }
+        }
+      }
     } catch (err) {
       console.error('Search error:', err);
       setError(err instanceof Error ? err.message : 'Failed to perform search. Please try again.');
@@ -118,6 +186,38 @@ export default function Search() {
             className="w-full px-5 py-4 pl-12 rounded-lg border border-gray-200 focus:outline-none focus:ring-2 focus:ring-red-500 text-lg"
           />
           <SearchIcon className="absolute left-4 top-1/2 transform -translate-y-1/2 text-gray-400" />
+          {suggestions.length > 0 && !isLoading && (
+            <ul className="absolute z-10 left-0 right-0 top-full mt-1 bg-white border border-gray-200 rounded-lg shadow-sm overflow-hidden">
+              {suggestions.map((suggestion) => (
+                <li key={`${suggestion.kind}:${suggestion.text}`}>
+                  {suggestion.url ? (
+                    <a
+                      href={suggestion.url}
+                      target="_blank"
+                      rel="noopener noreferrer"
+                      className="flex justify-between px-5 py-2 hover:bg-gray-50"
+                    >
+                      <span>{suggestion.text}</span>
+                      <span className="text-xs text-gray-400">{suggestion.kind}</span>
+                    </a>
+                  ) : (
+                    <button
+                      type="button"
+                      onClick={() => {
+                        pickedSuggestion.current = suggestion.text;
+                        setQuery(suggestion.text);
+                        setSuggestions([]);
+                      }}
+                      className="w-full flex justify-between px-5 py-2 text-left hover:bg-gray-50"
+                    >
+                      <span>{suggestion.text}</span>
+                      <span className="text-xs text-gray-400">{suggestion.kind}</span>
+                    </button>
+                  )}
+                </li>
+              ))}
+            </ul>
+          )}
           <button
             type="submit"
             disabled={isLoading}